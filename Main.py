@@ -10,8 +10,13 @@ from __future__ import print_function
 import os
 import sys
 import argparse
-from Project.InvertedIndex import InvertedIndex, PostingList, get_terms_in_bag
-from Project.QueryModule import BoolModule, clean_query, VectorialModule, TreapModule
+from Project.InvertedIndex import InvertedIndex, PostingList, MappedInvertedIndex, build_collection_index, \
+    open_inverted_index, is_index_file, merge_index_files, merge_inverted_indexes, load_mapped_index, CODECS, \
+    CHAMPION_TIER_SIZES
+from Project.QueryModule import BoolModule, clean_query, VectorialModule, TreapModule, WandModule, \
+    MaxScoreModule, ImpactModule
+from Project.QueryCache import QueryCache
+from Project.DynamicPruning import PruningStats
 import pickle as pkl
 import requests, zipfile, io
 from tqdm import tqdm
@@ -25,12 +30,15 @@ class Module:
         self.qm_name = ''
         self.ii = {}  # key: repo, value: ii of the repo
         self.qm = None
+        self.cache = None  # decoded posting lists and built treaps kept across queries
 
     def f_exists(self, path: str):
         return os.path.exists(path) or os.path.exists(os.path.join(os.getcwd(), path))
 
     def run_ii_module(self, inver_index_path: str, collection_path: str,
-                      gen_idx: bool, itype: str, rm_stpw: bool):
+                      gen_idx: bool, itype: str, rm_stpw: bool, jobs: int = 1,
+                      memory_budget: int = None, report_dir: str = None, codec: str = 'vbyte',
+                      binary: bool = False, merged: bool = False, treaps: bool = False):
         if gen_idx:
             printDarkGray('Beginning collection download with URL: http://web.stanford.edu/class/cs276/pa/pa1-data.zip')
             r = requests.get('http://web.stanford.edu/class/cs276/pa/pa1-data.zip', stream=True)
@@ -66,31 +74,30 @@ class Module:
                 except:
                     os.remove(os.path.join(os.getcwd(), inver_index_path))
             os.mkdir(inver_index_path)
-            stpw_mark = 'stp' if rm_stpw else 'nostp'
-            for id_and_bag in get_terms_in_bag(collection_path, do_rm_stpw= rm_stpw, stop_word_threshold=100):
-                repo, doc_id, bag = id_and_bag
-                ii = InvertedIndex()
-                ii.get_inverted_index(doc_id, bag, itype=itype)
-                self.ii[repo] = ii
-                printDarkGray('Inverted index generated for repository %s' % repo)
-
-                with open(
-                        inver_index_path + '/collection.cs276.' + stpw_mark + '.' + itype + '.' + repo + '.ii',
-                        'wb') as f:
-                    pkl.dump(ii, f)
-                printDarkGray('Inverted index %s saved on %s.' % (repo, inver_index_path))
-            else:
-                printDarkGray('Inverted index not saved.')
+            paths = []
+            for repo, path in build_collection_index(collection_path, inver_index_path, itype=itype,
+                                                     rm_stpw=rm_stpw, stop_word_threshold=100, jobs=jobs,
+                                                     memory_budget=memory_budget, report_dir=report_dir,
+                                                     codec=codec, binary=binary, treaps=treaps):
+                printDarkGray('Inverted index %s saved on %s.' % (repo, path))
+                paths.append((repo, path))
+            if merged:
+                path = merge_index_files(paths, inver_index_path, itype=itype, rm_stpw=rm_stpw,
+                                         codec=codec, binary=binary, treaps=treaps)
+                printDarkGray('Merged inverted index saved on %s.' % path)
 
+        if self.f_exists(inver_index_path):
+            for root, _, files in os.walk(inver_index_path, topdown=True):
+                for ii in filter(is_index_file, files):
+                    printDarkGray('Charging inverted index context %s' % ii)
+                    self.ii[ii] = open_inverted_index(os.path.join(root, ii))
+            if merged and len(self.ii) > 1:
+                printDarkGray('Merging %d inverted indexes into a global document id space...' % len(self.ii))
+                shards = [(name, load_mapped_index(ii) if isinstance(ii, MappedInvertedIndex) else ii)
+                          for name, ii in sorted(self.ii.items())]
+                self.ii = {'merged': merge_inverted_indexes(shards)}
         else:
-            if self.f_exists(inver_index_path):
-                for root, _, files in os.walk(inver_index_path, topdown=True):
-                    for ii in files:
-                        printDarkGray('Charging inverted index context %s' % ii[-4])
-                        with open(os.path.join(root, ii), 'rb') as iif:
-                            self.ii[ii] = pkl.load(iif)
-            else:
-                raise FileNotFoundError('Inverted index file not found.')
+            raise FileNotFoundError('Inverted index file not found.')
 
     def run_search_module(self, result_dir: str, nbest: int, collection_path: str):
         if self.qm is None:
@@ -107,6 +114,8 @@ class Module:
             return
 
         cost = 0
+        pruning = PruningStats()  # postings of the sub-collections for the wand/maxscore/impact modules
+        fallbacks = 0  # sub-collections whose champion lists gave less than nbest answers with --approx
         with open(
                 os.path.join(result_dir, self.qm_name + '.' + query_mark +
                             time.strftime(".%H.%M.%S", time.localtime()) + '.out'), 'a+') as resf:
@@ -121,7 +130,7 @@ class Module:
                     if cnt < 10:
                         printSkyBlue(res)
                         if os.path.exists(collection_path):
-                            with open(os.path.join(collection_path, os.path.join(repo[-4], res[2:])), 'r') as doc:
+                            with open(os.path.join(collection_path, res), 'r') as doc:
                                 docline = doc.readline().split(' ')
                                 printDarkBlue(' '.join(docline[:min(len(docline), 50)]) + ' ...')
                                 print()
@@ -131,7 +140,17 @@ class Module:
                     resf.write(res + '\n')
                 end = time.time()
                 cost += end - start
+                if getattr(self.qm, 'stats', None) is not None:
+                    pruning.add(self.qm.stats)
+                fallbacks += getattr(self.qm, 'fallback', False)
         print('Time spent: %.5f s' % cost)
+        if pruning.total:
+            print(pruning)
+        if fallbacks:
+            printPink('Champion lists gave less than %d answers in %d/%d sub-collections, '
+                      'scored on the full posting lists.' % (nbest, fallbacks, len(self.ii)))
+        if self.cache is not None:
+            print(self.cache)
         print('Results saved in \'./%s\'.' % result_dir)
 
     def main(self):
@@ -139,7 +158,7 @@ class Module:
             description=__doc__,
             formatter_class=argparse.RawDescriptionHelpFormatter)
         parser.add_argument('--qm', default=None, type=str, required=True,
-                            help='Choose the search module from: bool/vectorial/treap')
+                            help='Choose the search module from: bool/vectorial/treap/wand/bmw/maxscore/impact')
         parser.add_argument('--rdir', default=None, type=str, required=True,
                             help='Directory name where query results are saved.')
         parser.add_argument('--iidir', default=None, type=str,
@@ -152,8 +171,40 @@ class Module:
                             help='Type of inverted index: doc/freq/pos')
         parser.add_argument('--rmsw', action='store_true',
                             help='True if stop words need to be removed.')
+        parser.add_argument('--jobs', default=1, type=int,
+                            help='Number of worker processes indexing sub-collections in parallel with --gi.')
+        parser.add_argument('--spimi', default=None, type=int,
+                            help='Memory budget in MB of the block-based indexer with --gi. '
+                                 'By default each sub-collection is read in memory at once.')
+        parser.add_argument('--swreport', default=None, type=str,
+                            help='Directory where bar charts of the removed stop words are saved with --gi --rmsw.')
+        parser.add_argument('--codec', default='vbyte', type=str,
+                            help='Codec of the posting lists written with --gi: %s/pickle' % '/'.join(CODECS))
+        parser.add_argument('--binary', action='store_true',
+                            help='True if the index generated with --gi is saved in the memory-mapped binary format.')
+        parser.add_argument('--treaps', action='store_true',
+                            help='True if the index generated with --gi holds the treaps of every term for --qm treap. '
+                                 'By default the treaps of the query terms are built at query time.')
+        parser.add_argument('--merged', action='store_true',
+                            help='True if sub-collections are served as one index with global document ids '
+                                 'and collection-wide statistics. With --gi only the merged index is saved.')
         parser.add_argument('--nbest', default=8000, type=int,
                             help='The maximum number of answers stored for each sub-collection.')
+        parser.add_argument('--approx', action='store_true',
+                            help='True if --qm vectorial only scores the champion lists of the query terms, '
+                                 'unless they give less than --nbest answers. Champion lists hold at most %d '
+                                 'postings a term, use it with a small --nbest.' % sum(CHAMPION_TIER_SIZES))
+        parser.add_argument('--budget', default=None, type=int,
+                            help='Maximum number of postings read by each query with --qm impact.')
+        parser.add_argument('--bitmap', default=None, type=int,
+                            help='Document frequency from which posting lists are evaluated as compressed bitmaps '
+                                 'with --qm bool.')
+        parser.add_argument('--explain', action='store_true',
+                            help='True if --qm bool prints the plan of each query before it is evaluated, '
+                                 'then the postings it touched.')
+        parser.add_argument('--cache-mb', default=64, type=int,
+                            help='Budget in MB of the cache of posting lists, treaps and term statistics read for '
+                                 'the queries, kept across queries. 0 for no cache.')
 
         args = parser.parse_args()
         if args.gi and args.cdir is None:
@@ -163,17 +214,31 @@ class Module:
         else:
             cdir = args.cdir
         if args.qm == 'bool':
-            self.qm = BoolModule('')
+            self.qm = BoolModule('', bitmap_df=args.bitmap, explain=args.explain)
         elif args.qm == 'vectorial':
-            self.qm = VectorialModule('')
+            self.qm = VectorialModule('', approximate=args.approx)
         elif args.qm == 'treap':
             self.qm = TreapModule('')
+        elif args.qm == 'wand':
+            self.qm = WandModule('', block_max=False)
+        elif args.qm == 'bmw':
+            self.qm = WandModule('')
+        elif args.qm == 'maxscore':
+            self.qm = MaxScoreModule('')
+        elif args.qm == 'impact':
+            self.qm = ImpactModule('', budget=args.budget)
         else:
-            raise ValueError('Please give a valid model name: bool/vectorial/treap')
+            raise ValueError('Please give a valid model name: bool/vectorial/treap/wand/bmw/maxscore/impact')
         self.qm_name = args.qm
         iidir = 'Project/Inverted_index_cs276' if args.iidir is None else args.iidir
         printDarkGray('Start loading files... please wait')
-        self.run_ii_module(iidir, cdir, args.gi, args.itype, args.rmsw)
+        memory_budget = None if args.spimi is None else args.spimi * 2 ** 20
+        self.run_ii_module(iidir, cdir, args.gi, args.itype, args.rmsw, args.jobs, memory_budget, args.swreport,
+                           args.codec, args.binary, args.merged, args.treaps)
+        if args.cache_mb > 0:
+            self.cache = QueryCache(args.cache_mb * 2 ** 20)
+            for repo, ii in self.ii.items():
+                ii.attach_cache(self.cache, repo)
         printPink("""
         ╭━━┓ ╭╮        ┏┓
         ┃╭━┛ ╰╯        ┃┃
@@ -0,0 +1,1506 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: Benchmark.py
+@time: 2020/4/20
+@desc: Benchmarks of indexation and query modules on generated corpora.
+"""
+import argparse
+import pickle as pkl
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+from collections import Counter
+from itertools import product
+from math import isclose, log10, sqrt
+from copy import copy, deepcopy
+from typing import Dict, List, Tuple, Set
+from Project.InvertedIndex import InvertedIndex, PositionDeltas, SpimiIndexer, Tokenizer, \
+    build_collection_index, get_terms_in_repo, iter_repo_documents, save_inverted_index, load_inverted_index, \
+    save_binary_index, open_inverted_index, is_index_file
+from Project.Codecs import CODECS
+from Project.QueryModule import VectorialModule, TreapModule, BoolModule, clean_query
+from Restitution_of_article.TopK import TopK
+from Restitution_of_article.Treap import Treap, ArrayTreap, TNode
+from Project.DynamicPruning import wand, maxscore
+from Restitution_of_article.FastQuery import intersection, union, array_intersection, array_union
+from Project.ImpactOrdered import ImpactIndex, score_at_a_time
+from Project.BooleanMerge import intersect, union as merge_union, difference, merge_intersect, skip_intersect, \
+    gallop_intersect, choose_algorithm
+from Project.RoaringBitmap import RoaringBitmap
+from Project.QueryCache import QueryCache
+from nltk.stem import WordNetLemmatizer
+from tt import BooleanExpression
+
+
+def generate_corpus(doc_num: int = 2000, doc_len: int = 300, vocabulary_size: int = 5000,
+                    seed: int = 0) -> Tuple[Dict[int, str], Dict[int, List[str]]]:
+    """
+    Generate a synthetic corpus whose term distribution follows a Zipf law
+    :param doc_num: number of documents
+    :param doc_len: number of tokens per document
+    :param vocabulary_size: number of distinct terms
+    :param seed: random seed, so that runs are comparable
+    :return: doc_id: mapping from doc_id to a fake document url name
+             bag: dictionary of tokens contained in each document
+    """
+    rand = random.Random(seed)
+    vocabulary = ['term%d' % i for i in range(vocabulary_size)]
+    weights = [1 / (rank + 1) for rank in range(vocabulary_size)]
+    doc_id, bag = dict(), dict()
+    for doc in range(1, doc_num + 1):
+        doc_id[doc] = 'synthetic/%d' % doc
+        bag[doc] = rand.choices(vocabulary, weights=weights, k=doc_len)
+    return doc_id, bag
+
+
+def write_collection(collection_dir: str, repo_num: int = 4, doc_num: int = 200, doc_len: int = 300,
+                     vocabulary_size: int = 5000):
+    """
+    Write a generated corpus on disk with the layout of the cs276 collection: one folder per sub-collection
+    :param collection_dir: folder where the collection is written
+    :param repo_num: number of sub-collections
+    :param doc_num: number of documents per sub-collection
+    :param doc_len:
+    :param vocabulary_size:
+    :return:
+    """
+    for repo in range(repo_num):
+        repo_dir = os.path.join(collection_dir, str(repo))
+        os.makedirs(repo_dir, exist_ok=True)
+        _, bag = generate_corpus(doc_num, doc_len, vocabulary_size, seed=repo)
+        for doc, terms in bag.items():
+            with open(os.path.join(repo_dir, 'doc%d.html' % doc), 'w', encoding='utf-8') as docf:
+                for i in range(0, len(terms), 20):
+                    docf.write(' '.join(terms[i:i + 20]) + '\n')
+
+
+class LegacyPostingList(object):
+    """
+    Reference implementation of the former posting list: an unordered set of posting tuples
+    """
+    def __init__(self, df: int = 0):
+        self.df = df
+        self._indexation = set()
+
+    @property
+    def indexation(self):
+        return self._indexation
+
+    @indexation.setter
+    def indexation(self, doc):
+        if doc is not None:
+            if type(doc) in {list, set}:
+                self._indexation.update(doc)
+            else:
+                self._indexation.add(doc)
+
+
+def legacy_build_inverted_index(doc_id: Dict, doc_bag: Dict, itype='freq') -> InvertedIndex:
+    """
+    Reference implementation of the former indexation, which deep-copies the posting list
+    of a term each time a document contains it
+    :param doc_id:
+    :param doc_bag:
+    :param itype:
+    :return:
+    """
+    ii = InvertedIndex()
+    ii.doc_id, ii.D, ii.iitype = doc_id, len(doc_id), itype
+    for doc, terms in doc_bag.items():
+        cnt = Counter(terms)
+        for term in set(terms):
+            posting = LegacyPostingList()
+            if term in ii.keys():
+                posting = deepcopy(ii[term])
+            posting.df += 1
+            if itype == 'doc':
+                posting.indexation = doc
+            elif itype == 'freq':
+                posting.indexation = (doc, cnt[term])
+            else:
+                posting.indexation = (doc, cnt[term],
+                                       PositionDeltas.encode([i for i, t in enumerate(terms) if t == term]))
+            ii[term] = posting
+    return ii
+
+
+def reference_cosine_scores(doc_bag: Dict, query: str) -> Dict[int, float]:
+    """
+    Reference cosine similarity computed from the documents themselves, weights being tf * idf
+    :param doc_bag: key: document id, value: terms of the document
+    :param query: cleaned query
+    :return: key: document id sharing a term with the query, value: score
+    """
+    vectors = {doc: Counter(terms) for doc, terms in doc_bag.items()}
+    df = Counter(term for vector in vectors.values() for term in vector)
+    idf = {term: log10(len(vectors) / n) for term, n in df.items()}
+    vector_q = {term: tf * idf[term] for term, tf in Counter(query.split(' ')).items() if term in idf}
+    norm_q = sqrt(sum(w * w for w in vector_q.values()))
+    scores = dict()
+    for doc, vector in vectors.items():
+        if not any(term in vector for term in vector_q):
+            continue
+        norm_d = sqrt(sum((tf * idf[term]) ** 2 for term, tf in vector.items()))
+        dot = sum(w * vector[term] * idf[term] for term, w in vector_q.items() if term in vector)
+        scores[doc] = dot / (norm_q * norm_d) if norm_q * norm_d else 0.0
+    return scores
+
+
+def legacy_vectorial_scores(ii: InvertedIndex, query: str) -> Dict[int, float]:
+    """
+    Former VectorialModule scoring, computing idf for each posting and document norms on the query terms only
+    :param ii:
+    :param query:
+    :return:
+    """
+    norm_q, norm_d, scores = 0, dict(), dict()
+    for term_q, tf_q in Counter(query.split(' ')).items():
+        if term_q not in ii.keys():
+            continue
+        w_q = tf_q * log10(ii.D / ii[term_q].df)
+        norm_q += w_q * w_q
+        posting = ii[term_q]
+        for doc, tf_d in zip(posting.docs, posting.tfs):
+            w_d = tf_d * log10(ii.D / ii[term_q].df)
+            norm_d[doc] = norm_d.get(doc, 0) + w_d * w_d
+            scores[doc] = scores.get(doc, 0) + w_q * w_d
+    for doc in scores.keys():
+        norm = sqrt(norm_q) * sqrt(norm_d[doc])
+        scores[doc] = scores[doc] / norm if norm else 0.0
+    return scores
+
+
+def generate_queries(query_num: int = 50, vocabulary_size: int = 5000, seed: int = 1) -> List[str]:
+    """
+    Queries of 1 to 5 terms of a generated corpus, frequent and rare terms mixed
+    :param query_num:
+    :param vocabulary_size:
+    :param seed:
+    :return:
+    """
+    rand = random.Random(seed)
+    return [' '.join('term%d' % int(vocabulary_size ** rand.random()) for _ in range(rand.randint(1, 5)))
+            for _ in range(query_num)]
+
+
+def legacy_clean_lemmatize_count(words: List[str]) -> List[str]:
+    """
+    Reference implementation of the former cleaning, which creates a lemmatizer for each line
+    and lemmatizes every token
+    :param words:
+    :return:
+    """
+    lemmatizer = WordNetLemmatizer()
+    lemma_words = []
+    for word in words:
+        if word in {'', '\n', '\t', ' ', ':', '\\', '//', ',', '.', '\'', '\"', '\r', '&'}:
+            continue
+        for symbol in {'\n', '\t', '\r'}:
+            if symbol in word:
+                word = word.replace(symbol, '')
+        lemma_words.append(lemmatizer.lemmatize(word.lower()))
+    return lemma_words
+
+
+def bench_indexing(doc_num: int = 500, doc_len: int = 300, vocabulary_size: int = 5000):
+    """
+    Compare the single-pass indexation with the legacy one on a generated corpus
+    :param doc_num:
+    :param doc_len:
+    :param vocabulary_size:
+    :return:
+    """
+    doc_id, bag = generate_corpus(doc_num, doc_len, vocabulary_size)
+    print('Corpus: %d documents, %d tokens per document, %d terms' % (doc_num, doc_len, vocabulary_size))
+    for itype in ('doc', 'freq', 'pos'):
+        start = time.time()
+        ii = InvertedIndex()
+        ii.get_inverted_index(doc_id, bag, itype=itype)
+        fast = time.time() - start
+        start = time.time()
+        reference = legacy_build_inverted_index(doc_id, bag, itype=itype)
+        legacy = time.time() - start
+        same = ii.keys() == reference.keys() and all(
+            ii[term].df == reference[term].df and ii[term].indexation == reference[term].indexation
+            for term in reference.keys())
+        print('itype = %-4s single-pass %.3f s, legacy %.3f s, speedup x%.1f, same output: %s'
+              % (itype, fast, legacy, legacy / fast, same))
+
+
+def bench_postings(doc_num: int = 2000, iidir: str = None):
+    """
+    Compare memory and pickle load time of the array-backed posting lists with the former set-based ones,
+    on a generated corpus, and on the .ii files of a folder if given (pickled before or after the change)
+    :param doc_num:
+    :param iidir: folder of .ii files
+    :return:
+    """
+    doc_id, bag = generate_corpus(doc_num)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype='freq')
+    legacy = dict()
+    for term, posting in ii.items():
+        legacy[term] = LegacyPostingList(posting.df)
+        legacy[term].indexation = posting.indexation
+    for name, index in (('set-based', legacy), ('array-backed', dict(ii))):
+        dumped = pkl.dumps(index)
+        start = time.time()
+        pkl.loads(dumped)
+        print('%-12s %.1f MB in memory, %.1f MB pickled, loaded in %.3f s'
+              % (name, deep_sizeof(index) / 2 ** 20, len(dumped) / 2 ** 20, time.time() - start))
+    if iidir is not None:
+        for root, _, files in os.walk(iidir):
+            for file in files:
+                start = time.time()
+                with open(os.path.join(root, file), 'rb') as iif:
+                    index = pkl.load(iif)
+                loaded = time.time() - start
+                dumped = pkl.dumps(index)
+                start = time.time()
+                pkl.loads(dumped)
+                print('%s: loaded in %.3f s, %.1f MB in memory, reloaded from the new pickle in %.3f s'
+                      % (file, loaded, deep_sizeof(index) / 2 ** 20, time.time() - start))
+
+
+def bench_codecs(doc_num: int = 2000, itype: str = 'freq'):
+    """
+    Report compression ratio and decoding speed of every posting codec on a generated index
+    :param doc_num:
+    :param itype: freq/pos
+    :return:
+    """
+    doc_id, bag = generate_corpus(doc_num)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype=itype)
+    integer_num = sum(2 * len(posting.docs) + (sum(posting.tfs) if itype == 'pos' else 0) for posting in ii.values())
+    pickled = len(pkl.dumps(dict(ii)))
+    print('%d integers in posting lists, pickled posting lists: %.2f MB' % (integer_num, pickled / 2 ** 20))
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, codec in CODECS.items():
+            encoded = {term: posting.encode(codec) for term, posting in ii.items()}
+            size = sum(len(part) for data in encoded.values() for part in data if part is not None)
+            start = time.time()
+            for data in encoded.values():
+                for part in data:
+                    if part is not None:
+                        codec.decode(part)
+            decoding = time.time() - start
+            path = os.path.join(work_dir, name + '.ii')
+            save_inverted_index(ii, path, codec=name)
+            start = time.time()
+            loaded = load_inverted_index(path)
+            loading = time.time() - start
+            same = all(loaded[term].indexation == posting.indexation for term, posting in ii.items())
+            print('%-5s %.2f MB, %.2f bits/integer, ratio x%.2f vs raw, decoding %.1f M integers/s, '
+                  '.ii file %.2f MB loaded in %.3f s, lossless: %s'
+                  % (name, size / 2 ** 20, 8 * size / integer_num, 4 * integer_num / size,
+                     integer_num / decoding / 1e6, os.path.getsize(path) / 2 ** 20, loading, same))
+
+
+def bench_startup(doc_num: int = 2000, codec: str = 'vbyte'):
+    """
+    Compare the time before the first query can run with pickled indexes and with the memory-mapped binary format
+    :param doc_num:
+    :param codec:
+    :return:
+    """
+    doc_id, bag = generate_corpus(doc_num)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype='freq')
+    query = ['term1', 'term20', 'term300']
+    with tempfile.TemporaryDirectory() as work_dir:
+        paths = {'pickle': os.path.join(work_dir, 'pickle.ii'), codec: os.path.join(work_dir, codec + '.ii')}
+        save_inverted_index(ii, paths['pickle'], codec='pickle')
+        save_inverted_index(ii, paths[codec], codec=codec)
+        paths['binary ' + codec] = save_binary_index(ii, os.path.join(work_dir, 'binary.ii'), codec=codec)[0]
+        for name, path in paths.items():
+            start = time.time()
+            index = open_inverted_index(path)
+            opening = time.time() - start
+            start = time.time()
+            for term in query:
+                index[term]
+            print('%-12s opened in %8.2f ms, first query terms read in %.2f ms'
+                  % (name, 1000 * opening, 1000 * (time.time() - start)))
+            if hasattr(index, 'close'):
+                index.close()
+
+
+def bench_vectorial(doc_num: int = 2000, query_num: int = 50):
+    """
+    Check the vectorial scores against the reference cosine similarity, with the index in memory
+    and saved in each format, and compare the query latency with the former scoring
+    :param doc_num:
+    :param query_num:
+    :return:
+    """
+    doc_id, bag = generate_corpus(doc_num)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype='freq')
+    queries = generate_queries(query_num)
+    module = VectorialModule('')
+    with tempfile.TemporaryDirectory() as work_dir:
+        indexes = {'in memory': ii}
+        save_inverted_index(ii, os.path.join(work_dir, 'vbyte.ii'))
+        indexes['vbyte'] = open_inverted_index(os.path.join(work_dir, 'vbyte.ii'))
+        indexes['binary'] = open_inverted_index(save_binary_index(ii, os.path.join(work_dir, 'binary.ii'))[0])
+        for name, index in indexes.items():
+            error = 0.0
+            for query in queries:
+                module.query = query
+                scores, reference = module.get_scores(index), reference_cosine_scores(bag, query)
+                if scores.keys() != reference.keys():
+                    error = float('inf')
+                    break
+                error = max([error] + [abs(scores[doc] - reference[doc]) for doc in reference])
+            print('%-9s max score error against the reference cosine: %.2e' % (name, error))
+        indexes['binary'].close()
+    start = time.time()
+    for query in queries:
+        legacy_vectorial_scores(ii, query)
+    legacy = time.time() - start
+    start = time.time()
+    for query in queries:
+        module.query = query
+        module.get_scores(ii)
+    stored = time.time() - start
+    print('former scoring %.2f ms/query, index-time norms and idf %.2f ms/query, speedup x%.1f'
+          % (1000 * legacy / query_num, 1000 * stored / query_num, legacy / stored))
+
+
+def bench_topk(doc_num: int = 100000, report_num: int = 10000):
+    """
+    Compare the heap-based top-k selection with the former full sort of the scores,
+    and with the former report of FastQuery sorting its results at each reported document
+    :param doc_num: number of scored documents
+    :param report_num: number of documents reported by a treap query
+    :return:
+    """
+    rand = random.Random(0)
+    scores = {doc: round(rand.random(), 3) for doc in range(1, doc_num + 1)}
+    for k in (10, 100, 1000, 8000):
+        start = time.time()
+        pair = sorted(list(scores.items()), key=(lambda x: x[1]), reverse=True)[:k]
+        sorting = time.time() - start
+        start = time.time()
+        top = TopK(k)
+        for doc, score in scores.items():
+            top.push(doc, score)
+        selected = top.results()
+        selecting = time.time() - start
+        start = time.time()
+        result = list()
+        for doc in range(1, report_num + 1):
+            result.append((doc, scores[doc]))
+            result.sort(key=lambda x: x[1])
+            if len(result) > k:
+                result.pop(0)
+        reporting = time.time() - start
+        start = time.time()
+        top = TopK(k)
+        for doc in range(1, report_num + 1):
+            top.push(doc, scores[doc])
+            top.threshold
+        pushing = time.time() - start
+        print('k = %4d: full sort %.1f ms, heap %.1f ms, same result: %s | '
+              'report by sorting %.1f ms, by heap %.1f ms'
+              % (k, 1000 * sorting, 1000 * selecting, pair == selected, 1000 * reporting, 1000 * pushing))
+
+
+def same_top_k(results: List[Tuple[int, float]], reference: List[Tuple[int, float]],
+               rel_tol: float = 1e-9) -> bool:
+    """
+    Check two top k lists hold the same scores, and the same documents apart from ties with the k-th score.
+    Scores summed in another order may differ in their last bits, they are equal within rel_tol,
+    and so are the ties.
+    :param results: (document id, score) in descending order of score
+    :param reference:
+    :param rel_tol: relative tolerance of math.isclose
+    :return:
+    """
+    if len(results) != len(reference) or \
+            not all(isclose(score, other, rel_tol=rel_tol, abs_tol=rel_tol)
+                    for (_, score), (_, other) in zip(results, reference)):
+        return False
+    last = reference[-1][1] if reference else None
+    return {doc for doc, score in results if not isclose(score, last, rel_tol=rel_tol, abs_tol=rel_tol)} == \
+        {doc for doc, score in reference if not isclose(score, last, rel_tol=rel_tol, abs_tol=rel_tol)}
+
+
+def bench_wand(doc_num: int = 2000, query_num: int = 50):
+    """
+    Compare WAND and Block-Max WAND with the exhaustive VectorialModule scoring:
+    same top k, latency and share of the postings skipped, with the index in memory and memory-mapped
+    :param doc_num:
+    :param query_num:
+    :return:
+    """
+    doc_id, bag = generate_corpus(doc_num)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype='freq')
+    queries = generate_queries(query_num)
+    module = VectorialModule('')
+    with tempfile.TemporaryDirectory() as work_dir:
+        mapped = open_inverted_index(save_binary_index(ii, os.path.join(work_dir, 'binary.ii'))[0])
+        print('block-max metadata read from the binary format: %s'
+              % all(mapped.get_block_max(term) == ii.get_block_max(term) for term in ii.keys()))
+        for k in (10, 100, 1000):
+            references, exhaustive = [], 0.0
+            for query in queries:
+                module.query = query
+                start = time.time()
+                references.append(module.get_descending_scores(module.get_scores(ii), k))
+                exhaustive += time.time() - start
+            print('k = %4d exhaustive      %.2f ms/query' % (k, 1000 * exhaustive / query_num))
+            for name, index, block_max in (('wand', ii, False), ('block-max wand', ii, True),
+                                           ('mapped bmw', mapped, True)):
+                same, spent, skipped, total = True, 0.0, 0, 0
+                for query, reference in zip(queries, references):
+                    start = time.time()
+                    results, stats = wand(index, Counter(query.split(' ')), k, block_max)
+                    spent += time.time() - start
+                    same = same and same_top_k(results, reference)
+                    skipped, total = skipped + stats.skipped, total + stats.total
+                print('k = %4d %-15s %.2f ms/query, %.1f%% postings skipped, same top k: %s'
+                      % (k, name, 1000 * spent / query_num, 100 * skipped / total, same))
+        mapped.close()
+
+
+DEV_QUERY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Queries', 'dev_queries')
+DEV_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Queries', 'dev_output')
+
+
+def read_dev_queries() -> List[str]:
+    """
+    :return: cleaned dev queries
+    """
+    queries = []
+    for file in sorted(os.listdir(DEV_QUERY_DIR)):
+        with open(os.path.join(DEV_QUERY_DIR, file), 'r') as queryf:
+            queries.append(clean_query(queryf.readline().strip()))
+    return queries
+
+
+def idf_tf_top_k(ii: InvertedIndex, vector_q: Dict[str, int], k: int,
+                 conjunctive: bool = False) -> List[Tuple[int, float]]:
+    """
+    Reference top k of the sum of tf_q * idf * tf, the score of FastQuery for distinct query terms
+    :param ii:
+    :param vector_q:
+    :param k:
+    :param conjunctive: bool for if only the documents containing every term are scored
+    :return:
+    """
+    scores = dict()
+    matches = Counter()
+    for term, tf_q in vector_q.items():
+        if term in ii.keys():
+            posting = ii[term]
+            for doc, tf in zip(posting.docs, posting.tfs):
+                scores[doc] = scores.get(doc, 0.0) + tf_q * ii.idf(term) * tf
+                matches[doc] += 1
+    top = TopK(k)
+    for doc in sorted(scores):
+        if not conjunctive or matches[doc] == len(vector_q):
+            top.push(doc, scores[doc])
+    return top.results()
+
+
+def read_dev_ground_truth() -> List[Tuple[str, Set[str]]]:
+    """
+    :return: (cleaned dev query, document url names of its expected output) of the dev queries having an output
+    """
+    truths = []
+    for file in sorted(os.listdir(DEV_OUTPUT_DIR)):
+        with open(os.path.join(DEV_QUERY_DIR, 'query.' + os.path.splitext(file)[0]), 'r') as queryf:
+            query = clean_query(queryf.readline().strip())
+        with open(os.path.join(DEV_OUTPUT_DIR, file), 'r') as outf:
+            truths.append((query, {line.strip() for line in outf if line.strip()}))
+    return truths
+
+
+def bench_champions(doc_num: int = 2000, query_num: int = 50, k: int = 10, iidir: str = None):
+    """
+    Compare the approximate VectorialModule scoring champion lists with the exact one: precision at k
+    against the ground truth, overlap of the results and latency. The ground truth is Queries/dev_output
+    with the .ii files of iidir, the documents containing every query term on a generated corpus.
+    :param doc_num:
+    :param query_num:
+    :param k: number of results of each sub-collection
+    :param iidir: folder of inverted index files
+    :return:
+    """
+    if iidir is None:
+        doc_id, bag = generate_corpus(doc_num)
+        ii = InvertedIndex()
+        ii.get_inverted_index(doc_id, bag, itype='freq')
+        ii.compute_champion_lists()  # as saved with the index
+        indexes = [ii]
+        truths = [(query, {ii.get_doc_url(doc) for doc, terms in bag.items() if set(query.split(' ')) <= set(terms)})
+                  for query in generate_queries(query_num)]
+    else:
+        indexes = [open_inverted_index(os.path.join(iidir, file))
+                   for file in sorted(os.listdir(iidir)) if is_index_file(file)]
+        truths = read_dev_ground_truth()
+    modules = {'exact': VectorialModule(''), 'champions': VectorialModule('', approximate=True)}
+    spent, precision, returned = {name: 0.0 for name in modules}, {name: 0.0 for name in modules}, dict()
+    overlap, fallbacks = 0.0, 0
+    for query, truth in truths:
+        fallback = False
+        for name, module in modules.items():
+            module.query = query
+            start = time.time()
+            returned[name] = []
+            for ii in indexes:
+                returned[name].extend(module.get_result(ii, k))
+                fallback |= module.fallback
+            spent[name] += time.time() - start
+            precision[name] += len(truth.intersection(returned[name])) / len(returned[name]) if returned[name] else 0
+        overlap += len(set(returned['exact']).intersection(returned['champions'])) / len(returned['exact']) \
+            if returned['exact'] else 1
+        fallbacks += fallback
+    for name in modules:
+        print('%-9s precision@%d %.3f, %.2f ms/query' % (name, k, precision[name] / len(truths),
+                                                         1000 * spent[name] / len(truths)))
+    print('champion results shared with the exact ones: %.1f%%, fallback to the full lists on %d/%d queries'
+          % (100 * overlap / len(truths), fallbacks, len(truths)))
+
+
+def bench_maxscore(doc_num: int = 2000, query_num: int = 50, iidir: str = None):
+    """
+    Compare MaxScore union queries with the exhaustive VectorialModule scoring, and with FastQuery.union
+    on the sum of idf * tf, for k = 10 and for the default --nbest. The dev queries run on the .ii files
+    of iidir if given, generated queries on a generated corpus otherwise.
+    FastQuery.union is compared with the reference sum of idf * tf of the distinct query terms, a term
+    repeated in the query counting once in FastQuery; queries failing on a term absent from the index are not timed.
+    :param doc_num:
+    :param query_num:
+    :param iidir: folder of inverted index files
+    :return:
+    """
+    if iidir is None:
+        doc_id, bag = generate_corpus(doc_num)
+        ii = InvertedIndex()
+        ii.get_inverted_index(doc_id, bag, itype='freq')
+        ii.get_max_impact()  # block maxima, as saved with the index
+        indexes, queries = {'generated': ii}, generate_queries(query_num)
+    else:
+        indexes = {file: open_inverted_index(os.path.join(iidir, file))
+                   for file in sorted(os.listdir(iidir)) if is_index_file(file)}
+        queries = read_dev_queries()
+    module, treap_module = VectorialModule(''), TreapModule('')
+    for (name, ii), k in product(indexes.items(), (10, 8000)):
+        spent = {'exhaustive': 0.0, 'maxscore': 0.0, 'fastquery union': 0.0, 'maxscore idf*tf': 0.0}
+        same, same_idf_tf, union_agreements, failures, skipped, total = True, True, 0, 0, 0, 0
+        for query in queries:
+            vector_q = Counter(query.split(' '))
+            module.query = query
+            start = time.time()
+            reference = module.get_descending_scores(module.get_scores(ii), k)
+            spent['exhaustive'] += time.time() - start
+            start = time.time()
+            results, stats = maxscore(ii, vector_q, k)
+            spent['maxscore'] += time.time() - start
+            same = same and same_top_k(results, reference)
+            skipped, total = skipped + stats.skipped, total + stats.total
+            start = time.time()
+            results = maxscore(ii, vector_q, k, normalized=False)[0]
+            spent['maxscore idf*tf'] += time.time() - start
+            reference = idf_tf_top_k(ii, vector_q, k)
+            same_idf_tf = same_idf_tf and same_top_k(results, reference)
+            treap_module.query = 'u ' + ' '.join(vector_q)
+            treap_module.build_treaps(ii)
+            try:
+                start = time.time()
+                union_results = list(union(list(treap_module.treaps), treap_module.treaps, k=k, D=ii.D))
+                spent['fastquery union'] += time.time() - start
+                union_agreements += same_top_k(union_results, idf_tf_top_k(ii, Counter(vector_q.keys()), k))
+            except (IndexError, AttributeError):
+                failures += 1
+        print('%s: %d queries, k = %d' % (name, len(queries), k))
+        for engine, seconds in spent.items():
+            succeeded = len(queries) - failures if engine == 'fastquery union' else len(queries)
+            print('  %-16s %.2f ms/query' % (engine, 1000 * seconds / succeeded if succeeded else 0))
+        print('  maxscore skipped %.1f%% of the postings, same top k as exhaustive: %s'
+              % (100 * skipped / total if total else 0, same))
+        print('  maxscore idf*tf same top k as the reference sum of idf * tf: %s' % same_idf_tf)
+        print('  FastQuery.union: %d queries failed, %d agree with the reference out of %d'
+              % (failures, union_agreements, len(queries) - failures))
+
+
+def bench_impact(doc_num: int = 2000, query_num: int = 50, k: int = 10):
+    """
+    Recall and latency of score-at-a-time evaluation on impact-ordered postings, with early termination
+    and with budgets of postings, against the exact top k of VectorialModule
+    :param doc_num:
+    :param query_num:
+    :param k: number of results
+    :return:
+    """
+    doc_id, bag = generate_corpus(doc_num)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype='freq')
+    queries = generate_queries(query_num)
+    module = VectorialModule('')
+    references, spent = [], 0.0
+    for query in queries:
+        module.query = query
+        start = time.time()
+        references.append({doc for doc, _ in module.get_descending_scores(module.get_scores(ii), k)})
+        spent += time.time() - start
+    print('k = %d, exact VectorialModule %.2f ms/query' % (k, 1000 * spent / query_num))
+    start = time.time()
+    impact_index = ImpactIndex(ii)
+    for term in ii.keys():
+        impact_index.segments(term)
+    print('impact-ordered segments built in %.3f s' % (time.time() - start))
+    for budget in (None, 5000, 2000, 1000, 500, 200):
+        spent, recall, read, total = 0.0, 0.0, 0, 0
+        for query, reference in zip(queries, references):
+            start = time.time()
+            results, stats = score_at_a_time(impact_index, Counter(query.split(' ')), k, budget)
+            spent += time.time() - start
+            recall += len(reference.intersection(doc for doc, _ in results)) / len(reference) if reference else 1
+            read, total = read + stats.scored, total + stats.total
+        print('budget %-5s %.2f ms/query, %5.1f%% of the postings read, recall@%d %.3f'
+              % (budget, 1000 * spent / query_num, 100 * read / total, k, recall / query_num))
+
+
+def legacy_merge_postings_list(bool_operator: str, docs1: List[int], docs2: List[int]) -> List[int]:
+    """
+    Former BoolModule._merge_postings_list on Python lists
+    """
+    if bool_operator == 'and':
+        return [doc for doc in docs1 if doc in docs2]
+    elif bool_operator == 'or':
+        return list(set(docs1 + docs2))
+    return [d for d in docs1 if d not in docs2]
+
+
+def bench_boolean(doc_num: int = 100000, large_num: int = 5000):
+    """
+    Compare the boolean operators on sorted arrays with the former ones on Python lists, sorted into a posting list,
+    for operands of balanced sizes, of skewed sizes, and of balanced sizes over barely overlapping ranges
+    :param doc_num: number of documents, the universe of the document ids
+    :param large_num: size of the longer operand
+    :return:
+    """
+    rand = random.Random(0)
+    cases = [('balanced', 1, 0), ('skewed', 4, 0), ('skewed', 16, 0), ('skewed', 128, 0),
+             ('skewed', 1024, 0), ('clustered', 1, 0.8)]
+    for name, ratio, shift in cases:
+        size = max(1, large_num // ratio)
+        large = array('I', sorted(rand.sample(range(doc_num), large_num)))
+        start = int(shift * doc_num)
+        small = array('I', sorted(rand.sample(range(start, start + doc_num), size)))
+        print('%-9s %6d x %6d (%s):' % (name, large_num, size, choose_algorithm(large, small)), end='')
+        for bool_operator, operator in (('and', intersect), ('or', merge_union), ('not', difference)):
+            begin = time.time()
+            legacy = sorted(legacy_merge_postings_list(bool_operator, list(large), list(small)))
+            legacy_spent = time.time() - begin
+            begin = time.time()
+            result = operator(large, small)
+            spent = time.time() - begin
+            print(' %s %.2f ms -> %.2f ms (x%.1f, same: %s) |'
+                  % (bool_operator, 1000 * legacy_spent, 1000 * spent, legacy_spent / spent if spent else 0,
+                     list(result) == legacy), end='')
+        print()
+    for name, ratio, shift in cases:
+        size = max(1, large_num * 10 // ratio)
+        large = array('I', sorted(rand.sample(range(doc_num), large_num * 10)))
+        start = int(shift * doc_num)
+        small = array('I', sorted(rand.sample(range(start, start + doc_num), size)))
+        spent = []
+        for algorithm in (merge_intersect, skip_intersect, gallop_intersect, intersect):
+            begin = time.time()
+            algorithm(large, small)
+            spent.append(1000 * (time.time() - begin))
+        print('%-9s %6d x %6d: and by merge %.2f ms, skip pointers %.2f ms, galloping %.2f ms, adaptive %.2f ms'
+              % ((name, large_num * 10, size) + tuple(spent)))
+
+
+def bench_bitmaps(doc_num: int = 300000, corpus_doc_num: int = 2000):
+    """
+    Compare memory and per-operator throughput of the compressed bitmaps with the sorted arrays,
+    on posting lists of decreasing density, then the results of BoolModule with and without bitmaps
+    :param doc_num: number of documents, the universe of the document ids
+    :param corpus_doc_num: number of documents of the generated corpus queried by BoolModule
+    :return:
+    """
+    rand = random.Random(0)
+    universe = array('I', range(1, doc_num + 1))
+    lists = {'universe': universe}
+    for density in (0.5, 0.1, 0.01, 0.001):
+        lists['density %g' % density] = array('I', sorted(rand.sample(range(1, doc_num + 1), int(density * doc_num))))
+    runs = set()
+    for _ in range(20):
+        start = rand.randrange(1, doc_num)
+        runs.update(range(start, min(start + rand.randrange(100, 10000), doc_num + 1)))
+    lists['20 runs'] = array('I', sorted(runs))
+    bitmaps = {name: RoaringBitmap.from_docs(docs) for name, docs in lists.items()}
+    for name, docs in lists.items():
+        print('%-13s %6d docs: sorted array %8.1f KB, bitmap %8.1f KB %s'
+              % (name, len(docs), deep_sizeof(docs) / 2 ** 10, deep_sizeof(bitmaps[name]) / 2 ** 10,
+                 dict(Counter(bitmaps[name].container_types()))))
+    names = [name for name in lists if name != 'universe']
+    operators = [('and', intersect, RoaringBitmap.__and__), ('or', merge_union, RoaringBitmap.__or__)]
+    for name1, name2 in product(names, names):
+        if name1 >= name2:
+            continue
+        print('%s, %s:' % (name1, name2), end='')
+        for bool_operator, on_arrays, on_bitmaps in operators:
+            start = time.time()
+            result = on_arrays(lists[name1], lists[name2])
+            array_spent = time.time() - start
+            start = time.time()
+            bitmap = on_bitmaps(bitmaps[name1], bitmaps[name2])
+            bitmap_spent = time.time() - start
+            print(' %s %.2f ms -> %.2f ms (same: %s) |' % (bool_operator, 1000 * array_spent, 1000 * bitmap_spent,
+                                                         bitmap.to_array() == result), end='')
+        print()
+    for name in names:
+        start = time.time()
+        result = difference(universe, lists[name])
+        array_spent = time.time() - start
+        start = time.time()
+        bitmap = bitmaps[name].complement(bitmaps['universe'])
+        bitmap_spent = time.time() - start
+        print('not %-13s %.2f ms -> %.2f ms (same: %s)'
+              % (name, 1000 * array_spent, 1000 * bitmap_spent, bitmap.to_array() == result))
+    doc_id, bag = generate_corpus(corpus_doc_num)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype='doc')
+    terms = sorted(ii.keys(), key=lambda term: -ii[term].df)
+    queries = ['%s and %s' % (terms[0], terms[1]), '%s or %s' % (terms[2], terms[300]),
+               '%s and not %s' % (terms[3], terms[4]), 'not %s' % terms[600],
+               '(%s or %s) and not %s' % (terms[5], terms[700], terms[6])]
+    for bitmap_df in (None, corpus_doc_num // 10):
+        qm = BoolModule('', bitmap_df=bitmap_df)
+        results = []
+        start = time.time()
+        for query in queries:
+            qm.query = query
+            results.append(list(qm.get_result(ii, 10)))
+        print('BoolModule with bitmap_df = %s: %.1f ms, %s results'
+              % (bitmap_df, 1000 * (time.time() - start), [len(result) for result in results]))
+        if bitmap_df is None:
+            reference = results
+        else:
+            print('same results: %s' % (results == reference))
+
+
+def eager_postfix_docs(postfix: List[str], ii: InvertedIndex) -> array:
+    """
+    Former evaluation of BoolModule: postfix tokens left to right, each operator building its result
+    """
+    operands = []
+    for token in postfix:
+        if token == 'and':
+            docs2, docs1 = operands.pop(), operands.pop()
+            operands.append(intersect(docs1, docs2))
+        elif token == 'or':
+            docs2, docs1 = operands.pop(), operands.pop()
+            operands.append(merge_union(docs1, docs2))
+        elif token == 'not':
+            operands.append(difference(array('I', sorted(ii.doc_id)), operands.pop()))
+        else:
+            operands.append(ii[token].docs)
+    return operands[-1]
+
+
+def bench_planner(doc_num: int = 5000, query_num: int = 50):
+    """
+    Compare the planned evaluation of boolean queries, streamed by cursors or operator by operator,
+    with the former left to right evaluation: latency, postings read and touched, same results
+    :param doc_num:
+    :param query_num:
+    :return:
+    """
+    doc_id, bag = generate_corpus(doc_num)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype='doc')
+    terms = sorted(ii.keys(), key=lambda term: -ii[term].df)
+    rand = random.Random(0)
+    shapes = [('frequent and rare', '%s and %s and %s', (terms[:3], terms[:3], terms[2000:])),
+              ('rare or rare and frequent', '(%s or %s) and %s', (terms[1000:], terms[1000:], terms[:3])),
+              ('frequent and not frequent', '%s and %s and not %s', (terms[:10], terms[:10], terms[:10])),
+              ('missing term', '%s and %s and %s', (terms[:3], terms[:3], ['missingterm']))]
+    plans = []
+    for name, pattern, pools in shapes:
+        queries = [pattern % tuple(rand.choice(pool) for pool in pools) for _ in range(query_num)]
+        postfixes = [BooleanExpression(query).postfix_tokens for query in queries]
+        read = sum(len(ii[token]) for postfix in postfixes for token in postfix if token not in {'and', 'or', 'not'})
+        start = time.time()
+        eager = [list(eager_postfix_docs(postfix, ii)) for postfix in postfixes]
+        eager_spent = time.time() - start
+        qm = BoolModule('')
+        ii.doc_id = {doc: doc for doc in doc_id}  # results as document ids
+        start = time.time()
+        streamed, touched = [], 0
+        for query in queries:
+            qm.query = query
+            streamed.append(list(qm.get_result(ii, 10)))
+            touched += qm.plan.touched()
+        streamed_spent = time.time() - start
+        plans.append((queries[-1], qm.plan))
+        first_spent = 0
+        for query in queries:
+            qm.query = query
+            start = time.time()
+            next(iter(qm.get_result(ii, 10)), None)
+            first_spent += time.time() - start
+        ii.doc_id = doc_id
+        print('%-26s left to right %.1f ms (%d postings read), planned %.1f ms (%d postings touched, '
+              'first result after %.2f ms), same results: %s'
+              % (name, 1000 * eager_spent, read, 1000 * streamed_spent, touched,
+                 1000 * first_spent / query_num, eager == streamed))
+    for query, plan in plans:
+        print('plan of \'%s\':' % query)
+        print('\n'.join(plan.explain()))
+
+
+def treap_shape(treap: Treap) -> List[Tuple[int, int]]:
+    """
+    :return: (id, priority) of the nodes in preorder, None for the missing children
+    """
+    shape, nodes = [], [treap.root]
+    while nodes:
+        node = nodes.pop()
+        shape.append(None if node is None else (node.id, node.priority))
+        if node is not None:
+            nodes.extend((node.right, node.left))
+    return shape
+
+
+def bench_treaps(doc_num: int = 2000, term_num: int = 5, k: int = 10):
+    """
+    Compare the linear bulk loading of the treaps of high-df terms with the former inserts one by one
+    in random document order, then FastQuery on treaps bulk loaded at query time and on the treaps of the index
+    :param doc_num:
+    :param term_num: number of the highest-df terms measured
+    :param k: number of results of the queries
+    :return:
+    """
+    doc_id, bag = generate_corpus(doc_num)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype='freq')
+    terms = sorted(ii.keys(), key=lambda term: -ii[term].df)[:term_num]
+    rand = random.Random(0)
+    legacy_spent, bulk_spent = dict(), dict()
+    for term in terms:
+        pairs = list(ii[term].postings())
+        rand.shuffle(pairs)
+        start = time.time()
+        legacy = Treap()
+        for pair in pairs:
+            legacy.insert(pair)
+        legacy_spent[term] = time.time() - start
+        start = time.time()
+        bulk = Treap.from_sorted(ii[term].postings())
+        bulk_spent[term] = time.time() - start
+        print('%-8s df = %5d: inserts %8.1f ms, bulk load %6.2f ms (x%.0f), height %d, same treap: %s'
+              % (term, ii[term].df, 1000 * legacy_spent[term], 1000 * bulk_spent[term],
+                 legacy_spent[term] / bulk_spent[term] if bulk_spent[term] else 0, bulk.height,
+                 treap_shape(legacy) == treap_shape(bulk) and legacy.height == bulk.height))
+    for term1, term2 in zip(terms, terms[1:]):
+        query = [term1, term2]
+        start = time.time()
+        pointers = {term: (ii[term].df, Treap.from_sorted(ii[term].postings())) for term in query}
+        results = fast_query_results(intersection, query, pointers, k, ii.D)
+        pointer_spent = time.time() - start
+        start = time.time()
+        succinct = {term: (ii.df(term), ii.get_treap(term)) for term in query}
+        same = fast_query_results(intersection, query, succinct, k, ii.D) == results
+        succinct_spent = time.time() - start
+        print('query \'%s %s\': %s results, treaps bulk loaded at query time %.1f ms (%.1f ms with inserts), '
+              'treaps of the index %.1f ms, same results: %s'
+              % (term1, term2, 'failed' if results is None else len(results), 1000 * pointer_spent,
+                 1000 * (pointer_spent - bulk_spent[term1] - bulk_spent[term2]
+                         + legacy_spent[term1] + legacy_spent[term2]), 1000 * succinct_spent, same))
+
+
+def fast_query_results(query_function, query: List[str], treaps: Dict, k: int, D: int) -> List[Tuple[int, float]]:
+    """
+    :param query_function: intersection or union of FastQuery
+    :param query:
+    :param treaps: key: term, value: (df, treap)
+    :param k:
+    :param D:
+    :return: results of the query, None if it failed
+    """
+    try:
+        return list(query_function(query, treaps, k, D))
+    except (IndexError, AttributeError):
+        return None
+
+
+def bench_succinct(doc_num: int = 2000, query_num: int = 50):
+    """
+    Compare the memory of the treaps of the index, encoded by encode_treap, with pointer-based treaps,
+    and the latency of FastQuery on pointer-based treaps bulk loaded at query time, on the treaps of an index
+    in memory and on the treaps navigated in a memory-mapped index file
+    :param doc_num:
+    :param query_num:
+    :return:
+    """
+    doc_id, bag = generate_corpus(doc_num)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype='freq')
+    start = time.time()
+    ii.compute_treaps()
+    print('treaps of %d terms encoded in %.2f s' % (len(ii), time.time() - start))
+    for term in sorted(ii.keys(), key=lambda term: -ii[term].df)[:1000:200]:
+        pointer = Treap.from_sorted(ii[term].postings())
+        print('%-8s df = %5d: pointer treap %8d bytes, encoded treap %6d bytes (%.1f bytes per node), '
+              'postings %6d bytes'
+              % (term, ii[term].df, deep_sizeof(pointer), len(ii.treaps[term]),
+                 len(ii.treaps[term]) / ii[term].df, ii[term].docs.itemsize * 2 * ii[term].df))
+    queries = [query.split(' ')[:2] for query in generate_queries(query_num)]
+    queries = [query for query in queries if len(query) == 2 and query[0] != query[1]
+               and query[0] in ii and query[1] in ii]
+    k = ii.D + 1  # every result
+    with tempfile.TemporaryDirectory() as work_dir:
+        mapped = open_inverted_index(save_binary_index(ii, os.path.join(work_dir, 'binary.ii'), treaps=True)[0])
+        print('treaps take %.2f MB of the %.2f MB posting file'
+              % (sum(map(len, ii.treaps.values())) / 2 ** 20,
+                 os.path.getsize(os.path.join(work_dir, 'binary.post')) / 2 ** 20))
+        for query_function in (intersection, union):
+            spent, results, same = Counter(), [], True
+            for query in queries:
+                start = time.time()
+                pointers = {term: (ii[term].df, Treap.from_sorted(ii[term].postings())) for term in query}
+                results.append(fast_query_results(query_function, query, pointers, k, ii.D))
+                spent['pointer'] += time.time() - start
+                for name, index in (('in memory', ii), ('mapped', mapped)):
+                    start = time.time()
+                    succinct = {term: (index.df(term), index.get_treap(term)) for term in query}
+                    same = same and fast_query_results(query_function, query, succinct, k, ii.D) == results[-1]
+                    spent[name] += time.time() - start
+            print('%-12s %d queries: pointer treaps %.1f ms, encoded treaps in memory %.1f ms, '
+                  'memory-mapped %.1f ms, same results: %s'
+                  % (query_function.__name__, len(queries), 1000 * spent['pointer'] / len(queries),
+                     1000 * spent['in memory'] / len(queries), 1000 * spent['mapped'] / len(queries), same))
+        mapped.close()
+
+
+def bench_arraytreap(doc_num: int = 2000, query_num: int = 50, chain_num: int = 5000, k: int = 10):
+    """
+    Compare the memory per node and the speed of ArrayTreap with the object treap: bulk loading,
+    FastQuery on both, checked against the reference sum of idf * tf, then a treap of equal priorities,
+    a chain deeper than the recursion limit
+    :param doc_num:
+    :param query_num:
+    :param chain_num: number of nodes of the chain
+    :param k: number of results of the queries
+    :return:
+    """
+    doc_id, bag = generate_corpus(doc_num)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype='freq')
+    terms = sorted(ii.keys(), key=lambda term: -ii[term].df)[:1000]
+    spent = Counter()
+    objects, arrays = dict(), dict()
+    for term in terms:
+        start = time.time()
+        objects[term] = (ii[term].df, Treap.from_sorted(ii[term].postings()))
+        spent['object'] += time.time() - start
+        start = time.time()
+        arrays[term] = (ii[term].df, ArrayTreap.from_sorted(ii[term].postings()))
+        spent['array'] += time.time() - start
+    node_num = sum(ii[term].df for term in terms)
+    print('%d treaps of %d nodes: object treaps %.1f bytes per node, built in %.1f ms, '
+          'array treaps %.1f bytes per node, built in %.1f ms'
+          % (len(terms), node_num, sum(deep_sizeof(treap) for _, treap in objects.values()) / node_num,
+             1000 * spent['object'], sum(treap.nbytes() for _, treap in arrays.values()) / node_num,
+             1000 * spent['array']))
+    queries = [query.split(' ')[:2] for query in generate_queries(query_num)]
+    queries = [query for query in queries if len(query) == 2 and query[0] != query[1]
+               and query[0] in objects and query[1] in objects]
+    for object_query, array_query in ((intersection, array_intersection), (union, array_union)):
+        spent, same = Counter(), True
+        for query in queries:
+            start = time.time()
+            results = fast_query_results(object_query, query, objects, k, ii.D)
+            spent['object'] += time.time() - start
+            start = time.time()
+            array_results = fast_query_results(array_query, query, arrays, k, ii.D)
+            spent['array'] += time.time() - start
+            same = same and array_results == results and same_top_k(
+                results, idf_tf_top_k(ii, Counter(query), k, conjunctive=object_query is intersection))
+        print('%-12s %d queries: object treaps %.2f ms, array treaps %.2f ms, same results: %s'
+              % (object_query.__name__, len(queries), 1000 * spent['object'] / len(queries),
+                 1000 * spent['array'] / len(queries), same))
+    start = time.time()
+    chain = ArrayTreap.from_sorted((doc, 1) for doc in range(1, chain_num + 1))
+    chain.insert((chain_num + 1, 1))
+    print('chain of %d equal priorities: height %d, get_height %d, bulk load and insert in %.1f ms'
+          % (chain_num + 1, chain.height, chain.get_height(chain.root), 1000 * (time.time() - start)))
+
+
+def legacy_intersection(Q: List[str], treaps: Dict, k: int = 3, D: int = 1000, visited: Counter = None) \
+        -> List[Tuple[int, float]]:
+    """
+    Former FastQuery.intersection, visited['nodes'] counts the moves from a node to another
+    """
+    # init
+    result = TopK(k)
+    stacks = dict(zip(Q, [[TNode((D, D))] for _ in range(len(Q))]))
+    vt = dict(zip(Q, [treaps[t][1].root for t in Q]))
+    U = sum([treaps[t][0] * vt[t].priority for t in Q])
+    d = 1
+    L = result.threshold
+
+    # local functions
+    def id_top_stack_t(t: str) -> int:
+        if stacks[t]:
+            return stacks[t][-1].id
+        else:
+            return D + 1
+
+    def changev(t: str, v: TNode):
+        nonlocal U, vt, D
+        U += log10(D / treaps[t][0]) * (v.priority - vt[t].priority)   # idf * tf
+        if visited is not None and v is not vt[t]:
+            visited['nodes'] += 1
+        vt[t] = v
+
+    def changed(newd: int):
+        nonlocal Q, d
+        d = newd
+        for t in Q:
+            v = vt[t]
+            while d >= id_top_stack_t(t):
+                v = stacks[t].pop(-1)
+            changev(t, v)
+
+    def report(doc: int, s: int):
+        nonlocal L
+        result.push(doc, s)
+        L = result.threshold
+
+    # main loop
+    while d < D:
+        if [] in stacks.values():
+            break
+        while U <= L:
+            changed(min([id_top_stack_t(t) for t in Q]))
+        ident_d = True
+        t = None
+        for term, vt_node in vt.items():
+            if vt_node.id != d:
+                ident_d = False
+                t = term  # choose where to advance
+                break
+        if ident_d:
+            report(d, U)
+            changed(d + 1)
+        else:
+            if d < vt[t].id:
+                lt = vt[t].left
+                if lt is not None:
+                    stacks[t].append(vt[t])
+                    changev(t, lt)
+                else:
+                    changed(vt[t].id)
+            else:
+                rt = vt[t].right
+                if rt is not None:
+                    changev(t, rt)
+                else:
+                    changev(t, stacks[t].pop(-1))
+                    changed(vt[t].id)
+    return result.results()
+
+
+def legacy_union(Q: List[str], treaps: Dict, k: int = 3, D: int = 1000, visited: Counter = None) \
+        -> List[Tuple[int, float]]:
+    """
+    Former FastQuery.union, see legacy_intersection
+    """
+    # init
+    next_Q = copy(Q)
+    result = TopK(k)
+    stacks = dict(zip(next_Q, [[TNode((D, D))] for _ in range(len(next_Q))]))
+    vt = dict(zip(next_Q, [treaps[t][1].root for t in next_Q]))
+    U = 0
+    nextdt = dict(zip(next_Q, [treaps[t][1].search_min_id() for t in next_Q]))
+    d = 1
+    L = result.threshold
+
+    # local functions
+    def id_top_stack_t(t: str) -> int:
+        if stacks[t]:
+            return stacks[t][-1].id
+        else:
+            return D + 1
+
+    def changev(t: str, v: TNode):
+        nonlocal U, vt, d, D
+        if vt[t].id == d:
+            U += log10(D / treaps[t][0]) * vt[t].priority   # idf * tf
+        if visited is not None and v is not vt[t]:
+            visited['nodes'] += 1
+        vt[t] = v
+
+    def changed(newd: int):
+        nonlocal next_Q, d
+        d = newd
+        for t in next_Q:
+            nextdt[t] = max(nextdt[t], newd)
+            v = vt[t]
+            while d >= id_top_stack_t(t):
+                v = stacks[t].pop(-1)
+            changev(t, v)
+
+    def report(doc: int, s: int):
+        nonlocal L
+        result.push(doc, s)
+        L = result.threshold
+
+    # main loop
+    while d < D:
+        for t in next_Q:
+            if not stacks[t]:
+                del stacks[t]
+                del vt[t]
+                del nextdt[t]
+                next_Q.remove(t)
+        if not stacks:
+            break
+        while U <= L:
+            changed(min([id_top_stack_t(t) for t in next_Q]))
+        ident_d = True
+        num_equal = 0
+        t = None
+        for term, vt_node in vt.items():
+            if vt_node.id != d:
+                if nextdt[term] == d:
+                    t = term  # choose where to advance
+                if nextdt[term] <= d:
+                    ident_d = False
+            else:
+                num_equal += 1
+        if ident_d:
+            if num_equal != 0:
+                report(d, U)
+                U = 0
+                changed(d + 1)
+            else:
+                changed(min(nextdt.values()))
+        else:
+            if d < vt[t].id:
+                lt = vt[t].left
+                if lt is not None:
+                    stacks[t].append(vt[t])
+                    changev(t, lt)
+                else:
+                    nextdt[t] = vt[t].id
+            else:
+                rt = vt[t].right
+                if rt is not None:
+                    changev(t, rt)
+                else:
+                    changev(t, stacks[t].pop(-1))
+                    nextdt[t] = vt[t].id
+    return result.results()
+
+
+def bench_fastquery(doc_num: int = 2000, query_num: int = 50, max_terms: int = 8):
+    """
+    Compare the nodes visited per second of FastQuery with its former version for queries of 1 to max_terms terms.
+    Nodes are counted on the former version. Results are checked against the reference sum of idf * tf,
+    which the former version did not give: its intersection scores were offset by a constant
+    and its union lost the score of a term whose node on d was reached from its parent.
+    :param doc_num:
+    :param query_num: number of queries of each length
+    :param max_terms:
+    :return:
+    """
+    doc_id, bag = generate_corpus(doc_num)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype='freq')
+    terms = sorted(ii.keys(), key=lambda term: -ii[term].df)[:1000]
+    treaps = {term: (ii[term].df, Treap.from_sorted(ii[term].postings())) for term in terms}
+    rnd = random.Random(1)
+    k = ii.D + 1  # the former version fails once k results are kept
+    for query_function, legacy_function in ((intersection, legacy_intersection), (union, legacy_union)):
+        for term_num in range(1, max_terms + 1):
+            queries = [rnd.sample(terms, term_num) for _ in range(query_num)]
+            visited, spent, same = Counter(), Counter(), True
+            for query in queries:
+                start = time.time()
+                legacy_function(query, treaps, k, ii.D, visited)
+                spent['legacy'] += time.time() - start
+                start = time.time()
+                results = list(query_function(query, treaps, k, ii.D))
+                spent['new'] += time.time() - start
+                same = same and same_top_k(results, idf_tf_top_k(ii, Counter(query), k,
+                                                                 conjunctive=query_function is intersection))
+            print('%-12s %d terms, %7d nodes per query: former %6.2f M nodes/s, now %6.2f M nodes/s, '
+                  'speedup x%.2f, same results: %s'
+                  % (query_function.__name__, term_num, visited['nodes'] / query_num,
+                     visited['nodes'] / spent['legacy'] / 1e6, visited['nodes'] / spent['new'] / 1e6,
+                     spent['legacy'] / spent['new'], same))
+
+
+def bench_cache(doc_num: int = 2000, query_num: int = 50, stream_num: int = 500):
+    """
+    Replay a stream of repeated queries, the most frequent queries coming back most often,
+    on a memory-mapped index without cache and with caches of decreasing budgets,
+    then get the treaps of the queries from an index saved without them
+    :param doc_num:
+    :param query_num: number of distinct queries
+    :param stream_num: number of queries of the stream
+    :return:
+    """
+    doc_id, bag = generate_corpus(doc_num)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype='freq')
+    queries = generate_queries(query_num)
+    stream = random.Random(1).choices(queries, weights=[1 / rank for rank in range(1, query_num + 1)], k=stream_num)
+    posting_bytes = sum(ii[term].nbytes() for term in set(' '.join(queries).split(' ')) if term in ii)
+    module = VectorialModule('')
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = save_binary_index(ii, os.path.join(work_dir, 'binary.ii'))[0]
+        reference = None
+        for budget in (None, 2 * posting_bytes, posting_bytes // 4):
+            mapped = open_inverted_index(path)
+            cache = None if budget is None else QueryCache(budget)
+            if cache is not None:
+                mapped.attach_cache(cache, 'binary')
+            start = time.time()
+            scores = []
+            for query in stream:
+                module.query = query
+                scores.append(module.get_scores(mapped))
+            spent = time.time() - start
+            reference = scores if reference is None else reference
+            print('%-32s %d queries in %.3f s, same scores: %s'
+                  % ('no cache' if cache is None else 'cache of %.2f MB' % (budget / 2 ** 20), stream_num, spent,
+                     scores == reference))
+            if cache is not None:
+                print('    %s' % cache)
+            mapped.close()
+    treap_module = TreapModule('')
+    for cache in (None, QueryCache()):
+        ii.treaps = None  # as an index saved without its treaps
+        if cache is not None:
+            ii.attach_cache(cache, 'memory')
+        start = time.time()
+        for query in stream:
+            treap_module.query = query
+            treap_module.build_treaps(ii)
+        print('treaps %-25s %d queries in %.3f s' % ('built at every query' if cache is None else 'cached',
+                                                     stream_num, time.time() - start))
+        if cache is not None:
+            print('    %s' % cache)
+
+
+def bench_tokenizer(doc_num: int = 500, doc_len: int = 300, vocabulary_size: int = 5000):
+    """
+    Compare the cached tokenizer with the former per-line cleaning, and the share of tokenization
+    in the indexation of a generated corpus
+    :param doc_num:
+    :param doc_len:
+    :param vocabulary_size:
+    :return:
+    """
+    doc_id, bag = generate_corpus(doc_num, doc_len, vocabulary_size)
+    documents = [[' '.join(terms[i:i + 20]) + '\n' for i in range(0, len(terms), 20)] for terms in bag.values()]
+    start = time.time()
+    legacy_bag = dict()
+    for doc, lines in zip(doc_id, documents):
+        legacy_bag[doc] = []
+        for line in lines:
+            legacy_bag[doc] += legacy_clean_lemmatize_count(line.split(' '))
+    legacy = time.time() - start
+    tokenizer = Tokenizer()
+    start = time.time()
+    cached_bag = {doc: tokenizer.tokenize_document(lines) for doc, lines in zip(doc_id, documents)}
+    cached = time.time() - start
+    start = time.time()
+    InvertedIndex().get_inverted_index(doc_id, cached_bag, itype='freq')
+    indexing = time.time() - start
+    print('per-line lemmatization %.3f s, cached tokenizer %.3f s, speedup x%.1f, same tokens: %s'
+          % (legacy, cached, legacy / cached, legacy_bag == cached_bag))
+    print(tokenizer)
+    print('tokenization takes %.1f%% of tokenization + indexation' % (100 * cached / (cached + indexing)))
+
+
+def bench_pipeline(doc_num: int = 1000):
+    """
+    Run the streaming document pipeline on a generated collection, check its tokens against
+    a line by line reading and report the throughput of each stage
+    :param doc_num: number of documents of the sub-collection
+    :return:
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        write_collection(work_dir, repo_num=1, doc_num=doc_num)
+        start = time.time()
+        line_tokens = dict()
+        for root, _, files in os.walk(os.path.join(work_dir, '0')):
+            for doc, file in enumerate(files, start=1):
+                line_tokens[doc] = []
+                with open(os.path.join(root, file), 'r', encoding='utf-8') as docf:
+                    for line in docf:
+                        line_tokens[doc] += legacy_clean_lemmatize_count(line.split(' '))
+        legacy = time.time() - start
+        start = time.time()
+        stream_tokens = {doc: tokens for doc, _, tokens in iter_repo_documents(work_dir, '0')}
+        streaming = time.time() - start
+        print('line by line %.3f s, streaming pipeline %.3f s, same tokens: %s'
+              % (legacy, streaming, line_tokens == stream_tokens))
+
+
+def deep_sizeof(obj, seen: set = None) -> int:
+    """
+    Approximate memory footprint of an object and everything it references
+    :param obj:
+    :param seen: ids of objects already counted
+    :return: size in bytes
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    if hasattr(obj, '__dict__'):
+        size += deep_sizeof(vars(obj), seen)
+    for slot in getattr(type(obj), '__slots__', ()):
+        if hasattr(obj, slot):
+            size += deep_sizeof(getattr(obj, slot), seen)
+    return size
+
+
+def bench_positional(doc_num: int = 500, doc_len: int = 2000, vocabulary_size: int = 5000):
+    """
+    Compare build time and memory of the positional index with the frequency index on long documents
+    :param doc_num:
+    :param doc_len:
+    :param vocabulary_size:
+    :return:
+    """
+    doc_id, bag = generate_corpus(doc_num, doc_len, vocabulary_size)
+    print('Corpus: %d documents, %d tokens per document, %d terms' % (doc_num, doc_len, vocabulary_size))
+    sizes = dict()
+    for itype in ('freq', 'pos'):
+        start = time.time()
+        ii = InvertedIndex()
+        ii.get_inverted_index(doc_id, bag, itype=itype)
+        sizes[itype] = deep_sizeof(ii)
+        print('itype = %-4s built in %.3f s, %.1f MB' % (itype, time.time() - start, sizes[itype] / 2 ** 20))
+    print('pos / freq size ratio: %.2f' % (sizes['pos'] / sizes['freq']))
+
+
+def bench_parallel(repo_num: int = 8, doc_num: int = 300, max_jobs: int = None):
+    """
+    Measure the scaling of collection indexation with the number of worker processes,
+    and check that every worker count writes the same files as the serial path
+    :param repo_num: number of generated sub-collections
+    :param doc_num: number of documents per sub-collection
+    :param max_jobs: largest number of workers tried, default to the number of cores
+    :return:
+    """
+    max_jobs = max_jobs if max_jobs is not None else (os.cpu_count() or 1)
+    with tempfile.TemporaryDirectory() as work_dir:
+        collection_dir = os.path.join(work_dir, 'collection')
+        write_collection(collection_dir, repo_num, doc_num)
+        reference, serial_time = None, None
+        jobs = 1
+        while jobs <= max_jobs:
+            index_dir = os.path.join(work_dir, 'index.%d' % jobs)
+            os.mkdir(index_dir)
+            start = time.time()
+            digests = dict()
+            for repo, path in build_collection_index(collection_dir, index_dir, itype='freq', jobs=jobs):
+                with open(path, 'rb') as f:
+                    digests[repo] = hashlib.sha1(f.read()).hexdigest()
+            spent = time.time() - start
+            reference = digests if reference is None else reference
+            serial_time = spent if serial_time is None else serial_time
+            print('jobs = %2d: %.3f s, speedup x%.2f, identical to serial: %s'
+                  % (jobs, spent, serial_time / spent, digests == reference))
+            jobs *= 2
+
+
+def bench_spimi(doc_num: int = 1000, memory_budget: int = 2 * 2 ** 20):
+    """
+    Compare peak memory and content of the block-based indexer with the in-memory bag on a generated collection
+    :param doc_num: number of documents of the sub-collection
+    :param memory_budget: bytes of postings held in memory by the block-based indexer
+    :return:
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        collection_dir = os.path.join(work_dir, 'collection')
+        write_collection(collection_dir, repo_num=1, doc_num=doc_num)
+        results = dict()
+        for name in ('bag', 'spimi'):
+            tracemalloc.start()
+            start = time.time()
+            if name == 'bag':
+                _, doc_id, bag, _ = get_terms_in_repo(collection_dir, '0', do_rm_stpw=False)
+                ii = InvertedIndex()
+                ii.get_inverted_index(doc_id, bag, itype='freq')
+                del bag
+            else:
+                indexer = SpimiIndexer(itype='freq', memory_budget=memory_budget, tmp_dir=work_dir)
+                ii = indexer.index_repository(collection_dir, '0')
+            spent = time.time() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[name] = ii
+            print('%-5s %.3f s, peak memory %.1f MB' % (name, spent, peak / 2 ** 20))
+        same = results['bag'].keys() == results['spimi'].keys() and all(
+            results['bag'][term].indexation == results['spimi'][term].indexation for term in results['bag'].keys())
+        print('same inverted index: %s' % same)
+
+
+# key: name given to --bench, value: function of the parsed arguments running the benchmark
+BENCHMARKS = {
+    'indexing': lambda args: bench_indexing(doc_num=args.docs),
+    'positional': lambda args: bench_positional(doc_num=args.docs),
+    'parallel': lambda args: bench_parallel(doc_num=args.docs),
+    'spimi': lambda args: bench_spimi(doc_num=args.docs),
+    'tokenizer': lambda args: bench_tokenizer(doc_num=args.docs),
+    'pipeline': lambda args: bench_pipeline(doc_num=args.docs),
+    'postings': lambda args: bench_postings(doc_num=args.docs, iidir=args.iidir),
+    'codecs': lambda args: [bench_codecs(doc_num=args.docs, itype=itype) for itype in ('freq', 'pos')],
+    'startup': lambda args: bench_startup(doc_num=args.docs),
+    'vectorial': lambda args: bench_vectorial(doc_num=args.docs),
+    'topk': lambda args: bench_topk(),
+    'wand': lambda args: bench_wand(doc_num=args.docs),
+    'maxscore': lambda args: bench_maxscore(doc_num=args.docs, iidir=args.iidir),
+    'impact': lambda args: bench_impact(doc_num=args.docs),
+    'champions': lambda args: bench_champions(doc_num=args.docs, iidir=args.iidir),
+    'boolean': lambda args: bench_boolean(),
+    'bitmaps': lambda args: bench_bitmaps(),
+    'planner': lambda args: bench_planner(doc_num=args.docs),
+    'treaps': lambda args: bench_treaps(doc_num=args.docs),
+    'succinct': lambda args: bench_succinct(doc_num=args.docs),
+    'arraytreap': lambda args: bench_arraytreap(doc_num=args.docs),
+    'fastquery': lambda args: bench_fastquery(doc_num=args.docs),
+    'cache': lambda args: bench_cache(doc_num=args.docs),
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of ProjetFRIWeb.')
+    parser.add_argument('--bench', default='indexing', type=str,
+                        help='Benchmark to run: %s' % '/'.join(BENCHMARKS))
+    parser.add_argument('--docs', default=500, type=int, help='Number of generated documents.')
+    parser.add_argument('--iidir', default=None, type=str, help='Folder of .ii files measured with real data.')
+    args = parser.parse_args()
+    if args.bench not in BENCHMARKS:
+        raise ValueError('Please give a valid benchmark name: %s' % '/'.join(BENCHMARKS))
+    BENCHMARKS[args.bench](args)
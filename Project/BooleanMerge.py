@@ -0,0 +1,220 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: BooleanMerge.py
+@time: 2020/5/2
+@desc: Boolean operators on posting lists, as arrays of document ids in ascending order.
+       Lists of similar sizes are merged linearly, following skip pointers when their document id ranges
+       barely overlap, and the shorter list is searched in the longer one by galloping (Bentley and Yao 1976)
+       when their sizes are very different.
+"""
+from array import array
+from bisect import bisect_left
+from math import isqrt
+
+# Size ratio between the longer and the shorter operand from which galloping search is used,
+# and share of the document id span of the operands they have in common under which skip pointers are followed
+GALLOP_RATIO = 8
+SKIP_OVERLAP = 0.33
+
+
+def gallop(docs: array, doc: int, lo: int = 0) -> int:
+    """
+    Exponential search: probe docs at lo + 1, 2, 4, ... until doc is passed, then bisect the last step.
+    Costs O(log d) where d is the distance moved, instead of O(log len(docs))
+    :param docs: document ids in ascending order
+    :param doc:
+    :param lo: index from which doc is searched
+    :return: index of the first document id larger or equal to doc, len(docs) if there is none
+    """
+    step = 1
+    while lo + step < len(docs) and docs[lo + step] < doc:
+        step *= 2
+    return bisect_left(docs, doc, lo + step // 2, min(lo + step, len(docs)))
+
+
+def choose_algorithm(docs1: array, docs2: array) -> str:
+    """
+    :param docs1: document ids in ascending order
+    :param docs2: document ids in ascending order
+    :return: 'gallop' if the size ratio of the operands reaches GALLOP_RATIO,
+             'skip' if their document id ranges overlap on less than SKIP_OVERLAP of their span, 'merge' otherwise
+    """
+    if not docs1 or not docs2:
+        return 'merge'
+    if max(len(docs1), len(docs2)) >= GALLOP_RATIO * min(len(docs1), len(docs2)):
+        return 'gallop'
+    overlap = min(docs1[-1], docs2[-1]) - max(docs1[0], docs2[0])
+    span = max(docs1[-1], docs2[-1]) - min(docs1[0], docs2[0])
+    if overlap < SKIP_OVERLAP * span:
+        return 'skip'
+    return 'merge'
+
+
+def merge_intersect(docs1: array, docs2: array) -> array:
+    result = array(docs1.typecode)
+    i, j = 0, 0
+    len1, len2 = len(docs1), len(docs2)
+    while i < len1 and j < len2:
+        doc1, doc2 = docs1[i], docs2[j]
+        if doc1 == doc2:
+            result.append(doc1)
+            i += 1
+            j += 1
+        elif doc1 < doc2:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def skip_intersect(docs1: array, docs2: array) -> array:
+    """
+    Linear merge following implicit skip pointers every sqrt(n) postings of each list:
+    a skip is taken when the posting it points to does not pass the current document of the other list
+    """
+    result = array(docs1.typecode)
+    i, j = 0, 0
+    len1, len2 = len(docs1), len(docs2)
+    skip1, skip2 = isqrt(len1) or 1, isqrt(len2) or 1
+    while i < len1 and j < len2:
+        doc1, doc2 = docs1[i], docs2[j]
+        if doc1 == doc2:
+            result.append(doc1)
+            i += 1
+            j += 1
+        elif doc1 < doc2:
+            i = i + skip1 if i + skip1 < len1 and docs1[i + skip1] <= doc2 else i + 1
+        else:
+            j = j + skip2 if j + skip2 < len2 and docs2[j + skip2] <= doc1 else j + 1
+    return result
+
+
+def gallop_intersect(docs1: array, docs2: array) -> array:
+    """
+    Search each document of the shorter list in the longer one, from the last position found
+    """
+    small, large = (docs1, docs2) if len(docs1) <= len(docs2) else (docs2, docs1)
+    result = array(docs1.typecode)
+    j = 0
+    for doc in small:
+        j = gallop(large, doc, j)
+        if j == len(large):
+            break
+        if large[j] == doc:
+            result.append(doc)
+            j += 1
+    return result
+
+
+def intersect(docs1: array, docs2: array) -> array:
+    """
+    Document ids in both lists, the algorithm being chosen by choose_algorithm
+    :param docs1: document ids in ascending order
+    :param docs2: document ids in ascending order
+    :return: document ids in ascending order
+    """
+    algorithm = choose_algorithm(docs1, docs2)
+    if algorithm == 'gallop':
+        return gallop_intersect(docs1, docs2)
+    if algorithm == 'skip':
+        return skip_intersect(docs1, docs2)
+    return merge_intersect(docs1, docs2)
+
+
+def merge_union(docs1: array, docs2: array) -> array:
+    """
+    Linear merge of the two lists: sorting their concatenation merges the two ascending runs in linear time,
+    and dict.fromkeys drops the duplicates in order
+    """
+    return array(docs1.typecode, dict.fromkeys(sorted(docs1 + docs2)))
+
+
+def gallop_union(docs1: array, docs2: array) -> array:
+    """
+    Insert each document of the shorter list in the longer one: the runs of the longer list
+    between two of them are copied as slices
+    """
+    small, large = (docs1, docs2) if len(docs1) <= len(docs2) else (docs2, docs1)
+    result = array(docs1.typecode)
+    j = 0
+    for doc in small:
+        k = gallop(large, doc, j)
+        result.extend(large[j:k])
+        result.append(doc)
+        j = k + 1 if k < len(large) and large[k] == doc else k
+    result.extend(large[j:])
+    return result
+
+
+def union(docs1: array, docs2: array) -> array:
+    """
+    Document ids in any of the lists, by galloping when their sizes are very different
+    :param docs1: document ids in ascending order
+    :param docs2: document ids in ascending order
+    :return: document ids in ascending order
+    """
+    if choose_algorithm(docs1, docs2) == 'gallop':
+        return gallop_union(docs1, docs2)
+    return merge_union(docs1, docs2)
+
+
+def merge_difference(docs1: array, docs2: array) -> array:
+    result = array(docs1.typecode)
+    i, j = 0, 0
+    len1, len2 = len(docs1), len(docs2)
+    while i < len1 and j < len2:
+        doc1, doc2 = docs1[i], docs2[j]
+        if doc1 == doc2:
+            i += 1
+            j += 1
+        elif doc1 < doc2:
+            result.append(doc1)
+            i += 1
+        else:
+            j += 1
+    result.extend(docs1[i:])
+    return result
+
+
+def gallop_difference(docs1: array, docs2: array) -> array:
+    """
+    If docs1 is the shorter list its documents are searched in docs2,
+    otherwise the documents of docs2 are cut out of docs1, the runs between them being copied as slices
+    """
+    result = array(docs1.typecode)
+    if len(docs1) <= len(docs2):
+        j = 0
+        for doc in docs1:
+            j = gallop(docs2, doc, j)
+            if j == len(docs2) or docs2[j] != doc:
+                result.append(doc)
+        return result
+    i = 0
+    for doc in docs2:
+        k = gallop(docs1, doc, i)
+        result.extend(docs1[i:k])
+        i = k + 1 if k < len(docs1) and docs1[k] == doc else k
+    result.extend(docs1[i:])
+    return result
+
+
+def difference(docs1: array, docs2: array) -> array:
+    """
+    Document ids in docs1 but not in docs2, by galloping when their sizes are very different
+    :param docs1: document ids in ascending order
+    :param docs2: document ids in ascending order
+    :return: document ids in ascending order
+    """
+    if choose_algorithm(docs1, docs2) == 'gallop':
+        return gallop_difference(docs1, docs2)
+    return merge_difference(docs1, docs2)
+
+
+if __name__ == '__main__':
+    a = array('I', [1, 3, 5, 7, 9, 11, 13, 15, 17, 19, 21, 23, 25, 27, 29, 31, 33])
+    b = array('I', [3, 4, 21, 33])
+    print('%s: %s' % (choose_algorithm(a, b), list(intersect(a, b))))
+    print(list(union(a, b)))
+    print(list(difference(a, b)), list(difference(b, a)))
@@ -0,0 +1,459 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: BooleanPlanner.py
+@time: 2020/5/4
+@desc: Boolean queries compiled into a plan: a tree of and/or/not operators over the posting lists
+       of the query terms. The plan is simplified with the document frequencies of the terms:
+       nested operators are flattened, empty operands cut their and operator, the children of an and
+       are ordered by ascending df and its negated children become exclusions.
+       The plan is evaluated by cursors which stream the matching document ids in ascending order,
+       apart from the operators cheaper to compute at once.
+"""
+from abc import ABC, abstractmethod
+from typing import List, Iterator
+from array import array
+from bisect import bisect_left
+from Project.InvertedIndex import InvertedIndex, PostingList, PostingCursor
+from Project.BooleanMerge import intersect, union, difference
+
+END = PostingCursor.END
+# Cost of a posting touched by a cursor, relative to a posting read by the merges of Project.BooleanMerge
+CURSOR_COST = 4
+
+
+class LeafCursor(PostingCursor):
+    """
+    Posting cursor counting the postings it lands on
+    """
+    __slots__ = ('touched',)
+
+    def __init__(self, posting_list: PostingList):
+        super().__init__(posting_list)
+        self.touched = 1 if self.doc != END else 0
+
+    def next(self) -> int:
+        self.index += 1
+        if self.index < len(self.docs):
+            self.doc = self.docs[self.index]
+            self.touched += 1
+        else:
+            self.doc = END
+        return self.doc
+
+    def advance(self, target: int) -> int:
+        if target > self.doc:
+            self.index = bisect_left(self.docs, target, self.index)
+            if self.index < len(self.docs):
+                self.doc = self.docs[self.index]
+                self.touched += 1
+            else:
+                self.doc = END
+        return self.doc
+
+
+class AndCursor(object):
+    """
+    Documents of all the children but none of the excluded cursors. Children are led by the shortest:
+    each child in turn jumps to the candidate document, and a child landing after it gives the next candidate.
+    """
+    __slots__ = ('children', 'excluded', 'doc')
+
+    def __init__(self, children: List, excluded: List):
+        self.children = children
+        self.excluded = excluded
+        self.doc = self._align(children[0].doc)
+
+    def _align(self, target: int) -> int:
+        while target != END:
+            for child in self.children:
+                doc = child.advance(target)
+                if doc != target:
+                    target = doc
+                    break
+            else:
+                for cursor in self.excluded:
+                    if cursor.advance(target) == target:
+                        target += 1
+                        break
+                else:
+                    return target
+        return END
+
+    def next(self) -> int:
+        self.doc = self._align(self.doc + 1) if self.doc != END else END
+        return self.doc
+
+    def advance(self, target: int) -> int:
+        if target > self.doc:
+            self.doc = self._align(target)
+        return self.doc
+
+
+class OrCursor(object):
+    """
+    Documents of any of the children, the smallest current document first
+    """
+    __slots__ = ('children', 'doc')
+
+    def __init__(self, children: List):
+        self.children = children
+        self.doc = min(child.doc for child in children)
+
+    def next(self) -> int:
+        if self.doc != END:
+            doc, self.doc = self.doc, END
+            for child in self.children:
+                if child.doc == doc:
+                    child.next()
+                if child.doc < self.doc:
+                    self.doc = child.doc
+        return self.doc
+
+    def advance(self, target: int) -> int:
+        if target > self.doc:
+            self.doc = min(child.advance(target) for child in self.children)
+        return self.doc
+
+
+class EmptyCursor(object):
+    __slots__ = ('doc',)
+
+    def __init__(self):
+        self.doc = END
+
+    def next(self) -> int:
+        return END
+
+    def advance(self, target: int) -> int:
+        return END
+
+
+class PlanNode(ABC):
+    """
+    Operator of a plan. cost estimates the number of documents it gives, which orders the and operands.
+    A streamed node is evaluated by cursors over its operands, otherwise its document ids are computed at once
+    by Project.BooleanMerge, which is cheaper per posting but reads every posting of the operands.
+    """
+    name = ''
+
+    def __init__(self, children: List = None):
+        self.children = children if children is not None else []
+        self.cost = 0
+        self.streamed = True
+
+    def operands(self) -> List:
+        """
+        :return: every node evaluated by the node
+        """
+        return self.children
+
+    def open(self):
+        """
+        :return: cursor at the first document given by the node
+        """
+        if self.streamed:
+            return self.open_cursors()
+        posting_list = PostingList()
+        posting_list.docs = self.docs()
+        return PostingCursor(posting_list)
+
+    @abstractmethod
+    def open_cursors(self):
+        """
+        :return: cursor streaming the document ids given by the node, over cursors of its operands
+        """
+        pass
+
+    @abstractmethod
+    def docs(self) -> array:
+        """
+        :return: document ids given by the node in ascending order
+        """
+        pass
+
+    def read_postings(self) -> int:
+        """
+        :return: postings read if the node is not streamed
+        """
+        return sum(operand.read_postings() for operand in self.operands())
+
+    def streamed_postings(self) -> int:
+        """
+        :return: estimate of the postings touched if the node is streamed
+        """
+        return sum(operand.streamed_postings() for operand in self.operands())
+
+    def touched(self) -> int:
+        """
+        :return: postings read by the node and its operands
+        """
+        return sum(operand.touched() for operand in self.operands())
+
+    def explain(self, depth: int = 0, evaluated: bool = True) -> List[str]:
+        """
+        :param depth:
+        :param evaluated: bool for if the postings touched by the evaluation are given
+        :return: lines describing the node and its operands
+        """
+        touched = ', %d postings touched' % self.touched() if evaluated else ''
+        lines = ['%s%s  est. %d docs%s%s' % ('  ' * depth, self.name, self.cost, touched,
+                                             '' if self.streamed else ', computed at once')]
+        for child in self.children:
+            lines.extend(child.explain(depth + 1, evaluated))
+        return lines
+
+
+class TermNode(PlanNode):
+    def __init__(self, term: str, posting_list: PostingList):
+        super().__init__()
+        self.term = term
+        self.posting_list = posting_list
+        self.cost = len(posting_list)
+        self.cursors = []
+        self.read = 0  # postings read at once
+
+    @property
+    def name(self):
+        return 'TERM \'%s\'' % self.term
+
+    def open_cursors(self):
+        self.cursors.append(LeafCursor(self.posting_list))
+        return self.cursors[-1]
+
+    def docs(self) -> array:
+        self.read = self.cost
+        return self.posting_list.docs
+
+    def read_postings(self) -> int:
+        return self.cost
+
+    def streamed_postings(self) -> int:
+        return self.cost
+
+    def touched(self) -> int:
+        return self.read + sum(cursor.touched for cursor in self.cursors)
+
+
+class AndNode(PlanNode):
+    """
+    Children are ordered by ascending cost; excluded holds the children of the negated operands,
+    the documents of the universe being the candidates if no operand is positive.
+    Streamed, the shortest child leads and every other operand is probed once per candidate at most.
+    """
+    name = 'AND'
+
+    def __init__(self, children: List[PlanNode], excluded: List[PlanNode]):
+        super().__init__(sorted(children, key=lambda child: child.cost))
+        self.excluded = excluded
+        self.cost = self.children[0].cost
+
+    def operands(self) -> List[PlanNode]:
+        return self.children + self.excluded
+
+    def open_cursors(self):
+        return AndCursor([child.open() for child in self.children], [node.open() for node in self.excluded])
+
+    def docs(self) -> array:
+        docs = self.children[0].docs()
+        for child in self.children[1:]:
+            if not docs:
+                return docs
+            docs = intersect(docs, child.docs())
+        for node in self.excluded:
+            if not docs:
+                return docs
+            docs = difference(docs, node.docs())
+        return docs
+
+    def streamed_postings(self) -> int:
+        lead = self.children[0].streamed_postings()
+        return lead + sum(min(lead, operand.streamed_postings()) for operand in self.operands()[1:])
+
+    def explain(self, depth: int = 0, evaluated: bool = True) -> List[str]:
+        lines = super().explain(depth, evaluated)
+        for node in self.excluded:
+            lines.append('%sEXCLUDE' % ('  ' * (depth + 1)))
+            lines.extend(node.explain(depth + 2, evaluated))
+        return lines
+
+
+class OrNode(PlanNode):
+    name = 'OR'
+
+    def __init__(self, children: List[PlanNode], universe_size: int):
+        super().__init__(sorted(children, key=lambda child: child.cost))
+        self.cost = min(sum(child.cost for child in self.children), universe_size)
+
+    def open_cursors(self):
+        return OrCursor([child.open() for child in self.children])
+
+    def docs(self) -> array:
+        docs = self.children[0].docs()
+        for child in self.children[1:]:
+            docs = union(docs, child.docs())
+        return docs
+
+
+class NotNode(PlanNode):
+    """
+    Complement of the child against the universe of the document ids, only kept at the root of the plan
+    or under an or; under an and the child becomes an exclusion
+    """
+    name = 'NOT'
+
+    def __init__(self, child: PlanNode, universe: PostingList):
+        super().__init__([child])
+        self.universe = TermNode('*', universe)
+        self.cost = max(self.universe.cost - child.cost, 0)
+
+    def operands(self) -> List[PlanNode]:
+        return [self.universe] + self.children
+
+    def open_cursors(self):
+        return AndCursor([self.universe.open()], [self.children[0].open()])
+
+    def docs(self) -> array:
+        return difference(self.universe.docs(), self.children[0].docs())
+
+    def explain(self, depth: int = 0, evaluated: bool = True) -> List[str]:
+        lines = super().explain(depth, evaluated)
+        return lines[:1] + self.universe.explain(depth + 1, evaluated) + lines[1:]
+
+
+class EmptyNode(PlanNode):
+    name = 'EMPTY'
+
+    def open_cursors(self):
+        return EmptyCursor()
+
+    def docs(self) -> array:
+        return array('I')
+
+
+def is_empty(node: PlanNode) -> bool:
+    """
+    Only the cost of a term is exact, the others are estimates
+    """
+    return isinstance(node, EmptyNode) or (isinstance(node, TermNode) and node.cost == 0)
+
+
+def make_and(operands: List[PlanNode], universe: PostingList) -> PlanNode:
+    """
+    :param operands: nodes combined by and, and nodes being flattened
+    :param universe: every document id, candidates of an and whose operands are all negated
+    :return: EmptyNode if an operand is empty, the operand itself if there is one, an AndNode otherwise
+    """
+    children, excluded = [], []
+    for operand in operands:
+        if isinstance(operand, AndNode):
+            children.extend(operand.children)
+            excluded.extend(operand.excluded)
+        elif isinstance(operand, NotNode):
+            excluded.append(operand.children[0])
+        else:
+            children.append(operand)
+    excluded = [node for node in excluded if not is_empty(node)]
+    if any(is_empty(child) for child in children):
+        return EmptyNode()
+    if not children:
+        children = [TermNode('*', universe)]
+    if len(children) == 1 and not excluded:
+        return children[0]
+    return AndNode(children, excluded)
+
+
+def make_or(operands: List[PlanNode], universe: PostingList) -> PlanNode:
+    """
+    :param operands: nodes combined by or, or nodes being flattened and empty operands dropped
+    :param universe:
+    :return:
+    """
+    children = []
+    for operand in operands:
+        if isinstance(operand, OrNode):
+            children.extend(operand.children)
+        elif not is_empty(operand):
+            children.append(operand)
+    if not children:
+        return EmptyNode()
+    if len(children) == 1:
+        return children[0]
+    return OrNode(children, len(universe))
+
+
+def make_not(operand: PlanNode, universe: PostingList) -> PlanNode:
+    if isinstance(operand, NotNode):
+        return operand.children[0]
+    if is_empty(operand):
+        return TermNode('*', universe)
+    return NotNode(operand, universe)
+
+
+def compile_plan(postfix: List[str], ii: InvertedIndex, universe: array) -> PlanNode:
+    """
+    Build the plan of a boolean query
+    :param postfix: postfix tokens of the query, not being unary
+    :param ii:
+    :param universe: every document id of the index in ascending order
+    :return: root of the plan, EmptyNode if the query is malformed
+    """
+    universe_list = PostingList(len(universe))
+    universe_list.docs = universe
+    nodes = []
+    try:
+        for token in postfix:
+            token = token.lower()
+            if token == 'and':
+                node2, node1 = nodes.pop(), nodes.pop()
+                nodes.append(make_and([node1, node2], universe_list))
+            elif token == 'or':
+                node2, node1 = nodes.pop(), nodes.pop()
+                nodes.append(make_or([node1, node2], universe_list))
+            elif token == 'not':
+                nodes.append(make_not(nodes.pop(), universe_list))
+            else:
+                nodes.append(TermNode(token, ii[token]))
+    except IndexError:
+        return EmptyNode()
+    plan = nodes[-1] if nodes else EmptyNode()
+    choose_evaluation(plan)
+    return plan
+
+
+def choose_evaluation(node: PlanNode, streamable: bool = True):
+    """
+    Stream an operator if the postings its cursors would touch, weighted by CURSOR_COST, are fewer
+    than the postings of its operands; its operands are then chosen in turn, otherwise its whole subtree
+    is computed at once
+    :param node:
+    :param streamable: False if the parent of the node is computed at once
+    :return:
+    """
+    if isinstance(node, TermNode):
+        return
+    node.streamed = streamable and CURSOR_COST * node.streamed_postings() <= node.read_postings()
+    for operand in node.operands():
+        choose_evaluation(operand, node.streamed)
+
+
+def evaluate(plan: PlanNode) -> Iterator[int]:
+    """
+    Stream the document ids matching the plan, in ascending order
+    :param plan:
+    :return:
+    """
+    cursor = plan.open()
+    while cursor.doc != END:
+        yield cursor.doc
+        cursor.next()
+
+
+if __name__ == '__main__':
+    ii = InvertedIndex()
+    ii.get_inverted_index({1: 'a', 2: 'b', 3: 'c', 4: 'd'},
+                          {1: ['x', 'y'], 2: ['y'], 3: ['x', 'y', 'z'], 4: ['z']}, itype='doc')
+    plan = compile_plan(['y', 'x', 'z', 'not', 'and', 'and'], ii, array('I', [1, 2, 3, 4]))
+    print(list(evaluate(plan)))
+    print('\n'.join(plan.explain()))
@@ -0,0 +1,177 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: Codecs.py
+@time: 2020/4/22
+@desc: Codecs compressing the integer columns of posting lists
+"""
+from abc import ABC, abstractmethod
+from array import array
+from typing import Iterable, Tuple, Dict
+import sys
+
+
+class PostingCodec(ABC):
+    """
+    A codec turns a sequence of unsigned integers into bytes and back.
+    Posting lists give it small integers: gaps between document ids, tf - 1, position gaps.
+    """
+    name = ''
+
+    def __str__(self):
+        return self.name
+
+    @abstractmethod
+    def encode(self, values: Iterable[int]) -> bytes:
+        pass
+
+    @abstractmethod
+    def decode(self, data: bytes) -> array:
+        pass
+
+
+class RawCodec(PostingCodec):
+    """
+    Uncompressed 32-bit little-endian integers, the reference for compression ratios
+    """
+    name = 'raw'
+
+    def encode(self, values: Iterable[int]) -> bytes:
+        values = array('I', values)
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values.tobytes()
+
+    def decode(self, data: bytes) -> array:
+        values = array('I')
+        values.frombytes(data)
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values
+
+
+class VByteCodec(PostingCodec):
+    """
+    Variable-byte codec: 7 bits of the integer per byte, the high bit is set when more bytes follow
+    Example: 300 = 0b10_0101100 is stored as [0b1_0101100, 0b0_0000010]
+    """
+    name = 'vbyte'
+
+    def encode(self, values: Iterable[int]) -> bytes:
+        out = bytearray()
+        for value in values:
+            while value >= 128:
+                out.append(value & 127 | 128)
+                value >>= 7
+            out.append(value)
+        return bytes(out)
+
+    def decode(self, data: bytes) -> array:
+        return self.decode_from(data, 0, -1)[0]
+
+    @staticmethod
+    def decode_from(data: bytes, offset: int, count: int) -> Tuple[array, int]:
+        """
+        Decode count integers starting at offset
+        :param data:
+        :param offset: index of the first byte
+        :param count: number of integers to decode, -1 to decode until the end of data
+        :return: decoded integers and the offset following the last one
+        """
+        values = array('I')
+        value = shift = 0
+        end = len(data)
+        while offset < end and count != 0:
+            byte = data[offset]
+            offset += 1
+            if byte & 128:
+                value |= (byte & 127) << shift
+                shift += 7
+            else:
+                values.append(value | byte << shift)
+                value = shift = 0
+                count -= 1
+        return values, offset
+
+
+class PForDeltaCodec(PostingCodec):
+    """
+    Patched frame-of-reference codec working on blocks of 128 integers.
+    Each block is bit-packed with the smallest width b fitting 90% of its integers;
+    the high bits of the remaining ones (exceptions) are patched from a list stored after the block.
+    Block layout: b (1 byte), number of exceptions e (1 byte), 128 * b bits of packed integers,
+                  e exception indexes (1 byte each), e VByte-encoded high bits.
+    The stream starts with the VByte-encoded number of integers.
+    """
+    name = 'pfor'
+    BLOCK_SIZE = 128
+    EXCEPTION_RATIO = 0.1
+
+    def __init__(self):
+        self._vbyte = VByteCodec()
+
+    def _bit_width(self, block: array) -> int:
+        """
+        Smallest width such that at most EXCEPTION_RATIO of the block does not fit
+        :param block:
+        :return:
+        """
+        ordered = sorted(block)
+        kept = ordered[:max(1, len(ordered) - int(len(ordered) * self.EXCEPTION_RATIO))]
+        return kept[-1].bit_length()
+
+    def encode(self, values: Iterable[int]) -> bytes:
+        values = array('I', values)
+        out = bytearray(self._vbyte.encode([len(values)]))
+        for start in range(0, len(values), self.BLOCK_SIZE):
+            block = values[start:start + self.BLOCK_SIZE]
+            width = self._bit_width(block)
+            mask = (1 << width) - 1
+            exceptions = [(i, value >> width) for i, value in enumerate(block) if value >> width]
+            packed = 0
+            for i, value in enumerate(block):
+                packed |= (value & mask) << (i * width)
+            out.append(width)
+            out.append(len(exceptions))
+            out += packed.to_bytes((len(block) * width + 7) // 8, 'little')
+            out += bytes(i for i, _ in exceptions)
+            out += self._vbyte.encode(high for _, high in exceptions)
+        return bytes(out)
+
+    def decode(self, data: bytes) -> array:
+        count, offset = VByteCodec.decode_from(data, 0, 1)
+        remaining = count[0] if count else 0
+        values = array('I')
+        while remaining > 0:
+            size = min(self.BLOCK_SIZE, remaining)
+            width, exception_num = data[offset], data[offset + 1]
+            offset += 2
+            packed_size = (size * width + 7) // 8
+            packed = int.from_bytes(data[offset:offset + packed_size], 'little')
+            offset += packed_size
+            mask = (1 << width) - 1
+            block = array('I', ((packed >> (i * width)) & mask for i in range(size)))
+            if exception_num:
+                indexes = data[offset:offset + exception_num]
+                highs, offset = VByteCodec.decode_from(data, offset + exception_num, exception_num)
+                for i, high in zip(indexes, highs):
+                    block[i] |= high << width
+            values.extend(block)
+            remaining -= size
+        return values
+
+
+CODECS = {codec.name: codec for codec in (RawCodec(), VByteCodec(), PForDeltaCodec())}  # type: Dict[str, PostingCodec]
+
+
+def get_codec(name: str) -> PostingCodec:
+    """
+    Get a codec by its name
+    :param name: raw/vbyte/pfor
+    :return:
+    """
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError('Codec not found (%s).' % '/'.join(CODECS))
@@ -0,0 +1,235 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: DynamicPruning.py
+@time: 2020/4/29
+@desc: Document-at-a-time ranked retrieval skipping the postings which can not enter the top k:
+       WAND (Broder et al. 2003), Block-Max WAND (Ding and Suel 2011) and MaxScore (Turtle and Flood 1995).
+       Documents are ranked by the cosine similarity of VectorialModule,
+       or by the sum of idf * tf of FastQuery when scores are not normalized.
+"""
+from typing import List, Tuple, Dict
+from bisect import bisect_left
+from operator import attrgetter
+from itertools import accumulate
+from math import sqrt
+from Project.InvertedIndex import InvertedIndex, PostingCursor, BLOCK_MAX_SIZE
+from Restitution_of_article.TopK import TopK
+
+# Upper bounds are multiplied by UPPER_BOUND_SLACK so that rounding errors never prune a document
+# whose exact score would enter the top k
+UPPER_BOUND_SLACK = 1 + 1e-9
+
+
+class TermCursor(PostingCursor):
+    """
+    Posting cursor of a query term, with the weight and the score upper bounds of the term.
+    A document containing the term gets weight * tf / (norm_q * norm_d) from it,
+    norms being 1 when scores are not normalized.
+    """
+    __slots__ = ('term', 'weight', 'scale', 'upper_bound', 'last_docs', 'block_maxima', 'block_last')
+
+    def __init__(self, ii: InvertedIndex, term: str, weight: float, norm_q: float, normalized: bool = True):
+        """
+        :param ii:
+        :param term:
+        :param weight: tf_q * idf * idf for the cosine similarity, tf_q * idf otherwise
+        :param norm_q: norm of the query vector, 1 if scores are not normalized
+        :param normalized: bool for if scores are divided by the document norms
+        """
+        super().__init__(ii[term])
+        self.term = term
+        self.weight = weight
+        self.scale = weight / norm_q * UPPER_BOUND_SLACK if norm_q else 0.0
+        self.block_last = self.END
+        if normalized:
+            self.last_docs, self.block_maxima = ii.get_block_max(term)
+            self.upper_bound = self.scale * max(self.block_maxima, default=0.0)
+        else:
+            self.last_docs, self.block_maxima = None, None
+            self.upper_bound = self.scale * max(self.tfs, default=0)
+
+    def block_bound(self, doc: int) -> float:
+        """
+        Upper bound of the score brought by the term to a document, from the block which may contain it.
+        The last document id of this block is kept in block_last.
+        :param doc: document id, not smaller than the current one
+        :return:
+        """
+        block = bisect_left(self.last_docs, doc, self.index // BLOCK_MAX_SIZE)
+        if block == len(self.last_docs):
+            self.block_last = self.END - 1
+            return 0.0
+        self.block_last = self.last_docs[block]
+        return self.scale * self.block_maxima[block]
+
+
+class PruningStats(object):
+    """
+    Postings scored and skipped by a query, the postings left after the last result are skipped too
+    """
+    __slots__ = ('total', 'scored', 'skipped')
+
+    def __init__(self, total: int = 0):
+        self.total = total
+        self.scored = 0
+        self.skipped = 0
+
+    def add(self, stats: 'PruningStats') -> 'PruningStats':
+        """
+        Add the postings of another query, or of another sub-collection
+        :param stats:
+        :return: self
+        """
+        self.total += stats.total
+        self.scored += stats.scored
+        self.skipped += stats.skipped
+        return self
+
+    def __str__(self):
+        return '%d postings scored, %d skipped out of %d (%.1f%%).' \
+               % (self.scored, self.skipped, self.total, 100 * self.skipped / self.total if self.total else 0)
+
+
+def open_cursors(ii: InvertedIndex, vector_q: Dict[str, int],
+                 normalized: bool = True) -> Tuple[List[TermCursor], float]:
+    """
+    Cursors of the query terms found in the index, in the order of the query vector
+    :param ii: 'freq' or 'pos' inverted index
+    :param vector_q: key: query term, value: tf in the query
+    :param normalized: bool for if documents are ranked by cosine similarity, by sum of idf * tf otherwise
+    :return: cursors, norm of the query vector (1 if not normalized)
+    """
+    if ii.iitype not in {'freq', 'pos'}:
+        raise ValueError('Inverted index must has frequencies for ranked retrieval.')
+    weights = dict()
+    norm_q = 0
+    for term_q, tf_q in vector_q.items():
+        if term_q not in ii.keys():
+            continue
+        idf = ii.idf(term_q)
+        weights[term_q] = tf_q * idf * idf if normalized else tf_q * idf
+        norm_q += (tf_q * idf) ** 2
+    norm_q = sqrt(norm_q) if normalized else 1.0
+    return [TermCursor(ii, term, weight, norm_q, normalized) for term, weight in weights.items()], norm_q
+
+
+def score_document(cursors: List[TermCursor], doc: int, norm_q: float, norm_d: float) -> float:
+    """
+    Cosine similarity of a document, summed in the order of the query like VectorialModule.get_scores
+    :param cursors: cursors of the query terms, the ones containing doc are on it
+    :param doc:
+    :param norm_q:
+    :param norm_d:
+    :return:
+    """
+    score = 0.0
+    for cursor in cursors:
+        if cursor.doc == doc:
+            score += cursor.weight * cursor.tfs[cursor.index]
+    norm = norm_q * norm_d
+    return score / norm if norm else 0.0
+
+
+def wand(ii: InvertedIndex, vector_q: Dict[str, int], k: int = 10,
+         block_max: bool = True) -> Tuple[List[Tuple[int, float]], PruningStats]:
+    """
+    Top k documents of a query by WAND, or by Block-Max WAND.
+    Cursors are sorted by current document; the pivot is the first document whose summed term upper bounds
+    exceed the k-th best score, so that the documents before it are skipped.
+    With block_max, the pivot is only scored if the block maxima of its terms exceed the k-th best score,
+    otherwise every cursor up to the pivot jumps past the shortest of these blocks.
+    :param ii: 'freq' or 'pos' inverted index
+    :param vector_q: key: query term, value: tf in the query
+    :param k: number of results
+    :param block_max: bool for if block-max metadata are used
+    :return: (document id, score) in descending order of score, statistics of the postings scored and skipped
+    """
+    cursors, norm_q = open_cursors(ii, vector_q)
+    norms = ii.get_norms()
+    top = TopK(k)
+    stats = PruningStats(sum(len(cursor.docs) for cursor in cursors))
+    ordered = cursors
+    while True:
+        ordered = sorted((cursor for cursor in ordered if cursor.doc != PostingCursor.END), key=attrgetter('doc'))
+        threshold = top.threshold
+        pivot, bound = -1, 0.0
+        for i, cursor in enumerate(ordered):
+            bound += cursor.upper_bound
+            if bound > threshold:
+                pivot = i
+                break
+        if pivot < 0:
+            break
+        pivot_doc = ordered[pivot].doc
+        while pivot + 1 < len(ordered) and ordered[pivot + 1].doc == pivot_doc:
+            pivot += 1
+        if block_max and sum(cursor.block_bound(pivot_doc) for cursor in ordered[:pivot + 1]) <= threshold:
+            target = min(cursor.block_last for cursor in ordered[:pivot + 1]) + 1
+            if pivot + 1 < len(ordered):
+                target = min(target, ordered[pivot + 1].doc)
+            for cursor in ordered[:pivot + 1]:
+                cursor.advance(target)
+        elif ordered[0].doc == pivot_doc:
+            top.push(pivot_doc, score_document(cursors, pivot_doc, norm_q, norms[pivot_doc]))
+            stats.scored += pivot + 1
+            for cursor in ordered[:pivot + 1]:
+                cursor.next()
+        else:
+            for cursor in ordered[:pivot]:
+                cursor.advance(pivot_doc)
+    stats.skipped = stats.total - stats.scored
+    return top.results(), stats
+
+
+def maxscore(ii: InvertedIndex, vector_q: Dict[str, int], k: int = 10,
+             normalized: bool = True) -> Tuple[List[Tuple[int, float]], PruningStats]:
+    """
+    Top k documents of a disjunctive query by MaxScore.
+    Terms are sorted by upper bound; the non-essential ones are the lowest bounds whose sum does not exceed
+    the k-th best score, a document containing none of the other terms can not enter the top k.
+    Candidates are the documents of the essential terms, the non-essential lists are only probed,
+    highest bound first, while the candidate may still exceed the k-th best score.
+    :param ii: 'freq' or 'pos' inverted index
+    :param vector_q: key: query term, value: tf in the query
+    :param k: number of results
+    :param normalized: bool for if documents are ranked by cosine similarity, by sum of idf * tf otherwise
+    :return: (document id, score) in descending order of score, statistics of the postings scored and skipped
+    """
+    cursors, norm_q = open_cursors(ii, vector_q, normalized)
+    norms = ii.get_norms() if normalized else None
+    top = TopK(k)
+    stats = PruningStats(sum(len(cursor.docs) for cursor in cursors))
+    by_bound = sorted(cursors, key=attrgetter('upper_bound'))
+    bounds = list(accumulate(cursor.upper_bound for cursor in by_bound))  # bounds[i]: sum of the i + 1 lowest
+    essential = 0  # by_bound[:essential] are non-essential
+    while True:
+        threshold = top.threshold
+        while essential < len(by_bound) and bounds[essential] <= threshold:
+            essential += 1
+        doc = min((cursor.doc for cursor in by_bound[essential:]), default=PostingCursor.END)
+        if doc == PostingCursor.END:
+            break
+        norm = norm_q * norms[doc] if normalized else 1.0
+        partial = 0.0
+        for cursor in by_bound[essential:]:
+            if cursor.doc == doc:
+                partial += cursor.weight * cursor.tfs[cursor.index]
+                stats.scored += 1
+        candidate = True
+        for i in range(essential - 1, -1, -1):
+            if ((partial / norm if norm else 0.0) + bounds[i]) * UPPER_BOUND_SLACK <= threshold:
+                candidate = False
+                break
+            cursor = by_bound[i]
+            if cursor.advance(doc) == doc:
+                partial += cursor.weight * cursor.tfs[cursor.index]
+                stats.scored += 1
+        if candidate:
+            top.push(doc, score_document(cursors, doc, norm_q, norms[doc] if normalized else 1.0))
+        for cursor in by_bound[essential:]:
+            if cursor.doc == doc:
+                cursor.next()
+    stats.skipped = stats.total - stats.scored
+    return top.results(), stats
@@ -0,0 +1,136 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: ImpactOrdered.py
+@time: 2020/4/30
+@desc: Impact-ordered posting lists and score-at-a-time query evaluation (Anh and Moffat 2006).
+       The postings of a term are grouped into segments of equal quantized impact, highest first;
+       the segments of all the query terms are read in descending contribution until the top k can not change,
+       or until a budget of postings is spent.
+"""
+from typing import List, Tuple, Dict
+from array import array
+from collections import defaultdict
+from math import sqrt
+from bisect import bisect_left
+import heapq
+from Project.InvertedIndex import InvertedIndex
+from Project.DynamicPruning import PruningStats
+from Restitution_of_article.TopK import TopK
+
+
+class ImpactIndex(object):
+    """
+    Impact-ordered view of a 'freq' or 'pos' inverted index.
+    The impact of a posting is idf * tf / norm_d, its contribution to the cosine similarity
+    once multiplied by tf_q * idf / norm_q. Impacts are quantized on 2 ** bits - 1 levels
+    of the largest impact of the index, stored at index time; postings of level 0 are left out.
+    Segments of a term are built at its first query.
+    """
+    def __init__(self, ii: InvertedIndex, bits: int = 8):
+        """
+        :param ii: 'freq' or 'pos' inverted index
+        :param bits: number of bits of a quantized impact
+        """
+        if ii.iitype not in {'freq', 'pos'}:
+            raise ValueError('Inverted index must has frequencies for impact-ordered postings.')
+        self.ii = ii
+        self.levels = 2 ** bits - 1
+        self.max_impact = ii.get_max_impact()
+        self._segments = dict()  # key: term, value: segments of the term
+
+    def quantize(self, impact: float) -> int:
+        return int(impact / self.max_impact * self.levels + 0.5) if self.max_impact else 0
+
+    def impact(self, level: int) -> float:
+        return level * self.max_impact / self.levels
+
+    def segments(self, term: str) -> List[Tuple[int, array]]:
+        """
+        :param term:
+        :return: (quantized impact, document ids in ascending order) in descending order of impact
+        """
+        if term not in self._segments:
+            posting = self.ii[term]
+            norms = self.ii.get_norms()
+            idf = self.ii.idf(term)
+            groups = defaultdict(lambda: array('I'))
+            for doc, tf in zip(posting.docs, posting.tfs):
+                level = self.quantize(idf * tf / norms[doc]) if norms[doc] else 0
+                if level:
+                    groups[level].append(doc)
+            self._segments[term] = sorted(groups.items(), reverse=True)
+        return self._segments[term]
+
+
+def score_at_a_time(impact_index: ImpactIndex, vector_q: Dict[str, int], k: int = 10,
+                    budget: int = None) -> Tuple[List[Tuple[int, float]], PruningStats]:
+    """
+    Top k documents of a query by score-at-a-time evaluation.
+    Segments are read in descending contribution over all the query terms. The evaluation stops once
+    the k-th best score exceeds the (k+1)-th by more than the sum of the next contributions of every term,
+    the top k documents being then known, or once budget postings are read.
+    The stop test sorts the scores, it only runs once as many postings as scored documents were read since
+    the former test, so that it costs a constant per posting. After an early stop the remaining segments
+    are searched for the k documents only, so that their scores are the cosine similarity computed with
+    quantized impacts and their order is exact; after a budget stop scores only hold the postings read.
+    :param impact_index:
+    :param vector_q: key: query term, value: tf in the query
+    :param k: number of results
+    :param budget: maximum number of postings read, None for no limit
+    :return: (document id, score) in descending order of score, statistics of the postings read and skipped
+    """
+    ii = impact_index.ii
+    weights = {term: tf_q * ii.idf(term) for term, tf_q in vector_q.items() if term in ii.keys()}
+    norm_q = sqrt(sum(weight * weight for weight in weights.values()))
+    segments = {term: impact_index.segments(term) for term in weights}
+    stats = PruningStats(sum(len(docs) for term_segments in segments.values() for _, docs in term_segments))
+    queue = []  # (- contribution, term, rank of the segment) of the next segment of each term
+    remaining = dict()  # key: term, value: contribution of its next segment
+    for term, weight in weights.items():
+        weights[term] = weight / norm_q if norm_q else 0.0
+        if segments[term] and weights[term]:
+            remaining[term] = weights[term] * impact_index.impact(segments[term][0][0])
+            queue.append((-remaining[term], term, 0))
+    heapq.heapify(queue)
+    scores = dict()
+    tested = 0  # postings read at the former stop test
+    while queue:
+        contribution, term, rank = heapq.heappop(queue)
+        docs = segments[term][rank][1]
+        spent = budget is not None and stats.scored + len(docs) >= budget
+        if spent:
+            docs = docs[:budget - stats.scored]
+        for doc in docs:
+            scores[doc] = scores.get(doc, 0.0) - contribution
+        stats.scored += len(docs)
+        if spent:
+            break
+        if rank + 1 < len(segments[term]):
+            remaining[term] = weights[term] * impact_index.impact(segments[term][rank + 1][0])
+            heapq.heappush(queue, (-remaining[term], term, rank + 1))
+        else:
+            remaining[term] = 0.0
+        if queue and 0 < k < len(scores) and stats.scored - tested >= len(scores):
+            tested = stats.scored
+            best = heapq.nlargest(k + 1, scores.values())
+            if best[k - 1] - best[k] > sum(remaining.values()):
+                break
+    top = TopK(k)
+    for doc, score in scores.items():
+        top.push(doc, score)
+    if queue and not spent:  # top k known, the contributions of their remaining segments are added
+        candidates = {doc: score for doc, score in top.results()}
+        for _, term, rank in queue:
+            for level, docs in segments[term][rank:]:
+                contribution = weights[term] * impact_index.impact(level)
+                for doc in candidates:
+                    i = bisect_left(docs, doc)
+                    if i < len(docs) and docs[i] == doc:
+                        candidates[doc] += contribution
+        top = TopK(k)
+        for doc, score in candidates.items():
+            top.push(doc, score)
+    stats.skipped = stats.total - stats.scored
+    return top.results(), stats
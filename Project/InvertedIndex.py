@@ -7,31 +7,133 @@
 @desc: Functions and classes for generating inverted index
 """
 from typing import TypeVar, Iterable, List, Set, Dict, Tuple
-from math import log10
-from copy import deepcopy
+from math import log10, sqrt
+from array import array
+from itertools import accumulate, groupby, chain, count
+from operator import itemgetter
+from functools import lru_cache
+from time import perf_counter
+from bisect import bisect_left
 import os
+import sys
+import heapq
+import json
+import mmap
+import struct
+import tempfile
+from weakref import WeakValueDictionary
 from nltk.stem import WordNetLemmatizer
-from collections import Counter
-import matplotlib.pyplot as plt
-import seaborn as sns
+from collections import Counter, defaultdict, namedtuple
 import pickle as pkl
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from Project.Codecs import PostingCodec, get_codec, CODECS
+from Restitution_of_article.SuccinctTreap import encode_treap, SuccinctTreap
+from Project.QueryCache import QueryCache
 
 
-def plot_bar(xx: Iterable, yy: Iterable, title):
+def plot_bar(xx: Iterable, yy: Iterable, title, save_path: str):
     """
-    plotting util function
+    plotting util function, the graph is written to a file so that indexation never waits for a window
     :param xx: variable x
     :param yy: varable y
     :param title: title of the graph
+    :param save_path: image file where the graph is saved
     :return:
     """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
     plt.style.use('dark_background')
     plt.figure(figsize=(6, 10))
     plt.rc('ytick', labelsize=8)
     sns.barplot(x=yy, y=xx)
     plt.title(title)
-    plt.show()
+    plt.savefig(save_path, bbox_inches='tight')
+    plt.close()
+
+
+class Tokenizer(object):
+    """
+    Reusable cleaning and lemmatisation pipeline.
+    The vocabulary is tiny compared to the token stream, so the lemma of each word is kept
+    in a bounded LRU cache instead of asking the lemmatizer again.
+    """
+    SKIPPED_WORDS = frozenset({'', '\n', '\t', ' ', ':', '\\', '//', ',', '.', '\'', '\"', '\r', '&'})
+    REMOVED_SYMBOLS = ('\n', '\t', '\r')
+
+    def __init__(self, cache_size: int = 2 ** 18):
+        """
+        :param cache_size: maximal number of words whose lemma is cached
+        """
+        self.lemmatizer = WordNetLemmatizer()
+        self._normalize_cached = lru_cache(maxsize=cache_size)(self._normalize)
+
+    def _normalize(self, word: str) -> str:
+        for symbol in self.REMOVED_SYMBOLS:
+            if symbol in word:
+                word = word.replace(symbol, '')
+        return self.lemmatizer.lemmatize(word.lower())
+
+    def clean(self, words: Iterable[str], counter: Counter = None, do_rm_stpw=False) -> List[str]:
+        """
+        Clean, lemmatize and count a list of words, see clean_lemmatize_count
+        :param words: List of words
+        :param counter: Counter of all tokens in the collection
+        :param do_rm_stpw: bool for if stop words will be removed
+        :return: List of treated tokens
+        """
+        skipped, normalize = self.SKIPPED_WORDS, self._normalize_cached
+        lemma_words = [normalize(word) for word in words if word not in skipped]
+        if do_rm_stpw:
+            counter.update(lemma_words)
+        return lemma_words
+
+    def tokenize_document(self, lines: Iterable[str], counter: Counter = None, do_rm_stpw=False) -> List[str]:
+        """
+        Treat a whole document in one batch
+        :param lines: lines of the document
+        :param counter: Counter of all tokens in the collection
+        :param do_rm_stpw: bool for if stop words will be removed
+        :return: List of treated tokens of the document
+        """
+        words = []
+        for line in lines:
+            words += line.split(' ')
+        return self.clean(words, counter, do_rm_stpw)
+
+    @property
+    def hits(self) -> int:
+        return self._normalize_cached.cache_info().hits
+
+    @property
+    def misses(self) -> int:
+        return self._normalize_cached.cache_info().misses
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __str__(self):
+        info = self._normalize_cached.cache_info()
+        return 'Lemma cache: %d hits, %d misses, hit rate %.2f%%, %d/%d words cached'\
+               % (info.hits, info.misses, 100 * self.hit_rate, info.currsize, info.maxsize)
+
+
+_tokenizer = None
+
+
+def get_tokenizer() -> Tokenizer:
+    """
+    Get the tokenizer shared by the indexation and the query path of the process
+    :return:
+    """
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = Tokenizer()
+    return _tokenizer
 
 
 def clean_lemmatize_count(words: Iterable[str], counter: Counter = None, do_rm_stpw=False) -> Iterable[str]:
@@ -45,31 +147,23 @@ def clean_lemmatize_count(words: Iterable[str], counter: Counter = None, do_rm_s
     :param do_rm_stpw: bool for if stop words will be removed
     :return: List of treated tokens
     """
-    lemmatizer = WordNetLemmatizer()
-    lemma_words = []
-    for word in words:
-        if word in {'', '\n', '\t', ' ', ':', '\\', '//', ',', '.', '\'', '\"', '\r', '&'}:
-            continue
-        for symbol in {'\n', '\t', '\r'}:
-            if symbol in word:
-                word = word.replace(symbol, '')
-        token = lemmatizer.lemmatize(word.lower())
-        if do_rm_stpw:
-            counter[token] += 1
-        lemma_words.append(token)
-    return lemma_words
+    return get_tokenizer().clean(words, counter, do_rm_stpw=do_rm_stpw)
+
+
+STOP_WORD_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Stop_words.txt')
 
 
-def remove_stop_words(bag: Dict, counter: Counter, threshold=100, method='from-known'):
+def select_stop_words(counter: Counter, threshold=100, method='from-known',
+                      stop_word_file: str = STOP_WORD_FILE) -> List[str]:
     """
-    Remove stop words from word bag
-    :param bag: Word bag where the key is document id and the value is the list of tokens the document contains.
+    Select stop words among the most common tokens
     :param counter: Count the occurrence of tokens and help show the most common tokens as candidate of stp words
     :param threshold: Maximal number of stop words which will be removed
     :param method: 'direct' : Remove directly number of threshold of stop words from the most common tokens
                     'from-known' : Compare with the already known stop word list and remove the most common ones so that
                                     those meaningful high-frequent tokens will not be removed
-    :return: The function modifies the word bag and return nothing only when there is an error.
+    :param stop_word_file: file of the known stop words, one per line
+    :return: List of stop words, from the most common one. None when there is an error.
     """
     if threshold <= 0:
         print('Threshold must be larger than 0.')
@@ -77,9 +171,9 @@ def remove_stop_words(bag: Dict, counter: Counter, threshold=100, method='from-k
     if method == 'direct':
         stop_words = [t[0] for t in counter.most_common(threshold)]
     elif method == 'from-known':
+        known_stop_words = set()
         try:
-            with open('./Stop_words.txt', 'r') as stpwf:
-                known_stop_words = set()
+            with open(stop_word_file, 'r') as stpwf:
                 for line in stpwf.readlines():
                     if line != '\n':
                         known_stop_words.add(line.lower().replace('\n', ''))
@@ -94,13 +188,195 @@ def remove_stop_words(bag: Dict, counter: Counter, threshold=100, method='from-k
     else:
         print('Select method = from-known / direct.')
         return
-    plot_bar(stop_words, [counter[stp] for stp in stop_words], 'Most Common Tokens in the Corpus')
-    condition = lambda t: t not in stop_words
+    return stop_words
+
+
+def get_stop_words(counter: Counter, threshold=100, method='from-known', report_path: str = None) -> Set[str]:
+    """
+    Get the stop words of a token stream from the counter collected during tokenization.
+    The returned set is meant to filter tokens at indexation time, in O(1) per token.
+    :param counter: Count the occurrence of tokens and help show the most common tokens as candidate of stp words
+    :param threshold: Maximal number of stop words which will be removed
+    :param method: see select_stop_words
+    :param report_path: image file where the bar chart of the stop words is saved, None for no report
+    :return: Set of stop words, empty when there is an error.
+    """
+    stop_words = select_stop_words(counter, threshold, method)
+    if stop_words is None:
+        return set()
+    if report_path is not None:
+        plot_bar(stop_words, [counter[stp] for stp in stop_words], 'Most Common Tokens in the Corpus', report_path)
+    return set(stop_words)
+
+
+def remove_stop_words(bag: Dict, counter: Counter, threshold=100, method='from-known', report_path: str = None):
+    """
+    Remove stop words from word bag.
+    Prefer get_stop_words and filtering at indexation time, which do not rebuild every document.
+    :param bag: Word bag where the key is document id and the value is the list of tokens the document contains.
+    :param counter: Count the occurrence of tokens and help show the most common tokens as candidate of stp words
+    :param threshold: Maximal number of stop words which will be removed
+    :param method: see select_stop_words
+    :param report_path: image file where the bar chart of the stop words is saved, None for no report
+    :return: The function modifies the word bag and return nothing only when there is an error.
+    """
+    stop_words = get_stop_words(counter, threshold, method, report_path)
     for key, tokens in bag.items():
-        bag[key] = list(filter(condition, tokens))
+        bag[key] = [t for t in tokens if t not in stop_words]
 
 
-def get_terms_in_bag(collection_folder: str, do_rm_stpw=True, stop_word_threshold: int = 100) -> Tuple[str, Dict, Dict]:
+def get_sub_repositories(collection_folder: str) -> Tuple[str, List[str]]:
+    """
+    Find the sub-collections of a collection folder
+    :param collection_folder: The top-level collection folder
+    :return: collection_dir: absolute path of the collection folder
+             sub_repo: names of the sub-collections
+    """
+    collection_dir = os.path.join(os.getcwd(), collection_folder)
+    if not os.path.exists(collection_dir):
+        raise OSError('Collection folder does not exist.')
+    sub_repo = [repo for repo in os.listdir(collection_dir)
+                if not os.path.isfile(os.path.join(collection_dir, repo))]
+    return collection_dir, sub_repo
+
+
+class PipelineStats(object):
+    """
+    Time spent and amount of data treated by each stage of the document pipeline
+    """
+    def __init__(self):
+        self.seconds = Counter()
+        self.bytes = Counter()
+        self.tokens = Counter()
+
+    def add(self, stage: str, seconds: float, nbytes: int = 0, ntokens: int = 0):
+        self.seconds[stage] += seconds
+        self.bytes[stage] += nbytes
+        self.tokens[stage] += ntokens
+
+    def __str__(self):
+        reports = []
+        for stage, seconds in self.seconds.items():
+            seconds = max(seconds, 1e-9)
+            report = '%s %.3f s' % (stage, seconds)
+            if self.bytes[stage]:
+                report += ', %.2f MB/s' % (self.bytes[stage] / seconds / 2 ** 20)
+            if self.tokens[stage]:
+                report += ', %.0f tokens/s' % (self.tokens[stage] / seconds)
+            reports.append(report)
+        return 'Pipeline: ' + ' | '.join(reports)
+
+
+def read_documents(collection_dir: str, repo: str, stats: PipelineStats,
+                   position: int = 0) -> Iterable[Tuple[int, str, str]]:
+    """
+    Pipeline stage 1: read each file of a sub-collection in bulk
+    :param collection_dir: absolute path of the collection folder
+    :param repo: name of the sub-collection
+    :param stats: statistics of the pipeline
+    :param position: line of the progress bar
+    :return: doc_id, sub-collection name and document url name, text of the document
+    """
+    id_gen = 0
+    for root, _, files in os.walk(os.path.join(collection_dir, repo), topdown=True):
+        print('Converting files in repository %s' % repo)
+        for file in tqdm(iterable=files, total=len(files), desc='repository %s' % repo, position=position):
+            id_gen += 1
+            start = perf_counter()
+            with open(os.path.join(root, file), 'r', encoding='utf-8') as docf:
+                text = docf.read()
+                nbytes = docf.buffer.tell()
+            stats.add('read', perf_counter() - start, nbytes=nbytes)
+            yield id_gen, repo + '/' + file, text
+
+
+def tokenize_documents(documents: Iterable[Tuple[int, str, str]],
+                       stats: PipelineStats) -> Iterable[Tuple[int, str, List[str]]]:
+    """
+    Pipeline stage 2: split the text of each document into raw words.
+    Words are cut on spaces and after line breaks, as when the file is read line by line.
+    :param documents: doc_id, url name, text
+    :param stats: statistics of the pipeline
+    :return: doc_id, url name, raw words
+    """
+    for doc, url, text in documents:
+        start = perf_counter()
+        words = text.replace('\n', '\n ').split(' ')
+        stats.add('tokenize', perf_counter() - start, nbytes=len(text), ntokens=len(words))
+        yield doc, url, words
+
+
+def normalize_documents(documents: Iterable[Tuple[int, str, List[str]]], stats: PipelineStats,
+                        counter: Counter = None, do_rm_stpw=False) -> Iterable[Tuple[int, str, List[str]]]:
+    """
+    Pipeline stage 3: clean, lemmatize and count the raw words of each document
+    :param documents: doc_id, url name, raw words
+    :param stats: statistics of the pipeline
+    :param counter: Counter of all tokens in the sub-collection
+    :param do_rm_stpw: bool for if stop words will be removed
+    :return: doc_id, url name, tokens
+    """
+    tokenizer = get_tokenizer()
+    for doc, url, words in documents:
+        start = perf_counter()
+        tokens = tokenizer.clean(words, counter, do_rm_stpw=do_rm_stpw)
+        stats.add('normalize', perf_counter() - start, ntokens=len(words))
+        yield doc, url, tokens
+
+
+def iter_repo_documents(collection_dir: str, repo: str, counter: Counter = None, do_rm_stpw=False,
+                        position: int = 0) -> Iterable[Tuple[int, str, List[str]]]:
+    """
+    Stream the documents of one sub-collection through the pipeline read -> tokenize -> normalize,
+    one document at a time. Every indexer consumes this generator.
+    :param collection_dir: absolute path of the collection folder
+    :param repo: name of the sub-collection
+    :param counter: Counter of all tokens in the sub-collection
+    :param do_rm_stpw: bool for if stop words will be removed
+    :param position: line of the progress bar
+    :return: doc_id, sub-collection name and document url name, token list of the document
+    """
+    stats = PipelineStats()
+    documents = read_documents(collection_dir, repo, stats, position)
+    documents = tokenize_documents(documents, stats)
+    yield from normalize_documents(documents, stats, counter, do_rm_stpw)
+    print('Repository %s converted. %s' % (repo, stats))
+    print(get_tokenizer())
+
+
+def get_terms_in_repo(collection_dir: str, repo: str, do_rm_stpw=True, stop_word_threshold: int = 100,
+                      position: int = 0, report_path: str = None) -> Tuple[str, Dict, Dict, Set[str]]:
+    """
+    Read the files of one sub-collection, map document url name into id
+    and get token list of each document into a dictionary with document id as the key.
+    Stop words are counted while the documents are read, but they are left in the bag:
+    the indexation filters them out.
+    :param collection_dir: absolute path of the collection folder
+    :param repo: name of the sub-collection
+    :param do_rm_stpw: bool for if stop words will be removed
+    :param stop_word_threshold: Maximal number of stop words which will be removed
+    :param position: line of the progress bar, one per worker when sub-collections are read in parallel
+    :param report_path: image file where the bar chart of the stop words is saved, None for no report
+    :return: repo: name of sub-collection for sake of file storage
+             docid: mapping from doc_id to sub-collection name and document url name
+             bag: dictionary of tokens contained in each document
+             stop_words: set of stop words of the sub-collection, empty if they are kept
+    """
+    bag = dict()
+    docid = dict()
+    counter = Counter()
+    for doc, url, tokens in iter_repo_documents(collection_dir, repo, counter, do_rm_stpw, position):
+        docid[doc] = url
+        bag[doc] = tokens
+    stop_words = set()
+    if do_rm_stpw:
+        stop_words = get_stop_words(counter, threshold=stop_word_threshold, method='from-known',
+                                    report_path=report_path)
+    return repo, docid, bag, stop_words
+
+
+def get_terms_in_bag(collection_folder: str, do_rm_stpw=True,
+                     stop_word_threshold: int = 100) -> Tuple[str, Dict, Dict, Set[str]]:
     """
     The function read collection files and map document url name into id;
     and get token list of each document into a dictionary with document id as the key;
@@ -111,38 +387,471 @@ def get_terms_in_bag(collection_folder: str, do_rm_stpw=True, stop_word_threshol
     :return: repo: name of sub-collection for sake of file storage
              docid: mapping from doc_id to sub-collection name and document url name
              bag: dictionary of tokens contained in each document
+             stop_words: set of stop words to filter out at indexation
     """
-    # read file
-    work_dir = os.getcwd()
-    collection_dir = work_dir + '\\' + collection_folder + '\\'
+    collection_dir, sub_repo = get_sub_repositories(collection_folder)
     print('Getting terms into bag...')
-    if os.path.exists(collection_dir):
-        sub_repo = [repo for repo in os.listdir(collection_dir)
-                    if not os.path.isfile(os.path.join(collection_dir, repo))]
-        # walk through files to get words
-        for repo in sub_repo:
-            bag = dict()
-            docid = dict()
-            id_gen = 0
-            counter = Counter()
-            for root, _, files in os.walk(os.path.join(collection_dir, repo), topdown=True):
-                print('Converting files in repository %s' % repo)
-                for file in tqdm(iterable=files, total=len(files)):
-                    id_gen += 1
-                    docid[id_gen] = repo + '/' + file
-                    with open(os.path.join(root, file), 'r', encoding='utf-8') as docf:
-                        for line in docf:
-                            line = clean_lemmatize_count(line.split(' '), counter, do_rm_stpw=do_rm_stpw)
-                            if id_gen not in bag.keys():
-                                bag[id_gen] = line
-                            else:
-                                bag[id_gen] += line
-            if do_rm_stpw:
-                print('Removing stop words...')
-                remove_stop_words(bag, counter, threshold=stop_word_threshold, method='from-known')
-            yield repo, docid, bag
+    # walk through files to get words
+    for repo in sub_repo:
+        yield get_terms_in_repo(collection_dir, repo, do_rm_stpw, stop_word_threshold)
+
+
+def get_index_file_name(repo: str, itype: str, rm_stpw: bool) -> str:
+    """
+    Name of the inverted index file of a sub-collection
+    :param repo: name of the sub-collection
+    :param itype: type of inverted index
+    :param rm_stpw: bool for if stop words are removed
+    :return:
+    """
+    stpw_mark = 'stp' if rm_stpw else 'nostp'
+    return 'collection.cs276.' + stpw_mark + '.' + itype + '.' + repo + '.ii'
+
+
+INDEX_FORMAT = 'ii-codec'
+INDEX_FORMAT_VERSION = 1
+INDEX_VERSIONS = count(1)  # versions of the indexes built by the process
+
+
+def file_version(path: str) -> Tuple[int, int]:
+    """
+    Version of an index read from a file, which changes when the file is written again
+    :param path:
+    :return: modification time in ns, size
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def save_inverted_index(ii, path: str, codec: str = 'vbyte', treaps: bool = False):
+    """
+    Save an inverted index, its posting lists compressed by a codec, with the block maxima and champion lists
+    of the ranked queries
+    :param ii: InvertedIndex
+    :param path: .ii file
+    :param codec: raw/vbyte/pfor, or pickle to pickle the InvertedIndex object as it is
+    :param treaps: bool for if the treaps of every term are saved for TreapModule, see compute_treaps.
+                   Without them TreapModule builds the treaps of the query terms.
+    :return:
+    """
+    posting_codec = get_codec(codec) if codec != 'pickle' else None
+    if ii.iitype in {'freq', 'pos'}:
+        ii.get_max_impact()
+        if getattr(ii, 'champions', None) is None:
+            ii.compute_champion_lists()
+    if treaps and getattr(ii, 'treaps', None) is None:
+        ii.compute_treaps()
+    with open(path, 'wb') as f:
+        if posting_codec is None:
+            pkl.dump(ii, f)
+            return
+        pkl.dump({'format': INDEX_FORMAT, 'version': INDEX_FORMAT_VERSION, 'codec': codec,
+                  'iitype': ii.iitype, 'D': ii.D, 'doc_id': ii.doc_id,
+                  'shard_ranges': getattr(ii, 'shard_ranges', dict()),
+                  'norms': getattr(ii, 'norms', None), 'idf_table': getattr(ii, 'idf_table', None),
+                  'block_maxes': getattr(ii, 'block_maxes', None), 'max_impact': getattr(ii, 'max_impact', None),
+                  'champions': {term: [(len(tier), tier.encode(posting_codec)) for tier in tiers]
+                                for term, tiers in (getattr(ii, 'champions', None) or dict()).items()},
+                  'treaps': getattr(ii, 'treaps', None) if treaps else None,
+                  'postings': {term: (posting.df, posting.encode(posting_codec)) for term, posting in ii.items()}}, f)
+
+
+def load_inverted_index(path: str):
+    """
+    Load an inverted index saved by save_inverted_index, or pickled as an InvertedIndex object
+    :param path: .ii file
+    :return: InvertedIndex
+    """
+    with open(path, 'rb') as f:
+        saved = pkl.load(f)
+    if isinstance(saved, InvertedIndex):
+        saved.version = file_version(path)
+        return saved
+    if saved.get('format') != INDEX_FORMAT or saved.get('version') != INDEX_FORMAT_VERSION:
+        raise ValueError('Inverted index format not supported: %s' % path)
+    posting_codec = get_codec(saved['codec'])
+    ii = InvertedIndex()
+    ii.iitype, ii.D, ii.doc_id = saved['iitype'], saved['D'], saved['doc_id']
+    ii.shard_ranges = saved.get('shard_ranges', dict())
+    for term, (df, data) in saved['postings'].items():
+        ii[term] = PostingList.decode(df, data, posting_codec)
+    ii.norms, ii.idf_table, ii.block_maxes = saved.get('norms'), saved.get('idf_table'), saved.get('block_maxes')
+    ii.max_impact = saved.get('max_impact')
+    if saved.get('champions'):
+        ii.champions = {term: tuple(PostingList.decode(df, data, posting_codec) for df, data in tiers)
+                        for term, tiers in saved['champions'].items()}
+    ii.treaps = saved.get('treaps')
+    if ii.norms is None:
+        ii.compute_statistics()
+    ii.version = file_version(path)
+    return ii
+
+
+# Binary format
+# .lex file: LEXICON_MAGIC, version, header length, JSON header (iitype, D, codec, number of terms, largest impact,
+#            spans of the document id mapping and of the statistics in the posting file),
+#            one LEXICON_ENTRY per term sorted by utf-8 term (offset and length of the term in the pool,
+#            df, offset of the postings, length of the encoded docs / tfs / positions),
+#            pool of the utf-8 terms
+# .post file: POSTINGS_MAGIC, encoded columns of every term, JSON document id mapping,
+#            document norms as little-endian doubles and block-max metadata (empty for a 'doc' index):
+#            first block of each term in lexicon order followed by the total number of blocks (uint32),
+#            last document id of every block (uint32), largest impact of every block (double),
+#            then the champion lists: one CHAMPION_ENTRY per term in lexicon order (offset of its tiers
+#            after the entries, then number of postings, length of the encoded docs / tfs of each tier),
+#            encoded tiers,
+#            then, for an index saved with its treaps, one TREAP_ENTRY per term in lexicon order (offset of
+#            its treap after the entries, length of the treap), treaps encoded by encode_treap
+# The idf of a term is not stored, it is computed from the df of its lexicon entry at first use.
+BINARY_FORMAT_VERSION = 1
+LEXICON_MAGIC = b'FRIWLEX\0'
+POSTINGS_MAGIC = b'FRIWPST\0'
+BINARY_HEADER = struct.Struct('<8sII')
+LEXICON_ENTRY = struct.Struct('<IHIQIII')
+ABSENT_COLUMN = 0xFFFFFFFF
+BLOCK_MAX_SIZE = 64
+CHAMPION_TIER_SIZES = (100, 400)
+CHAMPION_ENTRY = struct.Struct('<Q' + 'III' * len(CHAMPION_TIER_SIZES))
+TREAP_ENTRY = struct.Struct('<QI')
+INDEX_EXT = '.ii'
+LEXICON_EXT = '.lex'
+POSTINGS_EXT = '.post'
+
+
+def encode_doubles(values: Iterable[float]) -> bytes:
+    """
+    Floats as little-endian doubles, for document norms and block maxima
+    :param values:
+    :return:
+    """
+    values = array('d', values)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def decode_doubles(data: bytes) -> array:
+    values = array('d')
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def encode_block_maxes(ii, terms: List[str]) -> bytes:
+    """
+    Block-max metadata of the binary format
+    :param ii: InvertedIndex
+    :param terms: terms in lexicon order
+    :return:
+    """
+    raw = get_codec('raw')
+    first_blocks, last_docs, maxima = array('I', [0]), array('I'), array('d')
+    for term in terms:
+        term_last_docs, term_maxima = ii.get_block_max(term)
+        last_docs.extend(term_last_docs)
+        maxima.extend(term_maxima)
+        first_blocks.append(len(last_docs))
+    return raw.encode(first_blocks) + raw.encode(last_docs) + encode_doubles(maxima)
+
+
+def encode_champions(ii, terms: List[str], codec: PostingCodec) -> bytes:
+    """
+    Champion lists of the binary format
+    :param ii: InvertedIndex
+    :param terms: terms in lexicon order
+    :param codec:
+    :return:
+    """
+    entries, data = bytearray(), bytearray()
+    for term in terms:
+        lengths = []
+        offset = len(data)
+        for tier in ii.get_champions(term):
+            docs_data, tfs_data, _ = tier.encode(codec)
+            lengths += [len(tier), len(docs_data), len(tfs_data)]
+            data += docs_data + tfs_data
+        entries += CHAMPION_ENTRY.pack(offset, *lengths)
+    return bytes(entries + data)
+
+
+def encode_treaps(ii, terms: List[str]) -> bytes:
+    """
+    Treaps of the binary format
+    :param ii: InvertedIndex
+    :param terms: terms in lexicon order
+    :return:
+    """
+    entries, data = bytearray(), bytearray()
+    for term in terms:
+        treap = ii.treaps[term]
+        entries += TREAP_ENTRY.pack(len(data), len(treap))
+        data += treap
+    return bytes(entries + data)
+
+
+def save_binary_index(ii, path: str, codec: str = 'vbyte', treaps: bool = False) -> Tuple[str, str]:
+    """
+    Save an inverted index in the memory-mappable binary format, see MappedInvertedIndex
+    :param ii: InvertedIndex
+    :param path: file name of the index, its extension is replaced by LEXICON_EXT and POSTINGS_EXT
+    :param codec: raw/vbyte/pfor
+    :param treaps: bool for if the treaps of every term are saved for TreapModule, see save_inverted_index
+    :return: paths of the lexicon and of the posting file
+    """
+    posting_codec = get_codec(codec)
+    base = os.path.splitext(path)[0]
+    lex_path, post_path = base + LEXICON_EXT, base + POSTINGS_EXT
+    terms = sorted((term.encode('utf-8'), term) for term in ii.keys())
+    entries, pool = [], bytearray()
+    with open(post_path, 'wb') as postf:
+        postf.write(POSTINGS_MAGIC)
+        offset = len(POSTINGS_MAGIC)
+        for key, term in terms:
+            posting = ii[term]
+            data = posting.encode(posting_codec)
+            lengths = [ABSENT_COLUMN if part is None else len(part) for part in data]
+            entries.append(LEXICON_ENTRY.pack(len(pool), len(key), posting.df, offset, *lengths))
+            pool += key
+            for part in data:
+                if part is not None:
+                    postf.write(part)
+                    offset += len(part)
+        doc_id = json.dumps(ii.doc_id).encode('utf-8')
+        postf.write(doc_id)
+        norms = encode_doubles(ii.get_norms()) if ii.iitype in {'freq', 'pos'} else b''
+        postf.write(norms)
+        block_max = encode_block_maxes(ii, [term for _, term in terms]) if norms else b''
+        postf.write(block_max)
+        champions = encode_champions(ii, [term for _, term in terms], posting_codec) if norms else b''
+        postf.write(champions)
+        treap_offset = None
+        if treaps:
+            if getattr(ii, 'treaps', None) is None:
+                ii.compute_treaps()
+            postf.write(encode_treaps(ii, [term for _, term in terms]))
+            treap_offset = offset + len(doc_id) + len(norms) + len(block_max) + len(champions)
+    header = json.dumps({'iitype': ii.iitype, 'D': ii.D, 'codec': codec, 'term_num': len(entries),
+                         'shard_ranges': getattr(ii, 'shard_ranges', dict()),
+                         'doc_id_offset': offset, 'doc_id_len': len(doc_id),
+                         'norms_offset': offset + len(doc_id), 'norms_len': len(norms),
+                         'block_max_offset': offset + len(doc_id) + len(norms),
+                         'champion_offset': offset + len(doc_id) + len(norms) + len(block_max),
+                         'champion_tier_sizes': CHAMPION_TIER_SIZES,
+                         'max_impact': ii.get_max_impact() if norms else None,
+                         'treap_offset': treap_offset}).encode('utf-8')
+    with open(lex_path, 'wb') as lexf:
+        lexf.write(BINARY_HEADER.pack(LEXICON_MAGIC, BINARY_FORMAT_VERSION, len(header)))
+        lexf.write(header)
+        for entry in entries:
+            lexf.write(entry)
+        lexf.write(pool)
+    return lex_path, post_path
+
+
+def open_inverted_index(path: str):
+    """
+    Open an inverted index file of any format
+    :param path: .lex file of the binary format, or .ii file
+    :return: MappedInvertedIndex for the binary format, InvertedIndex otherwise
+    """
+    if path.endswith(LEXICON_EXT):
+        return MappedInvertedIndex(path)
+    return load_inverted_index(path)
+
+
+def is_index_file(file: str) -> bool:
+    """
+    Check if a file of an index folder is opened by open_inverted_index: a .ii file or the lexicon
+    of the binary format, other files of the folder being skipped
+    :param file:
+    :return:
+    """
+    return file.endswith(INDEX_EXT) or file.endswith(LEXICON_EXT)
+
+
+def merge_inverted_indexes(indexes: Iterable[Tuple[str, 'InvertedIndex']]):
+    """
+    Merge the indexes of sub-collections into one index with a global document id space.
+    The documents of each sub-collection get a contiguous range of ids, after the ranges of the previous ones,
+    so that df, D and every score are computed on the whole collection.
+    :param indexes: (name of the sub-collection, its inverted index), in the order of the id ranges
+    :return: InvertedIndex whose shard_ranges give the id range of each sub-collection
+    """
+    merged = InvertedIndex()
+    merged.doc_id = dict()
+    columns = defaultdict(list)  # key: term, value: (id offset, posting list) of each sub-collection
+    offset = 0
+    for shard, ii in indexes:
+        if merged.iitype not in {'null', ii.iitype}:
+            raise ValueError('Indexes of different types can not be merged (%s/%s).' % (merged.iitype, ii.iitype))
+        merged.iitype = ii.iitype
+        last = max(ii.doc_id) if ii.doc_id else 0
+        for doc, url in ii.doc_id.items():
+            merged.doc_id[doc + offset] = url
+        merged.shard_ranges[shard] = (offset + 1, offset + last)
+        merged.D += ii.D
+        for term, posting in ii.items():
+            columns[term].append((offset, posting))
+        offset += last
+    for term, shard_postings in columns.items():
+        posting_list = PostingList(sum(posting.df for _, posting in shard_postings))
+        first = shard_postings[0][1]
+        posting_list.tfs = array('I') if first.tfs is not None else None
+        posting_list.positions = [] if first.positions is not None else None
+        for shard_offset, posting in shard_postings:
+            posting_list.docs.extend(doc + shard_offset for doc in posting.docs)
+            if posting_list.tfs is not None:
+                posting_list.tfs.extend(posting.tfs)
+            if posting_list.positions is not None:
+                posting_list.positions.extend(posting.positions)
+        merged[term] = posting_list
+    merged.compute_statistics()
+    return merged
+
+
+def remove_index_file(path: str):
+    """
+    Delete an inverted index file, with the posting file of the binary format
+    :param path:
+    :return:
+    """
+    os.remove(path)
+    if path.endswith(LEXICON_EXT):
+        os.remove(os.path.splitext(path)[0] + POSTINGS_EXT)
+
+
+def merge_index_files(paths: Iterable[Tuple[str, str]], inver_index_path: str, itype='freq', rm_stpw=False,
+                      codec: str = 'vbyte', binary: bool = False, treaps: bool = False) -> str:
+    """
+    Replace the saved indexes of the sub-collections by one merged index, see merge_inverted_indexes
+    :param paths: (repo, path) of each saved inverted index, as given by build_collection_index
+    :param inver_index_path: folder where the merged index is saved
+    :param itype: type of inverted index
+    :param rm_stpw: bool for if stop words are removed
+    :param codec: codec of the saved posting lists
+    :param binary: bool for if the merged index is saved in the memory-mapped binary format
+    :param treaps: bool for if the treaps of every term are saved, see save_inverted_index
+    :return: path of the merged index
+    """
+    paths = sorted(paths, key=lambda repo_path: (len(repo_path[0]), repo_path[0]))
+    indexes = []
+    for repo, path in paths:
+        ii = open_inverted_index(path)
+        if isinstance(ii, MappedInvertedIndex):
+            mapped, ii = ii, load_mapped_index(ii)
+            mapped.close()
+        indexes.append((repo, ii))
+    merged = merge_inverted_indexes(indexes)
+    for _, path in paths:
+        remove_index_file(path)
+    path = os.path.join(inver_index_path, get_index_file_name('all', itype, rm_stpw))
+    if binary:
+        return save_binary_index(merged, path, codec, treaps)[0]
+    save_inverted_index(merged, path, codec, treaps)
+    return path
+
+
+def load_mapped_index(mapped: 'MappedInvertedIndex'):
+    """
+    Read every posting list of a memory-mapped index into an in-memory InvertedIndex
+    :param mapped:
+    :return: InvertedIndex
+    """
+    ii = InvertedIndex()
+    ii.iitype, ii.D, ii.doc_id, ii.shard_ranges = mapped.iitype, mapped.D, mapped.doc_id, mapped.shard_ranges
+    for term, posting in mapped.items():
+        ii[term] = posting
+    if mapped.get_norms() is not None:
+        ii.norms = mapped.get_norms()
+        ii.idf_table = {term: log10(ii.D / posting.df) for term, posting in ii.items()}
+        ii.max_impact = mapped.max_impact
+    return ii
+
+
+# Indexation of one sub-collection, sent to worker processes
+# collection_dir: absolute path of the collection folder
+# repo: name of the sub-collection
+# inver_index_path: folder where .ii files are saved
+# itype: type of inverted index: doc/freq/pos
+# rm_stpw: bool for if stop words will be removed
+# stop_word_threshold: Maximal number of stop words which will be removed
+# position: line of the progress bar of the worker
+# memory_budget: bytes of postings held in memory by the block-based indexer, None to index the whole bag at once
+# report_dir: folder where the stop word bar chart is saved, None for no report
+# codec: codec of the saved posting lists, see save_inverted_index
+# binary: bool for if the index is saved in the memory-mapped binary format
+# treaps: bool for if the treaps of every term are saved, see save_inverted_index
+IndexTask = namedtuple('IndexTask', ['collection_dir', 'repo', 'inver_index_path', 'itype', 'rm_stpw',
+                                     'stop_word_threshold', 'position', 'memory_budget', 'report_dir', 'codec',
+                                     'binary', 'treaps'])
+
+
+def index_repository(task: IndexTask) -> Tuple[str, str]:
+    """
+    Tokenize, lemmatize, index and save one sub-collection.
+    Defined at module level so that it can be sent to worker processes.
+    :param task: see IndexTask
+    :return: repo: name of the sub-collection
+             path: file where the inverted index is saved
+    """
+    report_path = None
+    if task.report_dir is not None:
+        report_path = os.path.join(task.report_dir, 'stop_words.%s.png' % task.repo)
+    if task.memory_budget is None:
+        repo, doc_id, bag, stop_words = get_terms_in_repo(task.collection_dir, task.repo, task.rm_stpw,
+                                                          task.stop_word_threshold, task.position, report_path)
+        ii = InvertedIndex()
+        ii.get_inverted_index(doc_id, bag, itype=task.itype, stop_words=stop_words)
     else:
-        raise OSError('Collection folder does not exist.')
+        ii = SpimiIndexer(itype=task.itype, memory_budget=task.memory_budget)\
+            .index_repository(task.collection_dir, task.repo, task.rm_stpw, task.stop_word_threshold,
+                              task.position, report_path)
+    path = os.path.join(task.inver_index_path, get_index_file_name(task.repo, task.itype, task.rm_stpw))
+    if task.binary:
+        path = save_binary_index(ii, path, task.codec, task.treaps)[0]
+    else:
+        save_inverted_index(ii, path, task.codec, task.treaps)
+    return task.repo, path
+
+
+def build_collection_index(collection_folder: str, inver_index_path: str, itype='freq', rm_stpw=False,
+                           stop_word_threshold: int = 100, jobs: int = 1,
+                           memory_budget: int = None, report_dir: str = None,
+                           codec: str = 'vbyte', binary: bool = False,
+                           treaps: bool = False) -> Iterable[Tuple[str, str]]:
+    """
+    Generate and save the inverted index of every sub-collection.
+    With jobs > 1 the sub-collections are treated in parallel worker processes,
+    each worker writing exactly the same file as the serial path.
+    :param collection_folder: The top-level collection folder
+    :param inver_index_path: folder where .ii files are saved
+    :param itype: type of inverted index: doc/freq/pos
+    :param rm_stpw: bool for if stop words will be removed
+    :param stop_word_threshold: Maximal number of stop words which will be removed
+    :param jobs: number of worker processes
+    :param memory_budget: bytes of postings each worker holds in memory with the block-based indexer,
+                          None to read the whole sub-collection into a bag first
+    :param report_dir: folder where the stop word bar charts are saved, None for no report
+    :param codec: codec of the saved posting lists, see save_inverted_index
+    :param binary: bool for if indexes are saved in the memory-mapped binary format
+    :param treaps: bool for if the treaps of every term are saved, see save_inverted_index
+    :return: (repo, path) of each saved inverted index, in completion order
+    """
+    collection_dir, sub_repo = get_sub_repositories(collection_folder)
+    jobs = max(1, min(jobs, len(sub_repo)))
+    if report_dir is not None and not os.path.exists(report_dir):
+        os.makedirs(report_dir)
+    tasks = [IndexTask(collection_dir, repo, inver_index_path, itype, rm_stpw, stop_word_threshold, i % jobs,
+                       memory_budget, report_dir, codec, binary, treaps)
+             for i, repo in enumerate(sub_repo)]
+    if jobs == 1:
+        for task in tasks:
+            yield index_repository(task)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            for future in as_completed([pool.submit(index_repository, task) for task in tasks]):
+                yield future.result()
 
 
 def extract_vocabulary(bag):
@@ -152,19 +861,67 @@ def extract_vocabulary(bag):
     return vocabulary
 
 
+class PositionDeltas(array):
+    """
+    Positions of a term in a document, stored as gaps between successive positions
+    in an unsigned integer array. It is hashable so that it can live in a posting set.
+    Example: positions [3, 10, 11] are stored as [3, 7, 1]
+    """
+    __slots__ = ()
+
+    def __hash__(self):
+        return hash(self.tobytes())
+
+    def __repr__(self):
+        return 'PositionDeltas(%s)' % self.decode()
+
+    def __copy__(self):
+        return type(self)(self.typecode, self)
+
+    def __deepcopy__(self, memo):
+        return self.__copy__()
+
+    @classmethod
+    def encode(cls, positions: List[int]):
+        """
+        Delta-encode a list of ascending positions
+        :param positions:
+        :return:
+        """
+        deltas = cls('I')
+        previous = 0
+        for position in positions:
+            deltas.append(position - previous)
+            previous = position
+        return deltas
+
+    def decode(self) -> List[int]:
+        """
+        Get back the absolute positions
+        :return:
+        """
+        return list(accumulate(self))
+
+
 class PostingList(object):
     """
     The class for constructing posting list for a term
+    Postings are stored in typed columns sorted by document id:
+    docs = array of document ids, tfs = array of term frequencies (None for a 'doc' index),
+    positions = list of PositionDeltas (None unless a 'pos' index).
     Example: 'CertainTerm': {
                                 df,
-                                indexation = {(doc1, tf, list_of_positions), ...}
+                                indexation = {(doc1, tf, position_deltas), ...}
                              }
     """
+    __slots__ = ('df', 'docs', 'tfs', 'positions')
     T = TypeVar('T')
 
     def __init__(self, df: int = 0):
         self.df = df
-        self._indexation = set()
+        self.docs = array('I')
+        self.tfs = None
+        self.positions = None
 
     def __repr__(self):
         """
@@ -172,7 +929,7 @@ class PostingList(object):
         :return:
         """
         tostr = '{ df = ' + str(self.df) + ',\n'
-        for i, ii in enumerate(self._indexation):
+        for i, ii in enumerate(self.postings()):
             if i % 10 == 0:
                 tostr += ' ' * 8
             tostr += ii.__str__() + ', '
@@ -181,9 +938,105 @@ class PostingList(object):
         tostr += ' }\n'
         return tostr
 
+    def __len__(self):
+        return len(self.docs)
+
+    def nbytes(self) -> int:
+        """
+        :return: bytes of the columns
+        """
+        nbytes = self.docs.itemsize * len(self.docs)
+        if self.tfs is not None:
+            nbytes += self.tfs.itemsize * len(self.tfs)
+        if self.positions is not None:
+            nbytes += sum(deltas.itemsize * len(deltas) for deltas in self.positions)
+        return nbytes
+
+    def __getstate__(self):
+        return self.df, self.docs, self.tfs, self.positions
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple) and len(state) == 2 and isinstance(state[0], (dict, type(None))):
+            # pickled before the columns, state = (__dict__, slots) or (None, slots)
+            state = state[0] or state[1]
+        if isinstance(state, dict):
+            self.__init__(state.get('df', 0))
+            self.indexation = state.get('_indexation')
+        else:
+            self.df, self.docs, self.tfs, self.positions = state
+
+    @classmethod
+    def from_postings(cls, postings: List[T]):
+        """
+        Freeze an accumulated list of document postings into a posting list
+        :param postings: one posting per document, as appended during indexation
+        :return:
+        """
+        posting_list = cls(df=len(postings))
+        posting_list.indexation = postings
+        return posting_list
+
+    def postings(self) -> Iterable[T]:
+        """
+        Iterate over the postings in ascending document order,
+        as document ids, (doc, tf) or (doc, tf, position_deltas) according to the index type
+        :return:
+        """
+        if self.tfs is None:
+            return iter(self.docs)
+        if self.positions is None:
+            return zip(self.docs, self.tfs)
+        return zip(self.docs, self.tfs, self.positions)
+
+    def cursor(self):
+        """
+        Get a cursor at the first posting
+        :return:
+        """
+        return PostingCursor(self)
+
+    def encode(self, codec: PostingCodec) -> Tuple[bytes, bytes, bytes]:
+        """
+        Compress the columns: gaps between document ids, tf - 1 and the concatenated position gaps
+        :param codec:
+        :return: encoded docs, encoded tfs (None for a 'doc' index), encoded positions (None unless 'pos' index)
+        """
+        docs = self.docs
+        docs_data = codec.encode(doc - previous for doc, previous in zip(docs, chain((0,), docs)))
+        tfs_data = codec.encode(tf - 1 for tf in self.tfs) if self.tfs is not None else None
+        positions_data = codec.encode(chain.from_iterable(self.positions)) if self.positions is not None else None
+        return docs_data, tfs_data, positions_data
+
+    @classmethod
+    def decode(cls, df: int, data: Tuple[bytes, bytes, bytes], codec: PostingCodec):
+        """
+        Rebuild a posting list from its encoded columns
+        :param df:
+        :param data: see encode
+        :param codec: the codec used by encode
+        :return:
+        """
+        docs_data, tfs_data, positions_data = data
+        posting_list = cls(df)
+        posting_list.docs = array('I', accumulate(codec.decode(docs_data)))
+        if tfs_data is not None:
+            posting_list.tfs = array('I', (tf + 1 for tf in codec.decode(tfs_data)))
+        if positions_data is not None:
+            deltas = codec.decode(positions_data)
+            posting_list.positions = []
+            start = 0
+            for tf in posting_list.tfs:
+                posting_list.positions.append(PositionDeltas('I', deltas[start:start + tf]))
+                start += tf
+        return posting_list
+
     @property
     def indexation(self):
-        return self._indexation
+        """
+        Compatibility view: set of the postings
+        :return:
+        """
+        return set(self.postings())
 
     @indexation.setter
     def indexation(self, doc: T):
@@ -196,9 +1049,93 @@ class PostingList(object):
         """
         if doc is not None:
             if type(doc) in {list, set}:
-                self._indexation.update(doc)
+                self._add_postings(doc)
             else:
-                self._indexation.add(doc)
+                self._add_postings([doc])
+
+    def _add_postings(self, postings: Iterable[T]):
+        """
+        Insert postings in the columns, keeping them sorted by document id.
+        A posting of a document already present replaces the old one.
+        :param postings: document ids, (doc, tf) or (doc, tf, position_deltas)
+        :return:
+        """
+        postings = list(postings)
+        if not postings:
+            return
+        first = postings[0]
+        if type(first) != int and self.tfs is None and not self.docs:
+            self.tfs = array('I')
+            if len(first) > 2:
+                self.positions = []
+        docs = [posting if type(posting) == int else posting[0] for posting in postings]
+        if (not self.docs or docs[0] > self.docs[-1]) and all(d1 < d2 for d1, d2 in zip(docs, docs[1:])):
+            # postings appended in document order: extend the columns directly
+            self.docs.extend(docs)
+            if self.tfs is not None:
+                self.tfs.extend(posting[1] for posting in postings)
+            if self.positions is not None:
+                self.positions.extend(posting[2] for posting in postings)
+            return
+        merged = {posting if type(posting) == int else posting[0]: posting for posting in self.postings()}
+        merged.update(zip(docs, postings))
+        self.docs = array('I', sorted(merged))
+        if self.tfs is not None:
+            self.tfs = array('I', (merged[doc][1] for doc in self.docs))
+        if self.positions is not None:
+            self.positions = [merged[doc][2] for doc in self.docs]
+
+
+class PostingCursor(object):
+    """
+    Cursor over a posting list in ascending document order.
+    doc is END once the cursor has passed the last posting.
+    """
+    __slots__ = ('docs', 'tfs', 'positions', 'index', 'doc')
+    END = 2 ** 32
+
+    def __init__(self, posting_list: PostingList):
+        self.docs = posting_list.docs
+        self.tfs = posting_list.tfs
+        self.positions = posting_list.positions
+        self.index = 0
+        self.doc = self.docs[0] if self.docs else self.END
+
+    def __repr__(self):
+        return 'PostingCursor(doc=%d, index=%d/%d)' % (self.doc, self.index, len(self.docs))
+
+    @property
+    def tf(self) -> int:
+        return self.tfs[self.index] if self.tfs is not None else 1
+
+    @property
+    def position_deltas(self):
+        return self.positions[self.index] if self.positions is not None else None
+
+    def exhausted(self) -> bool:
+        return self.doc == self.END
+
+    def next(self) -> int:
+        """
+        Move to the next posting
+        :return: the new current document id, END if there is none
+        """
+        self.index += 1
+        self.doc = self.docs[self.index] if self.index < len(self.docs) else self.END
+        return self.doc
+
+    def advance(self, target: int) -> int:
+        """
+        Move to the first posting whose document id is larger or equal to target, never backward
+        :param target: document id
+        :return: the new current document id, END if there is none
+        """
+        if target > self.doc:
+            self.index = bisect_left(self.docs, target, self.index)
+            self.doc = self.docs[self.index] if self.index < len(self.docs) else self.END
+        return self.doc
+
+    seek = advance
 
 
 class InvertedIndex(dict):
@@ -206,17 +1143,39 @@ class InvertedIndex(dict):
     Class for generating inverted index
     Inherit dict class: key is a term while value is a PostingList object
     """
+    T = TypeVar('T')
+
     def __init__(self):
         """
         doc_id: mapping from document id to document url name
         D: total document amount
         iitype: type of inverted index chosen in {'doc', 'freq', 'pos'}
+        shard_ranges: for an index merged from sub-collections, key: sub-collection,
+                      value: (first, last) global document ids of the sub-collection
+        norms: euclidean norm of the tf-idf vector of each document, indexed by document id
+        idf_table: key: term, value: idf
+        block_maxes: key: term, value: block-max metadata of its posting list, see compute_block_maxes
+        max_impact: largest idf * tf / norm_d of the postings, see get_max_impact
+        champions: key: term, value: tiers of its champion lists, see compute_champion_lists
+        treaps: key: term, value: its treap encoded by encode_treap, see compute_treaps
+        version: version of the content of the index, see file_version, a number for an index built in memory
+        cache: QueryCache shared by the indexes of the process, see attach_cache
         """
         super().__init__()
         self.doc_id = None
         # self.doc_bag = None
         self.D = 0
         self.iitype = 'null'
+        self.shard_ranges = dict()
+        self.norms = None
+        self.idf_table = None
+        self.block_maxes = None
+        self.max_impact = None
+        self.champions = None
+        self.treaps = None
+        self.version = next(INDEX_VERSIONS)
+        self.cache = None
+        self.cache_shard = None
 
     def __str__(self):
         """
@@ -233,48 +1192,256 @@ class InvertedIndex(dict):
             print('Keyword \'%s\' not found in document.' % item)
             return PostingList()
 
-    def get_inverted_index(self, doc_id: Dict, doc_bag: Dict, itype='freq'):
+    def get_inverted_index(self, doc_id: Dict, doc_bag: Dict, itype='freq', stop_words: Set[str] = None):
         """
         generate inverted index from a bag of tokens
         :param doc_id:
         :param doc_bag:
         :param itype:
+        :param stop_words: tokens left out of the inverted index
         :return:
         """
         self.doc_id = doc_id
         self.D = len(doc_id)
-        self._build_inverted_index(doc_bag, itype=itype)
+        self._build_inverted_index(doc_bag, itype=itype, stop_words=stop_words)
 
-    def _build_inverted_index(self, doc_bag: Dict[int, List[str]], itype='freq'):
+    def _build_inverted_index(self, doc_bag: Dict[int, List[str]], itype='freq', stop_words: Set[str] = None):
         """
 
         :param itype: 1-doc index
                      2-frequence index
                      3-position index
+        :param stop_words: tokens skipped while indexing, positions are counted without them
         :return:
         """
         if itype not in {'doc', 'freq', 'pos'}:
             raise ValueError('Indexation type not correct (doc/freq/pos).')
         self.iitype = itype
         print('Indexing documents...')
+        accumulators = defaultdict(list)  # key: term, value: postings appended in document order
         for doc, terms in tqdm(iterable=doc_bag.items(), total=self.D):
-            cnt = Counter(terms)
-            set_terms = set(terms)
-            for term in set_terms:
-                posting = PostingList()
-                if term in self.keys():
-                    posting = deepcopy(self.__getitem__(term))
-                posting.df += 1
-                if itype == 'doc':
-                    posting.indexation = doc
-                elif itype == 'freq':
-                    posting.indexation = (doc, cnt[term])
-                else:
-                    posting.indexation = (doc, cnt[term], ([i for i, t in enumerate(terms) if t == term]))
-                    # position of word (to do : of starting character)
-                self.__setitem__(term, posting)
+            for term, posting in self._document_postings(doc, terms, itype, stop_words):
+                accumulators[term].append(posting)
+        for term, postings in accumulators.items():
+            self.__setitem__(term, PostingList.from_postings(postings))
+        self.compute_statistics()
         print('Inverted index done.')
 
+    def compute_statistics(self):
+        """
+        Compute the idf of every term and the norm of every document vector, weights being tf * idf,
+        so that a vectorial query only has to multiply-add the postings of its terms.
+        An index without frequencies has no statistics.
+        Block maxima and champion lists, which depend on the norms, are computed again at first use.
+        :return:
+        """
+        self.block_maxes, self.max_impact, self.champions = None, None, None
+        if self.iitype not in {'freq', 'pos'}:
+            self.norms, self.idf_table = None, None
+            return
+        self.idf_table = dict()
+        square_norms = array('d', bytes(8 * (max(self.doc_id) + 1 if self.doc_id else 1)))
+        for term, posting in self.items():
+            idf = log10(self.D / posting.df)
+            self.idf_table[term] = idf
+            for doc, tf in zip(posting.docs, posting.tfs):
+                square_norms[doc] += (tf * idf) ** 2
+        self.norms = array('d', map(sqrt, square_norms))
+
+    def compute_block_maxes(self):
+        """
+        Split every posting list into blocks of BLOCK_MAX_SIZE postings and keep, for each block,
+        its last document id and its largest impact tf / document norm.
+        A document scores at most idf * w_q * impact / norm_q for a term, whatever the query.
+        :return:
+        """
+        norms = self.get_norms()
+        self.block_maxes = {term: self._block_max_of(posting, norms) for term, posting in self.items()}
+
+    @staticmethod
+    def _block_max_of(posting: PostingList, norms: array) -> Tuple[array, array]:
+        impacts = [tf / norms[doc] if norms[doc] else 0.0 for doc, tf in zip(posting.docs, posting.tfs)]
+        starts = range(0, len(impacts), BLOCK_MAX_SIZE)
+        return (array('I', (posting.docs[min(start + BLOCK_MAX_SIZE, len(impacts)) - 1] for start in starts)),
+                array('d', (max(impacts[start:start + BLOCK_MAX_SIZE]) for start in starts)))
+
+    def get_max_impact(self) -> float:
+        """
+        Largest impact idf * tf / norm_d of the postings, the scale of the quantized impacts of ImpactIndex.
+        It is stored at index time, and computed from the block maxima of every term for an index saved without it.
+        :return:
+        """
+        if getattr(self, 'max_impact', None) is None:
+            self.max_impact = self._max_impact_of_blocks()
+        return self.max_impact
+
+    def _max_impact_of_blocks(self) -> float:
+        return max((self.idf(term) * max(self.get_block_max(term)[1], default=0.0) for term in self.keys()),
+                   default=0.0)
+
+    def get_block_max(self, term: str) -> Tuple[array, array]:
+        """
+        Block-max metadata of a term, see compute_block_maxes
+        :param term:
+        :return: last document id of each block, largest impact of each block
+        """
+        if getattr(self, 'block_maxes', None) is None:
+            self.compute_block_maxes()
+        return self.block_maxes[term]
+
+    def compute_champion_lists(self):
+        """
+        Rank the postings of every term by descending tf, ties by document id, and cut them into tiers
+        of CHAMPION_TIER_SIZES postings: the first tier holds the champion list of the term.
+        Tiers are posting lists without positions.
+        :return:
+        """
+        self.champions = {term: self._champions_of(posting) for term, posting in self.items()}
+
+    @staticmethod
+    def _champions_of(posting: PostingList) -> Tuple[PostingList, ...]:
+        ranked = sorted(range(len(posting.docs)), key=lambda i: -posting.tfs[i])
+        tiers, start = [], 0
+        for size in CHAMPION_TIER_SIZES:
+            chosen = sorted(ranked[start:start + size])
+            start += size
+            tier = PostingList(len(chosen))
+            tier.docs = array('I', (posting.docs[i] for i in chosen))
+            tier.tfs = array('I', (posting.tfs[i] for i in chosen))
+            tiers.append(tier)
+        return tuple(tiers)
+
+    def get_champions(self, term: str) -> Tuple[PostingList, ...]:
+        """
+        Tiers of the champion lists of a term, see compute_champion_lists
+        :param term:
+        :return:
+        """
+        if getattr(self, 'champions', None) is None:
+            self.compute_champion_lists()
+        return self.champions[term]
+
+    def compute_treaps(self):
+        """
+        Build the treap of every posting list once, the tf of a document being its priority (1 without tf),
+        and keep it encoded as balanced parentheses with differential ids and priorities, see SuccinctTreap.
+        Only an index saved with its treaps builds them all, see save_inverted_index.
+        :return:
+        """
+        self.treaps = {term: encode_treap(posting.docs, posting.tfs) for term, posting in self.items()}
+
+    def get_treap(self, term: str) -> SuccinctTreap:
+        """
+        Treap of a term, see compute_treaps. Without the treaps of every term, the treap of the term is built
+        from its posting list. Either way it is kept in the cache if the index has one.
+        :param term:
+        :return:
+        """
+        if getattr(self, 'treaps', None) is None:
+            if term not in self:
+                raise KeyError(term)
+            return self._cached('treap', term, lambda: self._build_treap(self[term]), lambda treap: treap.nbytes)
+        return self._cached('succinct', term, lambda: SuccinctTreap(self.treaps[term]), lambda treap: treap.nbytes)
+
+    @staticmethod
+    def _build_treap(posting: PostingList) -> SuccinctTreap:
+        return SuccinctTreap(encode_treap(posting.docs, posting.tfs))
+
+    def attach_cache(self, cache: QueryCache, shard: str):
+        """
+        Keep the posting lists, treaps and, for a memory-mapped index, the term statistics read for the queries
+        in a cache shared by the indexes of the process, keyed by (shard, term, version of the index, kind)
+        :param cache:
+        :param shard: name of the index among the indexes sharing the cache
+        :return:
+        """
+        self.cache = cache
+        self.cache_shard = shard
+
+    def _cached(self, kind: str, term: str, build, size):
+        """
+        :param kind: 'postings', 'treap' or 'succinct', and 'idf', 'block_max' or 'champions' for a memory-mapped index
+        :param term:
+        :param build: function building the value if it is not cached
+        :param size: function giving the bytes of the value
+        :return:
+        """
+        cache = getattr(self, 'cache', None)
+        if cache is None:
+            return build()
+        return cache.get(self._cache_key(kind, term), build, size)
+
+    def _cache_key(self, kind: str, term: str) -> Tuple:
+        return self.cache_shard, term, self.version, kind
+
+    def get_norms(self) -> array:
+        """
+        Norms of the document vectors, computed at first use for an index saved without them
+        :return: array indexed by document id, None for a 'doc' index
+        """
+        if getattr(self, 'norms', None) is None:
+            self.compute_statistics()
+        return self.norms
+
+    @staticmethod
+    def _document_postings(doc: int, terms: List[str], itype='freq',
+                           stop_words: Set[str] = None) -> Iterable[Tuple[str, T]]:
+        """
+        Get the posting of every distinct term of a document
+        :param doc: document id
+        :param terms: tokens of the document
+        :param itype: type of inverted index: doc/freq/pos
+        :param stop_words: tokens skipped
+        :return: (term, posting) pairs, in order of first appearance of the term
+        """
+        if itype == 'pos':
+            positions = InvertedIndex._collect_positions(terms, stop_words)
+            cnt = {term: len(term_positions) for term, term_positions in positions.items()}
+        else:
+            cnt = Counter(terms)
+            if stop_words:
+                for stop_word in stop_words.intersection(cnt):
+                    del cnt[stop_word]
+        for term, tf in cnt.items():
+            if itype == 'doc':
+                yield term, doc
+            elif itype == 'freq':
+                yield term, (doc, tf)
+            else:
+                yield term, (doc, tf, PositionDeltas.encode(positions[term]))
+
+    @staticmethod
+    def _collect_positions(terms: List[str], stop_words: Set[str] = None) -> Dict[str, List[int]]:
+        """
+        Get the positions of every term of a document in one enumeration
+        position of word (to do : of starting character)
+        :param terms: tokens of the document
+        :param stop_words: tokens skipped, as if they were not in the document
+        :return: key: term, value: ascending positions of the term
+        """
+        positions = defaultdict(list)
+        if not stop_words:
+            for i, term in enumerate(terms):
+                positions[term].append(i)
+            return positions
+        i = 0
+        for term in terms:
+            if term not in stop_words:
+                positions[term].append(i)
+                i += 1
+        return positions
+
+    def get_shard(self, doc: int) -> str:
+        """
+        Get the sub-collection of a global document id of a merged index
+        :param doc:
+        :return: name of the sub-collection, None if the index is not merged or the id out of range
+        """
+        for shard, (first, last) in getattr(self, 'shard_ranges', dict()).items():
+            if first <= doc <= last:
+                return shard
+        return None
+
     def get_doc_url(self, doc_key) -> str:
         """
         From document id get document url name and its sub-collection
@@ -298,11 +1465,429 @@ class InvertedIndex(dict):
         :param term:
         :return:
         """
+        idf_table = getattr(self, 'idf_table', None)
+        if idf_table is not None and term in idf_table:
+            return idf_table[term]
         try:
-            return log10(self.D / self.__getitem__(term).df)
+            return log10(self.D / self.df(term))
         except KeyError:
             print('Keyword not found.')
 
+    def df(self, term: str) -> int:
+        """
+        document frequency of a term
+        :param term:
+        :return:
+        """
+        return self.__getitem__(term).df
+
+
+class MappedInvertedIndex(InvertedIndex):
+    """
+    Inverted index in the binary format written by save_binary_index.
+    The lexicon and the posting file are memory-mapped: opening costs nothing,
+    a term is found by binary search in the lexicon and its postings are only decoded
+    when a query asks for it. The pages are shared by every process opening the same files.
+    """
+    def __init__(self, lex_path: str):
+        """
+        :param lex_path: lexicon file, the posting file has the same name with extension POSTINGS_EXT
+        """
+        super().__init__()
+        self.path = lex_path
+        self.version = file_version(lex_path)
+        self._treaps = WeakValueDictionary()  # key: term, value: SuccinctTreap read in place in the posting file
+        self._lex_file = open(lex_path, 'rb')
+        self._lex = mmap.mmap(self._lex_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._post_file = open(os.path.splitext(lex_path)[0] + POSTINGS_EXT, 'rb')
+        self._post = mmap.mmap(self._post_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_len = BINARY_HEADER.unpack_from(self._lex, 0)
+        if magic != LEXICON_MAGIC or version != BINARY_FORMAT_VERSION \
+                or self._post[:len(POSTINGS_MAGIC)] != POSTINGS_MAGIC:
+            self.close()
+            raise ValueError('Binary inverted index format not supported: %s' % lex_path)
+        offset = BINARY_HEADER.size
+        header = json.loads(self._lex[offset:offset + header_len].decode('utf-8'))
+        offset += header_len
+        self.iitype, self.D = header['iitype'], header['D']
+        self.shard_ranges = {shard: tuple(ids) for shard, ids in header.get('shard_ranges', dict()).items()}
+        self.codec = get_codec(header['codec'])
+        self._term_num = header['term_num']
+        self._doc_id_span = (header['doc_id_offset'], header['doc_id_len'])
+        self._doc_id = None
+        self._norms_span = (header.get('norms_offset', 0), header.get('norms_len', 0))
+        self._block_max_offset = header.get('block_max_offset')
+        self._champion_offset = header.get('champion_offset')
+        if tuple(header.get('champion_tier_sizes', CHAMPION_TIER_SIZES)) != CHAMPION_TIER_SIZES:
+            self._champion_offset = None
+        self._treap_offset = header.get('treap_offset')
+        self.max_impact = header.get('max_impact')
+        self._entries_offset = offset
+        self._pool_offset = offset + self._term_num * LEXICON_ENTRY.size
+
+    @property
+    def doc_id(self) -> Dict:
+        """
+        mapping from document id to document url name, read at first use
+        :return:
+        """
+        if self._doc_id is None and getattr(self, '_doc_id_span', None) is not None:
+            start, length = self._doc_id_span
+            self._doc_id = {int(doc): url for doc, url in json.loads(self._post[start:start + length]).items()}
+        return self._doc_id
+
+    @doc_id.setter
+    def doc_id(self, doc_id: Dict):
+        self._doc_id = doc_id
+
+    def close(self):
+        cache = getattr(self, 'cache', None)
+        for term, treap in list(self._treaps.items()):  # released views must not be served from the cache
+            treap.release()
+            if cache is not None:
+                cache.discard(self._cache_key('succinct', term))
+        self._treaps.clear()
+        for mapped in (self._lex, self._post, self._lex_file, self._post_file):
+            mapped.close()
+
+    def _entry(self, i: int) -> Tuple:
+        return LEXICON_ENTRY.unpack_from(self._lex, self._entries_offset + i * LEXICON_ENTRY.size)
+
+    def _term(self, i: int) -> bytes:
+        term_offset, term_len = self._entry(i)[:2]
+        start = self._pool_offset + term_offset
+        return self._lex[start:start + term_len]
+
+    def _search(self, term: str) -> int:
+        """
+        Binary search of a term in the lexicon
+        :param term:
+        :return: rank of the term in the lexicon, -1 if not found
+        """
+        key = term.encode('utf-8')
+        low, high = 0, self._term_num
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._term_num and self._term(low) == key:
+            return low
+        return -1
+
+    def _find(self, term: str):
+        """
+        :param term:
+        :return: lexicon entry of the term, None if not found
+        """
+        rank = self._search(term)
+        return self._entry(rank) if rank >= 0 else None
+
+    def _decode(self, entry: Tuple) -> PostingList:
+        _, _, df, offset, docs_len, tfs_len, positions_len = entry
+        data = []
+        for length in (docs_len, tfs_len, positions_len):
+            if length == ABSENT_COLUMN:
+                data.append(None)
+            else:
+                data.append(self._post[offset:offset + length])
+                offset += length
+        return PostingList.decode(df, tuple(data), self.codec)
+
+    def __getitem__(self, item):
+        entry = self._find(item)
+        if entry is None:
+            print('Keyword \'%s\' not found in document.' % item)
+            return PostingList()
+        return self._cached('postings', item, lambda: self._decode(entry), PostingList.nbytes)
+
+    def get(self, item, default=None):
+        entry = self._find(item)
+        return default if entry is None else self._cached('postings', item, lambda: self._decode(entry),
+                                                          PostingList.nbytes)
+
+    def df(self, term: str) -> int:
+        entry = self._find(term)
+        return 0 if entry is None else entry[2]
+
+    def idf(self, term: str) -> float:
+        return self._cached('idf', term, lambda: log10(self.D / self.df(term)), lambda idf: 8)
+
+    def get_norms(self) -> array:
+        """
+        Norms of the document vectors, read at first use
+        :return: array indexed by document id, None for a 'doc' index
+        """
+        if self.norms is None and self._norms_span[1]:
+            start, length = self._norms_span
+            self.norms = decode_doubles(self._post[start:start + length])
+        return self.norms
+
+    def get_block_max(self, term: str) -> Tuple[array, array]:
+        """
+        Block-max metadata of a term, read from the posting file without decoding the postings
+        :param term:
+        :return: last document id of each block, largest impact of each block
+        """
+        return self._cached('block_max', term, lambda: self._read_block_max(term),
+                            lambda block_max: sum(column.itemsize * len(column) for column in block_max))
+
+    def _read_block_max(self, term: str) -> Tuple[array, array]:
+        rank = self._search(term)
+        if rank < 0:
+            raise KeyError(term)
+        if self._block_max_offset is None:
+            return self._block_max_of(self._decode(self._entry(rank)), self.get_norms())
+        offset = self._block_max_offset
+        first, last = struct.unpack_from('<II', self._post, offset + 4 * rank)
+        block_num = struct.unpack_from('<I', self._post, offset + 4 * self._term_num)[0]
+        last_docs_offset = offset + 4 * (self._term_num + 1)
+        maxima_offset = last_docs_offset + 4 * block_num
+        raw = get_codec('raw')
+        return (raw.decode(self._post[last_docs_offset + 4 * first:last_docs_offset + 4 * last]),
+                decode_doubles(self._post[maxima_offset + 8 * first:maxima_offset + 8 * last]))
+
+    def get_champions(self, term: str) -> Tuple[PostingList, ...]:
+        """
+        Tiers of the champion lists of a term, read from the posting file without decoding the postings
+        :param term:
+        :return:
+        """
+        return self._cached('champions', term, lambda: self._read_champions(term),
+                            lambda tiers: sum(tier.nbytes() for tier in tiers))
+
+    def _read_champions(self, term: str) -> Tuple[PostingList, ...]:
+        rank = self._search(term)
+        if rank < 0:
+            raise KeyError(term)
+        if self._champion_offset is None:
+            return self._champions_of(self._decode(self._entry(rank)))
+        entry = CHAMPION_ENTRY.unpack_from(self._post, self._champion_offset + rank * CHAMPION_ENTRY.size)
+        offset = self._champion_offset + self._term_num * CHAMPION_ENTRY.size + entry[0]
+        tiers = []
+        for i in range(1, len(entry), 3):
+            count, docs_len, tfs_len = entry[i:i + 3]
+            data = (self._post[offset:offset + docs_len], self._post[offset + docs_len:offset + docs_len + tfs_len])
+            tiers.append(PostingList.decode(count, data + (None,), self.codec))
+            offset += docs_len + tfs_len
+        return tuple(tiers)
+
+    def get_treap(self, term: str) -> SuccinctTreap:
+        """
+        Treap of a term, navigated in the memory-mapped posting file without being decoded,
+        or built from its posting list for an index saved without treaps
+        :param term:
+        :return:
+        """
+        rank = self._search(term)
+        if rank < 0:
+            raise KeyError(term)
+        if self._treap_offset is None:
+            return self._cached('treap', term, lambda: self._build_treap(self._decode(self._entry(rank))),
+                                lambda treap: treap.nbytes)
+        return self._cached('succinct', term, lambda: self._read_treap(term, rank), lambda treap: treap.nbytes)
+
+    def _read_treap(self, term: str, rank: int) -> SuccinctTreap:
+        offset = TREAP_ENTRY.unpack_from(self._post, self._treap_offset + rank * TREAP_ENTRY.size)[0]
+        treap = SuccinctTreap(self._post, self._treap_offset + self._term_num * TREAP_ENTRY.size + offset)
+        self._treaps[term] = treap  # released by close
+        return treap
+
+    def __contains__(self, item):
+        return self._find(item) is not None
+
+    def __len__(self):
+        return self._term_num
+
+    def __iter__(self):
+        for i in range(self._term_num):
+            yield self._term(i).decode('utf-8')
+
+    def keys(self):
+        return MappedKeys(self)
+
+    def values(self):
+        for i in range(self._term_num):
+            yield self._decode(self._entry(i))
+
+    def items(self):
+        for i in range(self._term_num):
+            yield self._term(i).decode('utf-8'), self._decode(self._entry(i))
+
+    def __str__(self):
+        return '\nIndexation type = %s, Document amount = %d, Vocabulary amount = %d, Mapped from %s'\
+               % (self.iitype, self.D, len(self), self.path)
+
+
+class MappedKeys(object):
+    """
+    Keys view of a MappedInvertedIndex, answering membership without reading the whole lexicon
+    """
+    def __init__(self, ii: MappedInvertedIndex):
+        self._ii = ii
+
+    def __contains__(self, item):
+        return item in self._ii
+
+    def __iter__(self):
+        return iter(self._ii)
+
+    def __len__(self):
+        return len(self._ii)
+
+
+class SpimiIndexer(object):
+    """
+    Block-based indexer (single-pass in-memory indexing) for collections that do not fit in memory.
+    Documents are streamed one at a time: their postings are accumulated per term until the memory budget
+    is reached, then the block is sorted by term and spilled to disk as a run.
+    The runs are finally k-way merged into an inverted index.
+    """
+    POSTING_BYTES = {'doc': 40, 'freq': 100, 'pos': 180}  # approximate memory cost of one posting
+    POSITION_BYTES = 4  # memory cost of one delta-encoded position
+    TERM_BYTES = 150  # approximate memory cost of a new term in the block
+
+    def __init__(self, itype='freq', memory_budget: int = 64 * 2 ** 20, tmp_dir: str = None):
+        """
+        :param itype: type of inverted index: doc/freq/pos
+        :param memory_budget: bytes of postings held in memory before a block is spilled
+        :param tmp_dir: folder where runs are spilled, default to the system temporary folder
+        """
+        if itype not in {'doc', 'freq', 'pos'}:
+            raise ValueError('Indexation type not correct (doc/freq/pos).')
+        self.itype = itype
+        self.memory_budget = memory_budget
+        self.tmp_dir = tmp_dir
+        self.runs = []  # paths of the spilled runs, in document order
+        self._block = defaultdict(list)  # key: term, value: postings of the current block
+        self._block_bytes = 0
+
+    def add_document(self, doc: int, terms: List[str]):
+        """
+        Add the postings of a document into the current block, spill it when the memory budget is reached
+        :param doc: document id, larger than the ids already added
+        :param terms: tokens of the document
+        :return:
+        """
+        for term, posting in InvertedIndex._document_postings(doc, terms, self.itype):
+            postings = self._block[term]
+            if not postings:
+                self._block_bytes += self.TERM_BYTES + len(term)
+            postings.append(posting)
+            self._block_bytes += self.POSTING_BYTES[self.itype]
+            if self.itype == 'pos':
+                self._block_bytes += self.POSITION_BYTES * posting[1]
+        if self._block_bytes >= self.memory_budget:
+            self._spill()
+
+    def _spill(self):
+        """
+        Write the current block on disk as a run of (term, postings) sorted by term
+        :return:
+        """
+        if not self._block:
+            return
+        fd, path = tempfile.mkstemp(suffix='.run', dir=self.tmp_dir)
+        with os.fdopen(fd, 'wb') as runf:
+            for term in sorted(self._block):
+                pkl.dump((term, self._block[term]), runf)
+        self.runs.append(path)
+        self._block = defaultdict(list)
+        self._block_bytes = 0
+
+    @staticmethod
+    def _read_run(path: str) -> Iterable[Tuple[str, List]]:
+        with open(path, 'rb') as runf:
+            while True:
+                try:
+                    yield pkl.load(runf)
+                except EOFError:
+                    return
+
+    def merge(self, doc_id: Dict, stop_words: Set[str] = None) -> InvertedIndex:
+        """
+        k-way merge the runs into an inverted index, the runs are deleted afterwards.
+        The positions of a 'pos' index are then renumbered as if the stop words were not in the documents.
+        :param doc_id: mapping from document id to document url name
+        :param stop_words: terms left out of the inverted index
+        :return:
+        """
+        self._spill()
+        ii = InvertedIndex()
+        ii.doc_id = doc_id
+        ii.D = len(doc_id)
+        ii.iitype = self.itype
+        stop_positions = defaultdict(list)  # key: document id, value: positions of its stop words
+        print('Merging %d runs...' % len(self.runs))
+        try:
+            # heapq.merge is stable: postings of a term come out run after run, i.e. in document order
+            merged = heapq.merge(*[self._read_run(path) for path in self.runs], key=itemgetter(0))
+            for term, group in groupby(merged, key=itemgetter(0)):
+                if stop_words and term in stop_words:
+                    if self.itype == 'pos':
+                        for _, run_postings in group:
+                            for doc, _, deltas in run_postings:
+                                stop_positions[doc] += deltas.decode()
+                    continue
+                postings = []
+                for _, run_postings in group:
+                    postings += run_postings
+                ii[term] = PostingList.from_postings(postings)
+        finally:
+            for path in self.runs:
+                os.remove(path)
+            self.runs = []
+        if stop_positions:
+            self._skip_stop_words(ii, stop_positions)
+        ii.compute_statistics()
+        print('Inverted index done.')
+        return ii
+
+    @staticmethod
+    def _skip_stop_words(ii: InvertedIndex, stop_positions: Dict[int, List[int]]):
+        """
+        Renumber the positions of a 'pos' index as if the stop words were not in the documents,
+        the way InvertedIndex._collect_positions numbers them: a position moves back by the number
+        of stop words before it
+        :param ii:
+        :param stop_positions: key: document id, value: positions of its stop words
+        :return:
+        """
+        for stops in stop_positions.values():
+            stops.sort()
+        for posting in ii.values():
+            for i, doc in enumerate(posting.docs):
+                stops = stop_positions.get(doc)
+                if stops:
+                    posting.positions[i] = PositionDeltas.encode([position - bisect_left(stops, position)
+                                                                  for position in posting.positions[i].decode()])
+
+    def index_repository(self, collection_dir: str, repo: str, do_rm_stpw=False, stop_word_threshold: int = 100,
+                         position: int = 0, report_path: str = None) -> InvertedIndex:
+        """
+        Stream the documents of a sub-collection into an inverted index.
+        Stop words are only known once every document is read, so they are left out at merge time,
+        where the positions of a 'pos' index are renumbered without them.
+        :param collection_dir: absolute path of the collection folder
+        :param repo: name of the sub-collection
+        :param do_rm_stpw: bool for if stop words will be removed
+        :param stop_word_threshold: Maximal number of stop words which will be removed
+        :param position: line of the progress bar
+        :param report_path: image file where the bar chart of the stop words is saved, None for no report
+        :return:
+        """
+        doc_id = dict()
+        counter = Counter()
+        for doc, url, tokens in iter_repo_documents(collection_dir, repo, counter, do_rm_stpw, position):
+            doc_id[doc] = url
+            self.add_document(doc, tokens)
+        stop_words = None
+        if do_rm_stpw:
+            stop_words = get_stop_words(counter, threshold=stop_word_threshold, method='from-known',
+                                        report_path=report_path)
+        return self.merge(doc_id, stop_words)
+
 
 if __name__ == '__main__':
     from Restitution_of_article.Treap import Treap, Gtree
@@ -316,7 +1901,7 @@ if __name__ == '__main__':
         tdict = {}
         for term, posting in _ii.items():
             TREAP = Treap()
-            for pair in posting.indexation:
+            for pair in posting.postings():
                 TREAP.insert(deepcopy(pair))
             print("treap height = ", TREAP.height)
 
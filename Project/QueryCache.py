@@ -0,0 +1,119 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: QueryCache.py
+@time: 2020/5/6
+@desc: Cache of the posting lists, treaps and term statistics read for the queries of a process,
+       within a budget of bytes, evicted by Greedy-Dual-Size-Frequency (Cherkasova 1998).
+"""
+import heapq
+from itertools import count
+from time import perf_counter
+from typing import Callable, Hashable, TypeVar
+
+T = TypeVar('T')
+
+
+class QueryCache(object):
+    """
+    Values are keyed by (shard, term, index version, kind), see InvertedIndex.attach_cache.
+    The priority of a value is the clock plus its number of uses times its build cost per byte:
+    the value of lowest priority is evicted first and the clock takes its priority,
+    so that values which are not used any more age against the new ones.
+    Values of equal priority are evicted least recently used first.
+    """
+    def __init__(self, budget: int = 64 * 2 ** 20):
+        """
+        :param budget: maximal number of bytes of the cached values
+        """
+        self.budget = budget
+        self.nbytes = 0
+        self.clock = 0.0
+        self.entries = dict()  # key: cache key, value: [value, nbytes, cost, uses, priority, stamp]
+        self._heap = []  # (priority, stamp, key) of the entries, stale when the entry has another stamp
+        self._stamps = count()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0
+
+    def __str__(self):
+        return 'Query cache: %d hits, %d misses, %d evictions, hit rate %.2f%%, %.1f/%.1f MB in %d entries'\
+               % (self.hits, self.misses, self.evictions, 100 * self.hit_rate, self.nbytes / 2 ** 20,
+                  self.budget / 2 ** 20, len(self.entries))
+
+    def get(self, key: Hashable, build: Callable[[], T], size: Callable[[T], int]) -> T:
+        """
+        Cached value of a key, built and cached if missing.
+        A value larger than the budget is built but not cached.
+        :param key:
+        :param build: function building the value
+        :param size: function giving the bytes of a value
+        :return:
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            entry[3] += 1
+            self._prioritize(key, entry)
+            return entry[0]
+        self.misses += 1
+        start = perf_counter()
+        value = build()
+        cost = perf_counter() - start
+        nbytes = size(value)
+        if nbytes > self.budget:
+            return value
+        while self.nbytes + nbytes > self.budget:
+            self._evict()
+        entry = [value, nbytes, cost, 1, 0.0, 0]
+        self.entries[key] = entry
+        self.nbytes += nbytes
+        self._prioritize(key, entry)
+        return value
+
+    def discard(self, key: Hashable):
+        """
+        Remove a value from the cache, if it is cached
+        :param key:
+        :return:
+        """
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+
+    def _prioritize(self, key: Hashable, entry: list):
+        entry[4] = self.clock + entry[3] * entry[2] / max(entry[1], 1)
+        entry[5] = next(self._stamps)
+        heapq.heappush(self._heap, (entry[4], entry[5], key))
+        if len(self._heap) > 2 * len(self.entries) + 64:  # drop the stale heap items
+            self._heap = [(cached[4], cached[5], cached_key) for cached_key, cached in self.entries.items()]
+            heapq.heapify(self._heap)
+
+    def _evict(self):
+        while True:
+            priority, stamp, key = heapq.heappop(self._heap)
+            entry = self.entries.get(key)
+            if entry is not None and entry[5] == stamp:
+                break
+        del self.entries[key]
+        self.nbytes -= entry[1]
+        self.clock = priority
+        self.evictions += 1
+
+
+if __name__ == '__main__':
+    cache = QueryCache(budget=100)
+    for key in ['a', 'b', 'a', 'c', 'a', 'd', 'b']:
+        cache.get(key, lambda: key * 40, len)
+    print(cache, sorted(cache.entries))
@@ -7,13 +7,19 @@
 @desc: Different query modules here
 """
 from tt import BooleanExpression
-from Project.InvertedIndex import PostingList, InvertedIndex, clean_lemmatize_count
+from Project.InvertedIndex import PostingList, InvertedIndex, clean_lemmatize_count, CHAMPION_TIER_SIZES
 from typing import List, TypeVar, Tuple, Iterable, Dict
 from abc import ABC, abstractmethod
 from collections import Counter
 from math import sqrt
-from Restitution_of_article.Treap import Treap
+from array import array
 from Restitution_of_article.FastQuery import intersection, union
+from Restitution_of_article.TopK import TopK
+from Project.DynamicPruning import wand, maxscore
+from Project.ImpactOrdered import ImpactIndex, score_at_a_time
+from Project.BooleanMerge import intersect, union as merge_union, difference
+from Project.RoaringBitmap import RoaringBitmap
+from Project.BooleanPlanner import compile_plan, evaluate, PlanNode, TermNode, AndNode, OrNode, NotNode
 
 
 def clean_query(q: str) -> str:
@@ -49,40 +55,82 @@ class QueryModule(object):
 
 
 class BoolModule(QueryModule):
-    def __init__(self, query: str):
+    def __init__(self, query: str, bitmap_df: int = None, explain: bool = False):
+        """
+        :param query:
+        :param bitmap_df: df from which posting lists are evaluated as compressed bitmaps, None for sorted arrays only
+        :param explain: bool for if the plan of each query is printed before it is evaluated,
+                        then the postings it touched
+        """
         super().__init__(query)
+        self.bitmap_df = bitmap_df
+        self.explain = explain
+        self.plan = None  # plan of the last query
+        self.bitmaps = dict()  # key: (id of an inverted index, term), value: RoaringBitmap of its posting list
+        self.universes = dict()  # key: id of an inverted index, value: all its document ids
 
     def __str__(self):
-        return 'Using BoolModule. Compatible with boolean queries\nwith and/or/not.'
+        return 'Using BoolModule%s. Compatible with boolean queries\nwith and/or/not.' \
+               % ('' if self.bitmap_df is None else ' with bitmaps from df %d' % self.bitmap_df)
 
     def get_result(self, inverted_index: InvertedIndex, nbest: int) -> List[str]:
-        bool_operators = {'and', 'or', 'not'}
         try:
             postfix = self._transform_bool_query_to_postfix()
         except:
             postfix = self._transform_query_to_boolean()
-        operands = []  # list of posting lists
-        while postfix:
-            oper = postfix.pop(0)
-            if oper.lower() not in bool_operators:
-                operands.append(inverted_index[oper.lower()])
-            else:
-                try:
-                    term2 = operands.pop(-1)
-                    term1 = operands.pop(-1)
-                    new_operand = PostingList()
-                    new_operand.indexation = self._merge_postings_list(oper, term1, term2)
-                    operands.append(new_operand)
-                    if oper.lower() == 'not':
-                        operands.append(new_operand)
-                except IndexError:
-                    default_operand = PostingList()
-                    default_operand.indexation = self._merge_postings_list('')
-                    operands.append(default_operand)
-        for i in operands.pop(-1).indexation:
+        self.plan = compile_plan(postfix, inverted_index, self._get_universe(inverted_index))
+        if self.explain:
+            print('\n'.join(self.plan.explain(evaluated=False)))
+        if self.bitmap_df is None:
+            docs = evaluate(self.plan)  # streamed by cursors
+        else:
+            docs = self._materialize(inverted_index, self.plan)
+            docs = docs.to_array() if isinstance(docs, RoaringBitmap) else docs
+        for i in docs:
             # print(inverted_index.get_doc_url(i))
 
             yield inverted_index.get_doc_url(i)
+        if self.explain:
+            print('%d postings touched' % self.plan.touched())
+
+    def _get_universe(self, ii: InvertedIndex) -> array:
+        if id(ii) not in self.universes:
+            self.universes[id(ii)] = array('I', sorted(ii.doc_id)) if ii.doc_id else array('I')
+        return self.universes[id(ii)]
+
+    def _materialize(self, ii: InvertedIndex, node: PlanNode):
+        """
+        Evaluate a plan operator by operator, posting lists whose df reaches bitmap_df being RoaringBitmaps
+        kept for next queries. An and stops at its first empty intermediate result.
+        :param ii:
+        :param node:
+        :return: document ids in ascending order, as array or RoaringBitmap
+        """
+        if isinstance(node, TermNode):
+            node.read = node.cost
+            key = (id(ii), node.term)
+            if key not in self.bitmaps and self.bitmap_df is not None and node.cost >= self.bitmap_df:
+                self.bitmaps[key] = RoaringBitmap.from_docs(node.posting_list.docs)
+            return self.bitmaps.get(key, node.posting_list.docs)
+        if isinstance(node, AndNode):
+            docs = self._materialize(ii, node.children[0])
+            for child in node.children[1:]:
+                if not len(docs):
+                    return docs
+                docs = self._merge_docs('and', docs, self._materialize(ii, child))
+            for child in node.excluded:
+                if not len(docs):
+                    return docs
+                docs = self._merge_docs('not', docs, self._materialize(ii, child))
+            return docs
+        if isinstance(node, OrNode):
+            docs = self._materialize(ii, node.children[0])
+            for child in node.children[1:]:
+                docs = self._merge_docs('or', docs, self._materialize(ii, child))
+            return docs
+        if isinstance(node, NotNode):
+            return self._merge_docs('not', self._materialize(ii, node.universe), self._materialize(ii, node.children[0]))
+        return array('I')
 
     def _transform_query_to_boolean(self) -> List:
         """
@@ -98,59 +146,122 @@ class BoolModule(QueryModule):
         """
         return BooleanExpression(self.query.lower()).postfix_tokens
 
-    def _merge_postings_list(self, bool_operator: str,
-                             posting_term1: PostingList = None, posting_term2: PostingList = None) -> List:
+    def _merge_docs(self, bool_operator: str, docs1, docs2):
         """
-        Get list of document ids in combining two posting lists according to tne boolean operator
-        :param bool_operator:
-        :param posting_term1:
-        :param posting_term2:
-        :return:
+        Get document ids in combining two operands according to tne boolean operator,
+        merged as sorted arrays by Project.BooleanMerge, or as RoaringBitmaps if any of them is one
+        :param bool_operator: and/or/not, not giving the documents of docs1 not in docs2
+        :param docs1: array or RoaringBitmap
+        :param docs2: array or RoaringBitmap
+        :return: array or RoaringBitmap
         """
-        docs1 = [pos[0] if type(pos) != int else pos for pos in posting_term1.indexation]\
-            if posting_term1 is not None else []
-        docs2 = [pos[0] if type(pos) != int else pos for pos in posting_term2.indexation]\
-            if posting_term2 is not None else []
-        if bool_operator.lower() == 'and':
-            return [doc for doc in docs1 if doc in docs2]
+        if isinstance(docs1, RoaringBitmap) or isinstance(docs2, RoaringBitmap):
+            bitmap1 = docs1 if isinstance(docs1, RoaringBitmap) else RoaringBitmap.from_docs(docs1)
+            bitmap2 = docs2 if isinstance(docs2, RoaringBitmap) else RoaringBitmap.from_docs(docs2)
+            if bool_operator.lower() == 'and':
+                return bitmap1 & bitmap2
+            elif bool_operator.lower() == 'or':
+                return bitmap1 | bitmap2
+            elif bool_operator.lower() == 'not':
+                return bitmap1 - bitmap2
+        elif bool_operator.lower() == 'and':
+            return intersect(docs1, docs2)
         elif bool_operator.lower() == 'or':
-            return list(set(docs1 + docs2))
+            return merge_union(docs1, docs2)
         elif bool_operator.lower() == 'not':
-            return [d for d in docs1 if d not in docs2]
-        else:
-            raise ValueError('Operator not found (and/or/not)')
+            return difference(docs1, docs2)
+        raise ValueError('Operator not found (and/or/not)')
 
 
 class VectorialModule(QueryModule):
 
-    def __init__(self, query: str):
+    def __init__(self, query: str, approximate: bool = False):
+        """
+        :param query:
+        :param approximate: bool for if only the champion lists of the query terms are scored, tier after tier,
+                            the full posting lists being scored when the tiers give less than nbest results
+                            and leave postings of a query term out
+        """
         super().__init__(query)
+        self.approximate = approximate
+        self.fallback = False  # True if the last approximate query was scored on the full posting lists
 
     def __str__(self):
-        return 'Using VectorialModule.'
+        return 'Using VectorialModule%s.' % (' on champion lists' if self.approximate else '')
 
     def get_result(self, ii: InvertedIndex, nbest: int) -> List[str]:
+        scores = None
+        if self.approximate:
+            scores = dict()
+            for tier in range(len(CHAMPION_TIER_SIZES)):  # tiers are disjoint, each one adds to the former scores
+                self.add_scores(ii, scores, tier)
+                if len(scores) >= nbest:
+                    break
+            else:
+                if any(sum(len(tier) for tier in ii.get_champions(term)) < ii.df(term)
+                       for term in self.get_query_vector() if term in ii.keys()):
+                    scores = None  # the tiers miss postings that could give more answers
+            self.fallback = scores is None
+        if scores is None:
+            scores = self.get_scores(ii)
+        else:
+            scores = self.get_cosines(ii, scores)
+        for doc, score in self.get_descending_scores(scores, nbest):
+            # print("Local doc id = %s, score = %.5f" % (str(doc), score))
+            yield ii.get_doc_url(doc)
+
+    def get_scores(self, ii: InvertedIndex, tiers: int = None) -> Dict[int, float]:
+        """
+        Cosine similarity between the query and every document sharing a term with it.
+        Idf and document norms come from the index, so each posting costs one multiply-add.
+        :param ii:
+        :param tiers: number of tiers of champion lists scored instead of the full posting lists, None for all
+        :return: key: document id, value: score
+        """
+        scores = dict()  # document scores
+        for tier in (None,) if tiers is None else range(tiers):
+            self.add_scores(ii, scores, tier)
+        return self.get_cosines(ii, scores)
+
+    def add_scores(self, ii: InvertedIndex, scores: Dict[int, float], tier: int = None):
+        """
+        Add the dot products of the query with the postings of one tier of champion lists,
+        or of the full posting lists, to the scores
+        :param ii:
+        :param scores: key: document id, value: dot product, updated
+        :param tier: index of the tier of champion lists, None for the full posting lists
+        :return:
+        """
         if ii.iitype not in {'freq', 'pos'}:
             raise ValueError('Inverted index must has frequencies for vectorial module.')
-        norm_q = 0  # query norm
-        norm_d = dict()  # document norms
-        scores = dict()  # document scores
-        vector_q = self.get_query_vector()  # query vector
-        for term_q, tf_q in vector_q.items():  # loop on each term in query
+        for term_q, tf_q in self.get_query_vector().items():  # loop on each term in query
             if term_q not in ii.keys():
                 continue
-            w_q = tf_q * ii.idf(term_q)  # query term weight = tf * idf
-            norm_q += w_q * w_q  # norm = sqrt(sum(weight^2))
-            for doc_pos in ii[term_q].indexation:
-                doc, tf_d = doc_pos[0], doc_pos[1]
-                w_d = tf_d * ii.idf(term_q)  # document term weight = tf * idf
-                self.dict_accumulate(dict=norm_d, key=doc, acc=w_d * w_d)  # update document norm
-                self.dict_accumulate(dict=scores, key=doc, acc=w_q * w_d)  # update document weight
-        for doc in scores.keys():
-            scores[doc] /= (sqrt(norm_q) * sqrt(norm_d[doc]))  # cosine similarity
-        for doc, score in self.get_descending_scores(scores, nbest):
-            # print("Local doc id = %s, score = %.5f" % (str(doc), score))
-            yield ii.get_doc_url(doc)
+            idf = ii.idf(term_q)
+            weight = tf_q * idf * idf  # w_q * w_d = tf_q * idf * tf_d * idf = weight * tf_d
+            posting = ii[term_q] if tier is None else ii.get_champions(term_q)[tier]
+            for doc, tf_d in zip(posting.docs, posting.tfs):
+                scores[doc] = scores.get(doc, 0.0) + weight * tf_d
+        return scores
+
+    def get_cosines(self, ii: InvertedIndex, scores: Dict[int, float]) -> Dict[int, float]:
+        """
+        Divide the dot products by the query and document norms, idf and document norms coming from the index
+        :param ii:
+        :param scores: key: document id, value: dot product, updated
+        :return: key: document id, value: cosine similarity
+        """
+        norms = ii.get_norms()  # document norms of the whole tf-idf vectors
+        norm_q = 0  # query norm
+        for term_q, tf_q in self.get_query_vector().items():
+            if term_q in ii.keys():
+                w_q = tf_q * ii.idf(term_q)  # query term weight = tf * idf
+                norm_q += w_q * w_q  # norm = sqrt(sum(weight^2))
+        norm_q = sqrt(norm_q)
+        for doc, score in scores.items():
+            norm = norm_q * norms[doc]
+            scores[doc] = score / norm if norm else 0.0  # cosine similarity
+        return scores
 
     def get_query_vector(self) -> Counter:
         """
@@ -161,26 +272,74 @@ class VectorialModule(QueryModule):
 
     def get_descending_scores(self, scores: dict, threshold: int = 100) -> List[Tuple[int, float]]:
         """
-        sort the doc list by scores and intercept the first threshold-th results
+        select the threshold-th best documents by scores, in descending order
         :param scores:
         :param threshold:
         :return:
         """
-        pair = sorted(list(scores.items()), key=(lambda x: x[1]), reverse=True)
-        return pair[:min(len(pair), threshold)]
+        top = TopK(threshold)
+        for doc, score in scores.items():
+            top.push(doc, score)
+        return top.results()
 
-    def dict_accumulate(self, key, dict: dict, acc):
-        """
-        Function for updating dictionary
-        :param key:
-        :param dict:
-        :param acc:
-        :return:
-        """
-        if key not in dict.keys():
-            dict[key] = acc
-        else:
-            dict[key] += acc
+
+class WandModule(VectorialModule):
+    """
+    Same ranking as VectorialModule, computed document at a time by (Block-Max) WAND
+    """
+    def __init__(self, query: str, block_max: bool = True):
+        super().__init__(query)
+        self.block_max = block_max
+        self.stats = None  # PruningStats of the last sub-collection queried
+
+    def __str__(self):
+        return 'Using WandModule with %s.' % ('Block-Max WAND' if self.block_max else 'WAND')
+
+    def get_result(self, ii: InvertedIndex, nbest: int) -> List[str]:
+        results, self.stats = wand(ii, self.get_query_vector(), nbest, self.block_max)
+        for doc, score in results:
+            yield ii.get_doc_url(doc)
+
+
+class MaxScoreModule(VectorialModule):
+    """
+    Same ranking as VectorialModule, computed by MaxScore: the lists of the terms with the lowest
+    score upper bounds are only probed for documents which may still enter the top results
+    """
+    def __init__(self, query: str):
+        super().__init__(query)
+        self.stats = None  # PruningStats of the last sub-collection queried
+
+    def __str__(self):
+        return 'Using MaxScoreModule.'
+
+    def get_result(self, ii: InvertedIndex, nbest: int) -> List[str]:
+        results, self.stats = maxscore(ii, self.get_query_vector(), nbest)
+        for doc, score in results:
+            yield ii.get_doc_url(doc)
+
+
+class ImpactModule(VectorialModule):
+    """
+    Approximation of VectorialModule on impact-ordered postings, evaluated score at a time
+    with early termination, and within a budget of postings if given
+    """
+    def __init__(self, query: str, budget: int = None):
+        super().__init__(query)
+        self.budget = budget
+        self.impact_indexes = dict()  # key: id of an inverted index, value: its ImpactIndex
+        self.stats = None  # PruningStats of the last sub-collection queried
+
+    def __str__(self):
+        return 'Using ImpactModule%s.' % ('' if self.budget is None else ' with a budget of %d postings' % self.budget)
+
+    def get_result(self, ii: InvertedIndex, nbest: int) -> List[str]:
+        if id(ii) not in self.impact_indexes:
+            self.impact_indexes[id(ii)] = ImpactIndex(ii)
+        results, self.stats = score_at_a_time(self.impact_indexes[id(ii)], self.get_query_vector(), nbest,
+                                              self.budget)
+        for doc, score in results:
+            yield ii.get_doc_url(doc)
 
 
 class TreapModule(QueryModule):
@@ -224,21 +383,15 @@ class TreapModule(QueryModule):
 
     def build_treaps(self, ii: InvertedIndex):
         """
-        Build treaps for terms in query
-        :param q:
+        Get treaps for terms in query: they are built once by the index,
+        a memory-mapped index navigates them in its posting file
         :param ii: already known inverted index
         :return:
         """
         treaps = dict()
         for term in self.query.split(' '):
-            tree = Treap()
             try:
-                for pair in ii[term].indexation:
-                    if type(pair) == int:
-                        tree.insert((pair, 1))
-                    else:
-                        tree.insert((pair[0], pair[1]))
-                treaps[term] = (ii[term].df, tree)
+                treaps[term] = (ii.df(term), ii.get_treap(term))
             except:
                 print('Warning while building treap for keyword \'%s\'.' % term)
                 continue
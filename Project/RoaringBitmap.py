@@ -0,0 +1,345 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: RoaringBitmap.py
+@time: 2020/5/3
+@desc: Compressed bitmaps of document ids for boolean queries (Chambi, Lemire et al. 2016).
+       Document ids are split in chunks of 2 ** 16 by their high 16 bits; the low 16 bits of a chunk
+       are kept in the smallest of an array container (sorted values), a bitmap container (2 ** 16 bits)
+       and a run container (start and length of the runs of consecutive values).
+"""
+from typing import Iterable, Iterator, List
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, deque
+from itertools import repeat, compress
+from operator import sub
+from Project.BooleanMerge import intersect, union, difference
+
+CHUNK_BITS = 16
+CHUNK_SIZE = 2 ** CHUNK_BITS
+LOW_MASK = CHUNK_SIZE - 1
+ARRAY_MAX = 4096  # largest cardinality of an array container, 2 bytes per value up to the 8 KB of a bitmap
+BITMAP_BYTES = CHUNK_SIZE // 8
+DIGITS = bytes.maketrans(b'\x00\x01', b'01')  # one byte per bit to binary digits
+FLAGS = bytes.maketrans(b'01', b'\x00\x01')
+POSITIONS = tuple(range(CHUNK_SIZE))
+SPARSE_BITS = 1024  # number of set bits under which they are searched one by one
+
+
+def popcount(bits: int) -> int:
+    return bits.bit_count() if hasattr(bits, 'bit_count') else bin(bits).count('1')
+
+
+def bits_to_values(bits: int) -> array:
+    """
+    :param bits: bitset of a chunk
+    :return: positions of the set bits in ascending order, read from the binary digits of the bitset:
+             one by one if they are few, by a mask over every position otherwise
+    """
+    digits = format(bits, '0%db' % CHUNK_SIZE)[::-1]
+    if popcount(bits) < SPARSE_BITS:
+        values = array('H')
+        position = digits.find('1')
+        while position >= 0:
+            values.append(position)
+            position = digits.find('1', position + 1)
+        return values
+    return array('H', compress(POSITIONS, digits.encode('ascii').translate(FLAGS)))
+
+
+def values_to_bits(values: Iterable[int]) -> int:
+    """
+    :param values: positions in a chunk
+    :return: bitset of the chunk, built without a Python loop: one byte is set per value,
+             then the bytes are read as the binary digits of the bitset
+    """
+    flags = bytearray(CHUNK_SIZE)
+    deque(map(flags.__setitem__, values, repeat(1)), maxlen=0)
+    flags.reverse()
+    return int(flags.translate(DIGITS), 2)
+
+
+class ArrayContainer(object):
+    __slots__ = ('values',)
+
+    def __init__(self, values: array):
+        """
+        :param values: array('H') of the low 16 bits in ascending order
+        """
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.values)
+
+    def __contains__(self, value: int) -> bool:
+        i = bisect_left(self.values, value)
+        return i < len(self.values) and self.values[i] == value
+
+    def nbytes(self) -> int:
+        return self.values.itemsize * len(self.values)
+
+    def to_bits(self) -> int:
+        return values_to_bits(self.values)
+
+
+class BitmapContainer(object):
+    __slots__ = ('bits', 'cardinality')
+
+    def __init__(self, bits: int, cardinality: int = None):
+        """
+        :param bits: bitset of the chunk as an integer of 2 ** 16 bits
+        :param cardinality: number of set bits, counted if not given
+        """
+        self.bits = bits
+        self.cardinality = popcount(bits) if cardinality is None else cardinality
+
+    def __len__(self):
+        return self.cardinality
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(bits_to_values(self.bits))
+
+    def __contains__(self, value: int) -> bool:
+        return self.bits >> value & 1 == 1
+
+    def nbytes(self) -> int:
+        return BITMAP_BYTES
+
+    def to_bits(self) -> int:
+        return self.bits
+
+
+class RunContainer(object):
+    __slots__ = ('starts', 'lasts', 'cardinality')
+
+    def __init__(self, starts: array, lasts: array):
+        """
+        :param starts: array('H') of the first value of each run, in ascending order
+        :param lasts: array('H') of the last value of each run
+        """
+        self.starts = starts
+        self.lasts = lasts
+        self.cardinality = sum(last - start + 1 for start, last in zip(starts, lasts))
+
+    def __len__(self):
+        return self.cardinality
+
+    def __iter__(self) -> Iterator[int]:
+        for start, last in zip(self.starts, self.lasts):
+            yield from range(start, last + 1)
+
+    def __contains__(self, value: int) -> bool:
+        i = bisect_right(self.starts, value) - 1
+        return i >= 0 and value <= self.lasts[i]
+
+    def nbytes(self) -> int:
+        return self.starts.itemsize * (len(self.starts) + len(self.lasts))
+
+    def to_bits(self) -> int:
+        bits = 0
+        for start, last in zip(self.starts, self.lasts):
+            bits |= ((1 << (last - start + 1)) - 1) << start
+        return bits
+
+
+def container_from_bits(bits: int):
+    """
+    Smallest container of a bitset: an array if its cardinality allows it, a run container
+    if its runs take less memory, a bitmap otherwise
+    :param bits:
+    :return: container, None if no bit is set
+    """
+    if not bits:
+        return None
+    cardinality = popcount(bits)
+    run_num = popcount(bits & ~(bits << 1))
+    if 4 * run_num < min(2 * cardinality, BITMAP_BYTES):
+        return RunContainer(bits_to_values(bits & ~(bits << 1)), bits_to_values(bits & ~(bits >> 1)))
+    if cardinality <= ARRAY_MAX:
+        return ArrayContainer(bits_to_values(bits))
+    return BitmapContainer(bits, cardinality)
+
+
+def container_from_values(values: array):
+    """
+    Smallest container of values in ascending order, see container_from_bits
+    :param values: array('H')
+    :return: container, None if values is empty
+    """
+    if not values:
+        return None
+    runs = Counter(map(sub, values, range(len(values))))  # value - rank is constant along a run, key: run, value: length
+    if 4 * len(runs) < min(2 * len(values), BITMAP_BYTES):
+        starts, lasts = array('H'), array('H')
+        i = 0
+        for length in runs.values():
+            starts.append(values[i])
+            i += length
+            lasts.append(values[i - 1])
+        return RunContainer(starts, lasts)
+    if len(values) <= ARRAY_MAX:
+        return ArrayContainer(values)
+    return BitmapContainer(values_to_bits(values), len(values))
+
+
+def and_containers(container1, container2):
+    if isinstance(container1, ArrayContainer) and isinstance(container2, ArrayContainer):
+        return container_from_values(intersect(container1.values, container2.values))
+    if isinstance(container2, ArrayContainer):
+        container1, container2 = container2, container1
+    if isinstance(container1, ArrayContainer):
+        if isinstance(container2, BitmapContainer):
+            data = container2.bits.to_bytes(BITMAP_BYTES, 'little')
+            return container_from_values(array('H', (value for value in container1.values
+                                                     if data[value >> 3] >> (value & 7) & 1)))
+        return container_from_values(array('H', (value for value in container1.values if value in container2)))
+    return container_from_bits(container1.to_bits() & container2.to_bits())
+
+
+def or_containers(container1, container2):
+    if isinstance(container1, ArrayContainer) and isinstance(container2, ArrayContainer) \
+            and len(container1) + len(container2) <= ARRAY_MAX:
+        return container_from_values(union(container1.values, container2.values))
+    return container_from_bits(container1.to_bits() | container2.to_bits())
+
+
+def andnot_containers(container1, container2):
+    if isinstance(container1, ArrayContainer):
+        if isinstance(container2, ArrayContainer):
+            return container_from_values(difference(container1.values, container2.values))
+        if isinstance(container2, BitmapContainer):
+            data = container2.bits.to_bytes(BITMAP_BYTES, 'little')
+            return container_from_values(array('H', (value for value in container1.values
+                                                     if not data[value >> 3] >> (value & 7) & 1)))
+        return container_from_values(array('H', (value for value in container1.values if value not in container2)))
+    return container_from_bits(container1.to_bits() & ~container2.to_bits())
+
+
+class RoaringBitmap(object):
+    """
+    Set of document ids as containers of chunks of 2 ** 16 ids, sorted by the high 16 bits of the chunk.
+    Iterating gives the document ids in ascending order; &, | and - compute the intersection,
+    the union and the difference chunk by chunk, and complement takes the difference with a universe.
+    """
+    __slots__ = ('keys', 'containers')
+
+    def __init__(self):
+        self.keys = []  # high 16 bits of the chunks in ascending order
+        self.containers = []
+
+    @classmethod
+    def from_docs(cls, docs: array):
+        """
+        :param docs: document ids in ascending order, as the docs column of a PostingList
+        :return:
+        """
+        bitmap = cls()
+        start = 0
+        while start < len(docs):
+            key = docs[start] >> CHUNK_BITS
+            end = bisect_left(docs, (key + 1) << CHUNK_BITS, start)
+            bitmap._append(key, container_from_values(array('H', map(LOW_MASK.__and__, docs[start:end]))))
+            start = end
+        return bitmap
+
+    def __len__(self):
+        return sum(len(container) for container in self.containers)
+
+    def __iter__(self) -> Iterator[int]:
+        for key, container in zip(self.keys, self.containers):
+            yield from map((key << CHUNK_BITS).__or__, container)
+
+    def __contains__(self, doc: int) -> bool:
+        i = bisect_left(self.keys, doc >> CHUNK_BITS)
+        return i < len(self.keys) and self.keys[i] == doc >> CHUNK_BITS and doc & LOW_MASK in self.containers[i]
+
+    def __repr__(self):
+        return 'RoaringBitmap(%d documents in %s)' % (len(self), ', '.join(
+            '%d: %s' % (key, type(container).__name__) for key, container in zip(self.keys, self.containers)))
+
+    def _append(self, key: int, container):
+        if container is not None:
+            self.keys.append(key)
+            self.containers.append(container)
+
+    def nbytes(self) -> int:
+        """
+        :return: bytes of the containers, with the 2 bytes of the key of each
+        """
+        return sum(2 + container.nbytes() for container in self.containers)
+
+    def to_array(self) -> array:
+        """
+        :return: document ids in ascending order, as the docs column of a PostingList
+        """
+        docs = array('I')
+        for key, container in zip(self.keys, self.containers):
+            docs.extend(map((key << CHUNK_BITS).__or__, container))
+        return docs
+
+    def container_types(self) -> List[str]:
+        return [type(container).__name__ for container in self.containers]
+
+    def __and__(self, other):
+        result = RoaringBitmap()
+        i, j = 0, 0
+        while i < len(self.keys) and j < len(other.keys):
+            if self.keys[i] == other.keys[j]:
+                result._append(self.keys[i], and_containers(self.containers[i], other.containers[j]))
+                i += 1
+                j += 1
+            elif self.keys[i] < other.keys[j]:
+                i += 1
+            else:
+                j += 1
+        return result
+
+    def __or__(self, other):
+        result = RoaringBitmap()
+        i, j = 0, 0
+        while i < len(self.keys) or j < len(other.keys):
+            if j == len(other.keys) or (i < len(self.keys) and self.keys[i] < other.keys[j]):
+                result._append(self.keys[i], self.containers[i])
+                i += 1
+            elif i == len(self.keys) or other.keys[j] < self.keys[i]:
+                result._append(other.keys[j], other.containers[j])
+                j += 1
+            else:
+                result._append(self.keys[i], or_containers(self.containers[i], other.containers[j]))
+                i += 1
+                j += 1
+        return result
+
+    def __sub__(self, other):
+        result = RoaringBitmap()
+        j = 0
+        for key, container in zip(self.keys, self.containers):
+            while j < len(other.keys) and other.keys[j] < key:
+                j += 1
+            if j < len(other.keys) and other.keys[j] == key:
+                result._append(key, andnot_containers(container, other.containers[j]))
+            else:
+                result._append(key, container)
+        return result
+
+    def complement(self, universe):
+        """
+        :param universe: RoaringBitmap of every document id
+        :return: document ids of universe not in self
+        """
+        return universe - self
+
+
+if __name__ == '__main__':
+    universe = RoaringBitmap.from_docs(array('I', range(1, 200001)))
+    evens = RoaringBitmap.from_docs(array('I', range(2, 200001, 2)))
+    few = RoaringBitmap.from_docs(array('I', [3, 4, 70000, 150001]))
+    print(universe, universe.nbytes())
+    print(evens, evens.nbytes())
+    print(list(evens & few), list(evens | few)[:5], list(few - evens))
+    print(len(evens.complement(universe)), evens.complement(universe).container_types())
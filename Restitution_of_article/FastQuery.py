@@ -5,11 +5,13 @@
 @file: Main.py
 @time: 2020/3/19
 @desc: Implementation of algorithms from article "Faster and Smaller Inverted Indices with Treaps" by Roberto Konow, al.
+       Treaps are Treap or SuccinctTreap: their nodes have the same id, priority, left and right.
+       array_intersection and array_union walk ArrayTreap by node index.
 """
-from Restitution_of_article.Treap import TNode, Treap
+from Restitution_of_article.Treap import TNode, Treap, ArrayTreap, NIL
+from Restitution_of_article.TopK import TopK
 from typing import Tuple, List, Iterator, Generator, Iterable, Dict
 from math import log10
-from copy import copy
 
 
 def build_treaps(posting_lists):
@@ -28,172 +30,374 @@ def build_treaps(posting_lists):
 
 
 def intersection(Q: Iterable[str], treaps: Dict, k: int = 3, D: int = 1000) -> List[Tuple[int, float]]:
+    """
+    Top k of the documents containing every term of Q, scored by the sum of idf * tf of the terms,
+    U being the bound of the score in the current subtrees: the sum of idf * priority of the current nodes.
+    Terms are numbered in order of Q: the node, the stack, the idf of a term are read by index,
+    and the id at the top of each stack is kept in tops, so the next candidate document is min(tops).
+    A node (D + 1, D) at the bottom of every stack, after every document id, ends the search.
+    :param Q: terms
+    :param treaps: key: term, value: (df, treap)
+    :param k:
+    :param D:
+    :return: (doc, score) in descending order of score
+    """
     # init
-    result = list()
-    stacks = dict(zip(Q, [[TNode((D, D))] for _ in range(len(Q))]))
-    vt = dict(zip(Q, [treaps[t][1].root for t in Q]))
-    U = sum([treaps[t][0] * vt[t].priority for t in Q])
-    # print("\n---initialisation---\nU = {0},\nstacks = {1},\nvt = {2}".format(U, stacks, vt))
+    result = TopK(k)
+    terms = list(dict.fromkeys(Q))
+    if any(treaps[t][1].root is None for t in terms):  # a term without postings: no document has every term
+        return
+    end = D + 1  # after every document id
+    sentinel = TNode((end, D))
+    indexes = range(len(terms))
+    idf = [log10(D / treaps[t][0]) for t in terms]
+    vt = [treaps[t][1].root for t in terms]
+    stacks = [[sentinel] for _ in terms]
+    tops = [end] * len(terms)
+    U = sum([idf[i] * vt[i].priority for i in indexes])
     d = 1
-    L = -100000
+    L = result.threshold
+
+    def changed(newd: int, U: float) -> float:
+        """
+        Go up the path of every term to the subtree holding newd
+        :param newd: next document
+        :param U:
+        :return: U
+        """
+        for i in indexes:
+            if newd >= tops[i]:
+                stack = stacks[i]
+                v = stack.pop()
+                while stack and newd >= stack[-1].id:
+                    v = stack.pop()
+                tops[i] = stack[-1].id if stack else end + 1
+                U += idf[i] * (v.priority - vt[i].priority)  # idf * tf
+                vt[i] = v
+        return U
 
-    # local functions
-    def id_top_stack_t(t: str) -> int:
-        if stacks[t]:
-            return stacks[t][-1].id
+    # main loop
+    while d < end:
+        while U <= L and d < end:
+            # changed walks every term anyway: a heap of (top, i), pushed at every move of a stack,
+            # was 6 to 30% slower than this scan for queries of 2 to 8 terms
+            d = min(tops)
+            U = changed(d, U)
+        if d >= end:
+            break
+        for i in indexes:
+            if vt[i].id != d:
+                break  # choose where to advance
+        else:  # U drifts with the moves, the score is summed again
+            result.push(d, sum([idf[i] * vt[i].priority for i in indexes]))
+            L = result.threshold
+            d += 1
+            U = changed(d, U)
+            continue
+        v = vt[i]
+        if d < v.id:
+            left = v.left
+            if left is not None:
+                stacks[i].append(v)
+                tops[i] = v.id
+                U += idf[i] * (left.priority - v.priority)
+                vt[i] = left
+            else:
+                d = v.id
+                U = changed(d, U)
         else:
-            return D + 1
+            right = v.right
+            if right is not None:
+                U += idf[i] * (right.priority - v.priority)
+                vt[i] = right
+            else:
+                stack = stacks[i]
+                parent = stack.pop()
+                tops[i] = stack[-1].id if stack else end + 1
+                U += idf[i] * (parent.priority - v.priority)
+                vt[i] = parent
+                d = parent.id
+                U = changed(d, U)
+    for res in result.results():
+        yield res
+
 
-    def changev(t: str, v: TNode):
-        nonlocal U, vt, D
-        U += log10(D / treaps[t][0]) * (v.priority - vt[t].priority)   # idf * tf
-        vt[t] = v
+def union(Q: Iterable[str], treaps: Dict, k: int = 3, D: int = 1000) -> List[Tuple[int, float]]:
+    """
+    Top k of the documents containing any term of Q, d being scored by the terms whose current node is on d.
+    Terms are read by index as in intersection, nextdt holding the next document of each term.
+    A term whose treap is exhausted is dropped from every list at the start of the next step.
+    A term repeated in Q is scored once.
+    No subtree is skipped once k documents are kept: the scores to come have no bound here.
+    :param Q: terms
+    :param treaps: key: term, value: (df, treap)
+    :param k:
+    :param D:
+    :return: (doc, score) in descending order of score
+    """
+    # init
+    result = TopK(k)
+    terms = [t for t in dict.fromkeys(Q) if treaps[t][1].root is not None]
+    end = D + 1  # after every document id
+    sentinel = TNode((end, D))
+    idf = [log10(D / treaps[t][0]) for t in terms]
+    vt = [treaps[t][1].root for t in terms]
+    stacks = [[sentinel] for _ in terms]
+    tops = [end] * len(terms)
+    nextdt = [treaps[t][1].search_min_id() for t in terms]
+    d = 1
 
     def changed(newd: int):
-        nonlocal Q, d
-        d = newd
-        # print("next document = ", d)
-        for t in Q:
-            v = vt[t]
-            while d >= id_top_stack_t(t):
-                v = stacks[t].pop(-1)
-            changev(t, v)
-
-    def report(doc: int, s: int):
-        nonlocal result, L
-        result.append((doc, s))
-        result.sort(key=lambda x: x[1])
-        if len(result) > k:
-            result.pop(0)
-            L = result[0][1]
+        """
+        Go up the path of every term to the subtree holding newd
+        :param newd: next document
+        :return:
+        """
+        for i in range(len(vt)):
+            if nextdt[i] < newd:
+                nextdt[i] = newd
+            if newd >= tops[i]:
+                stack = stacks[i]
+                v = stack.pop()
+                while stack and newd >= stack[-1].id:
+                    v = stack.pop()
+                tops[i] = stack[-1].id if stack else end + 1
+                vt[i] = v
 
     # main loop
-    while d < D:
-        if [] in stacks.values():
-            break
-        while U <= L:
-            changed(min([id_top_stack_t(t) for t in Q]))
-        ident_d = True
-        t = None
-        for term, vt_node in vt.items():
-            if vt_node.id != d:
-                ident_d = False
-                t = term  # choose where to advance
+    while d < end:
+        if not all(stacks):
+            for i in reversed(range(len(stacks))):
+                if not stacks[i]:
+                    del idf[i], vt[i], stacks[i], tops[i], nextdt[i]
+            if not stacks:
+                break
+        score = 0
+        num_equal = 0
+        t = -1
+        for i in range(len(vt)):
+            v = vt[i]
+            if v.id == d:
+                score += idf[i] * v.priority  # idf * tf
+                num_equal += 1
+            elif nextdt[i] == d:
+                t = i  # choose where to advance
                 break
-        if ident_d:
-            report(d, U)
-            changed(d + 1)
+        if t < 0:
+            if num_equal != 0:
+                result.push(d, score)
+                d += 1
+            else:
+                d = min(nextdt)
+            changed(d)
         else:
-            if d < vt[t].id:
-                lt = vt[t].left
-                if lt is not None:
-                    stacks[t].append(vt[t])
-                    changev(t, lt)
+            v = vt[t]
+            if d < v.id:
+                left = v.left
+                if left is not None:
+                    stacks[t].append(v)
+                    tops[t] = v.id
+                    vt[t] = left
                 else:
-                    changed(vt[t].id)
+                    nextdt[t] = v.id
             else:
-                rt = vt[t].right
-                if rt is not None:
-                    changev(t, rt)
+                right = v.right
+                if right is not None:
+                    vt[t] = right
                 else:
-                    changev(t, stacks[t].pop(-1))
-                    changed(vt[t].id)
-    result.reverse()
-    for res in result:
+                    stack = stacks[t]
+                    vt[t] = stack.pop()
+                    tops[t] = stack[-1].id if stack else end + 1
+                    nextdt[t] = vt[t].id
+    for res in result.results():
         yield res
 
 
-def union(Q: Iterable[str], treaps: Dict, k: int = 3, D: int = 1000) -> List[Tuple[int, float]]:
+def array_intersection(Q: Iterable[str], treaps: Dict, k: int = 3, D: int = 1000) -> List[Tuple[int, float]]:
+    """
+    intersection on ArrayTreap: a node is an index in the arrays of its treap,
+    NIL at the bottom of the stacks stands for the node (D + 1, D) of intersection
+    :param Q: terms
+    :param treaps: key: term, value: (df, ArrayTreap)
+    :param k:
+    :param D:
+    :return: (doc, score) in descending order of score
+    """
     # init
-    next_Q = copy(Q)
-    result = list()
-    stacks = dict(zip(next_Q, [[TNode((D, D))] for _ in range(len(next_Q))]))
-    vt = dict(zip(next_Q, [treaps[t][1].root for t in next_Q]))
-    U = 0
-    nextdt = dict(zip(next_Q, [treaps[t][1].search_min_id() for t in next_Q]))
-    # print("\n---initialisation---\nU = {0},\nstacks = {1},\nvt = {2}".format(U, stacks, vt))
+    result = TopK(k)
+    terms = list(dict.fromkeys(Q))
+    if any(treaps[t][1].root == NIL for t in terms):  # a term without postings: no document has every term
+        return
+    end = D + 1  # after every document id
+    indexes = range(len(terms))
+    idf = [log10(D / treaps[t][0]) for t in terms]
+    ids = [treaps[t][1].ids for t in terms]
+    priorities = [treaps[t][1].priorities for t in terms]
+    lefts = [treaps[t][1].lefts for t in terms]
+    rights = [treaps[t][1].rights for t in terms]
+    vt = [treaps[t][1].root for t in terms]
+    stacks = [[NIL] for _ in terms]
+    tops = [end] * len(terms)
+    U = sum([idf[i] * priorities[i][vt[i]] for i in indexes])
     d = 1
-    L = -100000
+    L = result.threshold
+
+    def top_id(i: int) -> int:
+        stack = stacks[i]
+        if not stack:
+            return end + 1
+        return ids[i][stack[-1]] if stack[-1] != NIL else end
 
-    # local functions
-    def id_top_stack_t(t: str) -> int:
-        if stacks[t]:
-            return stacks[t][-1].id
+    def changed(newd: int, U: float) -> float:
+        """
+        Go up the path of every term to the subtree holding newd
+        :param newd: next document
+        :param U:
+        :return: U
+        """
+        for i in indexes:
+            if newd >= tops[i]:
+                stack = stacks[i]
+                v = stack.pop()
+                while stack and newd >= (ids[i][stack[-1]] if stack[-1] != NIL else end):
+                    v = stack.pop()
+                tops[i] = top_id(i)
+                U += idf[i] * ((priorities[i][v] if v != NIL else D) - priorities[i][vt[i]])  # idf * tf
+                vt[i] = v
+        return U
+
+    # main loop
+    while d < end:
+        while U <= L and d < end:
+            d = min(tops)  # a scan rather than a heap, see intersection
+            U = changed(d, U)
+        if d >= end or NIL in vt:  # NIL: a term has no document from d on
+            break
+        for i in indexes:
+            if ids[i][vt[i]] != d:
+                break  # choose where to advance
+        else:  # U drifts with the moves, the score is summed again
+            result.push(d, sum([idf[i] * priorities[i][vt[i]] for i in indexes]))
+            L = result.threshold
+            d += 1
+            U = changed(d, U)
+            continue
+        v = vt[i]
+        if d < ids[i][v]:
+            left = lefts[i][v]
+            if left != NIL:
+                stacks[i].append(v)
+                tops[i] = ids[i][v]
+                U += idf[i] * (priorities[i][left] - priorities[i][v])
+                vt[i] = left
+            else:
+                d = ids[i][v]
+                U = changed(d, U)
         else:
-            return D + 1
+            right = rights[i][v]
+            if right != NIL:
+                U += idf[i] * (priorities[i][right] - priorities[i][v])
+                vt[i] = right
+            else:
+                parent = stacks[i].pop()
+                tops[i] = top_id(i)
+                if parent == NIL:  # the term has no document after d
+                    break
+                U += idf[i] * (priorities[i][parent] - priorities[i][v])
+                vt[i] = parent
+                d = ids[i][parent]
+                U = changed(d, U)
+    for res in result.results():
+        yield res
+
+
+def array_union(Q: Iterable[str], treaps: Dict, k: int = 3, D: int = 1000) -> List[Tuple[int, float]]:
+    """
+    union on ArrayTreap, see array_intersection and union
+    :param Q: terms
+    :param treaps: key: term, value: (df, ArrayTreap)
+    :param k:
+    :param D:
+    :return:
+    """
+    # init
+    result = TopK(k)
+    terms = [t for t in dict.fromkeys(Q) if treaps[t][1].root != NIL]
+    end = D + 1  # after every document id
+    idf = [log10(D / treaps[t][0]) for t in terms]
+    ids = [treaps[t][1].ids for t in terms]
+    priorities = [treaps[t][1].priorities for t in terms]
+    lefts = [treaps[t][1].lefts for t in terms]
+    rights = [treaps[t][1].rights for t in terms]
+    vt = [treaps[t][1].root for t in terms]
+    stacks = [[NIL] for _ in terms]
+    tops = [end] * len(terms)
+    nextdt = [treaps[t][1].search_min_id() for t in terms]
+    d = 1
 
-    def changev(t: str, v: TNode):
-        nonlocal U, vt, d, D
-        if vt[t].id == d:
-            U += log10(D / treaps[t][0]) * vt[t].priority   # idf * tf
-        vt[t] = v
+    def top_id(i: int) -> int:
+        stack = stacks[i]
+        if not stack:
+            return end + 1
+        return ids[i][stack[-1]] if stack[-1] != NIL else end
 
     def changed(newd: int):
-        nonlocal next_Q, d
-        d = newd
-        # print("next document = ", d)
-        for t in next_Q:
-            nextdt[t] = max(nextdt[t], newd)
-            v = vt[t]
-            while d >= id_top_stack_t(t):
-                v = stacks[t].pop(-1)
-            changev(t, v)
-
-    def report(doc: int, s: int):
-        nonlocal result, L
-        result.append((doc, s))
-        result.sort(key=lambda x: x[1])
-        if len(result) > k:
-            result.pop(0)
-            L = result[0][1]
+        for i in range(len(vt)):
+            if nextdt[i] < newd:
+                nextdt[i] = newd
+            if newd >= tops[i]:
+                stack = stacks[i]
+                v = stack.pop()
+                while stack and newd >= (ids[i][stack[-1]] if stack[-1] != NIL else end):
+                    v = stack.pop()
+                tops[i] = top_id(i)
+                vt[i] = v
 
     # main loop
-    while d < D:
-        for t in next_Q:
-            if not stacks[t]:
-                del stacks[t]
-                del vt[t]
-                del nextdt[t]
-                next_Q.remove(t)
-        if not stacks:
-            break
-        while U <= L:
-            changed(min([id_top_stack_t(t) for t in next_Q]))
-        ident_d = True
+    while d < end:
+        if not all(stacks):
+            for i in reversed(range(len(stacks))):
+                if not stacks[i]:
+                    del idf[i], ids[i], priorities[i], lefts[i], rights[i], vt[i], stacks[i], tops[i], nextdt[i]
+            if not stacks:
+                break
+        score = 0
         num_equal = 0
-        t = None
-        for term, vt_node in vt.items():
-            if vt_node.id != d:
-                if nextdt[term] == d:
-                    t = term  # choose where to advance
-                if nextdt[term] <= d:
-                    ident_d = False
-            else:
+        t = -1
+        for i in range(len(vt)):
+            v = vt[i]
+            if v != NIL and ids[i][v] == d:
+                score += idf[i] * priorities[i][v]  # idf * tf
                 num_equal += 1
-        if ident_d:
+            elif nextdt[i] == d:
+                t = i  # choose where to advance
+                break
+        if t < 0:
             if num_equal != 0:
-                report(d, U)
-                U = 0
-                changed(d + 1)
+                result.push(d, score)
+                d += 1
             else:
-                changed(min(nextdt.values()))
+                d = min(nextdt)
+            changed(d)
         else:
-            if d < vt[t].id:
-                lt = vt[t].left
-                if lt is not None:
-                    stacks[t].append(vt[t])
-                    changev(t, lt)
+            v = vt[t]
+            if d < ids[t][v]:
+                left = lefts[t][v]
+                if left != NIL:
+                    stacks[t].append(v)
+                    tops[t] = ids[t][v]
+                    vt[t] = left
                 else:
-                    nextdt[t] = vt[t].id
+                    nextdt[t] = ids[t][v]
             else:
-                rt = vt[t].right
-                if rt is not None:
-                    changev(t, rt)
+                right = rights[t][v]
+                if right != NIL:
+                    vt[t] = right
                 else:
-                    changev(t, stacks[t].pop(-1))
-                    nextdt[t] = vt[t].id
-    result.reverse()
-    for res in result:
+                    vt[t] = stacks[t].pop()
+                    tops[t] = top_id(t)
+                    nextdt[t] = ids[t][vt[t]] if vt[t] != NIL else end
+    for res in result.results():
         yield res
 
 
@@ -216,4 +420,8 @@ if __name__ == "__main__":
     print("descending order result: ", "".join(["(%d, %.2f), " % (doc, prio) for doc, prio in intersection(Query, TREAPS, 100)])[:-2])
 
     print("-----Union query-----")
-    print("descending order result: ", "".join(["(%d, %.2f), " % (doc, prio) for doc, prio in union(Query, TREAPS, 100)])[:-2])
\ No newline at end of file
+    print("descending order result: ", "".join(["(%d, %.2f), " % (doc, prio) for doc, prio in union(Query, TREAPS, 100)])[:-2])
+    ARRAY_TREAPS = {key[0]: (key[1], ArrayTreap.from_sorted(sorted(posting)))
+                    for key, posting in fake_posting_lists.items()}
+    print("-----Intersection query on array treaps-----")
+    print("descending order result: ", "".join(["(%d, %.2f), " % (doc, prio) for doc, prio in array_intersection(Query, ARRAY_TREAPS, 100)])[:-2])
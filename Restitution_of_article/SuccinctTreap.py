@@ -0,0 +1,335 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: SuccinctTreap.py
+@time: 2020/5/5
+@desc: Compact representation of treaps from "Faster and Smaller Inverted Indices with Treaps" by Roberto Konow, al.
+       The treap is turned into a general tree as in Gtree.compress_treap (the left child is the first child,
+       the right child the next sibling, under a fake root), whose topology is kept as balanced parentheses
+       in a bitvector with rank / select directories. Ids and priorities are stored in preorder,
+       as differences with the parent node. The encoded bytes are navigated in place,
+       so a treap saved in a memory-mapped index file is never rebuilt.
+"""
+from typing import Iterable, Tuple
+from array import array
+from itertools import repeat
+import struct
+import sys
+from Restitution_of_article.Treap import Treap, ArrayTreap, NIL
+
+# Encoded treap: TREAP_HEADER (number of nodes, height, id and priority of the root, typecodes of the id and
+# priority differences), bitvector of the balanced parentheses, '(' being 1,
+# number of 1 before each block ('I'), segment tree of the smallest excess reached in each block ('i'),
+# id difference of each node with its parent in preorder, then priority difference, the root having 0.
+# Columns are little-endian and start on multiples of 4 bytes.
+TREAP_HEADER = struct.Struct('<IIII2s2x')
+BLOCK_BITS = 512
+BLOCK_BYTES = BLOCK_BITS // 8
+NO_EXCESS = 2 ** 31 - 1  # smallest excess of the padding leaves of the segment tree
+BYTE_EXCESS = tuple(2 * bin(byte).count('1') - 8 for byte in range(256))  # bits are read from the lowest
+BYTE_MIN = tuple(min(2 * bin(byte & ((1 << k) - 1)).count('1') - k for k in range(1, 9)) for byte in range(256))
+BYTE_ONES = tuple(bin(byte).count('1') for byte in range(256))
+
+
+def smallest_typecode(values: Iterable[int]) -> str:
+    largest = max(values, default=0)
+    return 'B' if largest < 2 ** 8 else 'H' if largest < 2 ** 16 else 'I'
+
+
+def _pad(data: bytearray):
+    data += bytes(-len(data) % 4)
+
+
+def _little_endian(column: array) -> bytes:
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def encode_treap(docs: array, priorities: array = None) -> bytes:
+    """
+    Bulk load the treap of a posting list in an ArrayTreap, without creating any node object, and encode it
+    :param docs: document ids in ascending order
+    :param priorities: tf of each document, 1 for every document if None
+    :return: bytes read by SuccinctTreap
+    """
+    treap = ArrayTreap.from_sorted(zip(docs, repeat(1) if priorities is None else priorities))
+    digits, nodes, parents = treap.compress()
+    ids, priorities = treap.ids, treap.priorities
+    id_diffs = array('I', (abs(ids[node] - ids[parent]) if parent != NIL else 0
+                           for node, parent in zip(nodes, parents)))
+    priority_diffs = array('I', (priorities[parent] - priorities[node] if parent != NIL else 0
+                                 for node, parent in zip(nodes, parents)))
+    block_num = -(-len(digits) // BLOCK_BITS)
+    bits = int(''.join(reversed(digits)), 2).to_bytes(-(-len(digits) // 32) * 4, 'little')
+    ones, block_mins = array('I', [0]), array('i')
+    excess = 0
+    for block in range(block_num):
+        smallest = NO_EXCESS
+        block_digits = digits[block * BLOCK_BITS:(block + 1) * BLOCK_BITS]
+        for digit in block_digits:
+            excess += 1 if digit == '1' else -1
+            smallest = min(smallest, excess)
+        block_mins.append(smallest)
+        ones.append(ones[-1] + block_digits.count('1'))
+    size = 1
+    while size < block_num:
+        size *= 2
+    tree = array('i', [NO_EXCESS]) * (2 * size)
+    tree[size:size + block_num] = block_mins
+    for node in range(size - 1, 0, -1):
+        tree[node] = min(tree[2 * node], tree[2 * node + 1])
+    id_code, priority_code = smallest_typecode(id_diffs), smallest_typecode(priority_diffs)
+    n, root = len(treap), treap.root
+    data = bytearray(TREAP_HEADER.pack(n, treap.height, ids[root] if n else 0, priorities[root] if n else 0,
+                                       (id_code + priority_code).encode('ascii')))
+    data += bits
+    for column in (ones, tree, array(id_code, id_diffs), array(priority_code, priority_diffs)):
+        data += _little_endian(column)
+        _pad(data)
+    return bytes(data)
+
+
+class SuccinctNode(object):
+    """
+    Node of a SuccinctTreap, created while the treap is navigated.
+    It has the id, priority, left and right of a TNode, so FastQuery walks both kinds of treaps alike.
+    """
+    __slots__ = ('treap', 'position', 'rank', 'id', 'priority')
+
+    def __init__(self, treap, position: int, rank: int, doc: int, priority: int):
+        """
+        :param treap: SuccinctTreap
+        :param position: position of the opening parenthesis of the node
+        :param rank: preorder rank of the node
+        :param doc: id
+        :param priority:
+        """
+        self.treap = treap
+        self.position = position
+        self.rank = rank
+        self.id = doc
+        self.priority = priority
+
+    def __repr__(self):
+        return "{0}-{1}".format(self.id, self.priority)
+
+    @property
+    def left(self):
+        """
+        First child in the general tree: the next parenthesis if it opens
+        :return: SuccinctNode, None if there is none
+        """
+        treap, position = self.treap, self.position + 1
+        if not treap.bits[position >> 3] >> (position & 7) & 1:
+            return None
+        rank = self.rank + 1
+        return SuccinctNode(treap, position, rank, self.id - treap.id_diffs[rank],
+                            self.priority - treap.priority_diffs[rank])
+
+    @property
+    def right(self):
+        """
+        Next sibling in the general tree: the parenthesis after the one closing the node if it opens.
+        The left subtree lies between the two parentheses, so the preorder rank is known without rank
+        :return: SuccinctNode, None if there is none
+        """
+        treap = self.treap
+        close = treap.find_close(self.position, 2 * (self.rank + 2) - self.position - 1)
+        position = close + 1
+        if not treap.bits[position >> 3] >> (position & 7) & 1:
+            return None
+        rank = self.rank + (close - self.position + 1) // 2
+        return SuccinctNode(treap, position, rank, self.id + treap.id_diffs[rank],
+                            self.priority - treap.priority_diffs[rank])
+
+
+class SuccinctTreap(object):
+    """
+    Treap encoded by encode_treap, read in place from bytes or from a memory-mapped file.
+    Like Treap, it has a root, a height and search_min_id.
+    """
+    def __init__(self, data, offset: int = 0):
+        """
+        :param data: bytes, or mmap of an index file
+        :param offset: start of the encoded treap in data
+        """
+        self.size, self.height, self._root_id, self._root_priority, codes = TREAP_HEADER.unpack_from(data, offset)
+        id_code, priority_code = codes.decode('ascii')
+        view = memoryview(data)
+        start = offset + TREAP_HEADER.size
+        self.block_num = -(-(2 * self.size + 2) // BLOCK_BITS)
+        leaves = 1
+        while leaves < self.block_num:
+            leaves *= 2
+        self._leaves = leaves
+        self._views = []
+        self.bits = self._column(view, start, 'B', -(-(2 * self.size + 2) // 32) * 4)
+        self.ones = self._column(view, start + len(self.bits), 'I', self.block_num + 1)
+        start += len(self.bits) + 4 * len(self.ones)
+        self.tree = self._column(view, start, 'i', 2 * leaves)
+        start += 4 * len(self.tree)
+        self.id_diffs = self._column(view, start, id_code, self.size)
+        start += -(-len(self.id_diffs) * self.id_diffs.itemsize // 4) * 4
+        self.priority_diffs = self._column(view, start, priority_code, self.size)
+        self.nbytes = start + -(-len(self.priority_diffs) * self.priority_diffs.itemsize // 4) * 4 - offset
+
+    def _column(self, view: memoryview, start: int, typecode: str, count: int):
+        column = view[start:start + count * array(typecode).itemsize].cast(typecode)
+        if sys.byteorder == 'big' and column.itemsize > 1:
+            column = array(typecode, column)
+            column.byteswap()
+        else:
+            self._views.append(column)
+        return column
+
+    def release(self):
+        """
+        Release the views on the data, so that the memory-mapped file can be closed
+        :return:
+        """
+        for column in self._views:
+            column.release()
+        self._views = []
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def root(self) -> SuccinctNode:
+        if not self.size:
+            return None
+        return SuccinctNode(self, 1, 0, self._root_id, self._root_priority)
+
+    def rank(self, position: int) -> int:
+        """
+        :param position:
+        :return: number of opening parentheses before position
+        """
+        block, byte = position // BLOCK_BITS, position >> 3
+        ones = self.ones[block] + sum(map(BYTE_ONES.__getitem__, self.bits[block * BLOCK_BYTES:byte]))
+        return ones + BYTE_ONES[self.bits[byte] & ((1 << (position & 7)) - 1)] if position & 7 else ones
+
+    def select(self, bit: int, j: int) -> int:
+        """
+        :param bit: 1 for opening parentheses, 0 for closing ones
+        :param j:
+        :return: position of the (j + 1)-th parenthesis of the kind, -1 if there is none
+        """
+        low, high = 0, self.block_num
+        while low < high:  # last block starting with at most j such parentheses
+            middle = (low + high + 1) // 2
+            before = self.ones[middle] if bit else middle * BLOCK_BITS - self.ones[middle]
+            if before <= j:
+                low = middle
+            else:
+                high = middle - 1
+        if low == self.block_num:
+            return -1
+        j -= self.ones[low] if bit else low * BLOCK_BITS - self.ones[low]
+        for byte in range(low * BLOCK_BYTES, min((low + 1) * BLOCK_BYTES, len(self.bits))):
+            count = BYTE_ONES[self.bits[byte]] if bit else 8 - BYTE_ONES[self.bits[byte]]
+            if j < count:
+                value = self.bits[byte]
+                for offset in range(8):
+                    if (value >> offset & 1) == bit:
+                        if not j:
+                            return 8 * byte + offset
+                        j -= 1
+            j -= count
+        return -1
+
+    def find_close(self, position: int, excess: int) -> int:
+        """
+        Position of the parenthesis closing the one opened at position: the first one after it where
+        the excess, number of '(' minus number of ')' up to it, falls to one below its excess.
+        Bits are read one by one up to the next byte, bytes by tables up to the next block,
+        and the next block reaching the excess is found by the segment tree.
+        :param position: position of an opening parenthesis
+        :param excess: excess at position
+        :return:
+        """
+        bits = self.bits
+        target = excess - 1
+        i = position + 1
+        while i & 7:
+            excess += 1 if bits[i >> 3] >> (i & 7) & 1 else -1
+            if excess == target:
+                return i
+            i += 1
+        byte = i >> 3
+        end = min(-(-byte // BLOCK_BYTES) * BLOCK_BYTES, len(bits))
+        while byte < end:
+            if excess + BYTE_MIN[bits[byte]] <= target:
+                return self._close_in_byte(byte, excess, target)
+            excess += BYTE_EXCESS[bits[byte]]
+            byte += 1
+        block = self._next_block(byte // BLOCK_BYTES, target)
+        byte = block * BLOCK_BYTES
+        excess = 2 * self.ones[block] - block * BLOCK_BITS
+        while excess + BYTE_MIN[bits[byte]] > target:
+            excess += BYTE_EXCESS[bits[byte]]
+            byte += 1
+        return self._close_in_byte(byte, excess, target)
+
+    def _close_in_byte(self, byte: int, excess: int, target: int) -> int:
+        value = self.bits[byte]
+        for offset in range(8):
+            excess += 1 if value >> offset & 1 else -1
+            if excess == target:
+                return 8 * byte + offset
+        return -1
+
+    def _next_block(self, block: int, target: int) -> int:
+        """
+        :param block:
+        :param target:
+        :return: first block from block on whose smallest excess reaches target
+        """
+        tree, node = self.tree, self._leaves + block
+        while tree[node] > target:
+            while node & 1:  # a right child: go up to the first left child
+                node >>= 1
+            if not node:
+                return -1
+            node += 1
+        while node < self._leaves:
+            node = 2 * node if tree[2 * node] <= target else 2 * node + 1
+        return node - self._leaves
+
+    def search_min_id(self) -> int:
+        """
+        The leftmost path is the run of opening parentheses after the fake root,
+        it ends at the first closing one
+        :return:
+        """
+        depth = self.select(0, 0) - 1
+        return self._root_id - sum(self.id_diffs[1:depth])
+
+    def nodes(self) -> Iterable[Tuple[int, int]]:
+        """
+        :return: (id, priority) of the nodes in preorder
+        """
+        pending = [self.root] if self.size else []
+        while pending:
+            node = pending.pop()
+            yield node.id, node.priority
+            for child in (node.right, node.left):
+                if child is not None:
+                    pending.append(child)
+
+
+if __name__ == "__main__":
+    postings = sorted({(30, 24), (13, 14), (35, 6), (4, 6), (22, 2), (44, 3),
+                       (9, 2), (15, 1), (27, 1), (39, 2), (14, 1), (37, 1)})
+    TREAP = Treap.from_sorted(postings)
+    TREAP.root.display()
+    DATA = encode_treap(array('I', [doc for doc, _ in postings]), array('I', [tf for _, tf in postings]))
+    SUCCINCT = SuccinctTreap(DATA)
+    print("%d nodes in %d bytes, height = %d, min id = %d" % (len(SUCCINCT), len(DATA), SUCCINCT.height,
+                                                              SUCCINCT.search_min_id()))
+    print("Parentheses presentation: " + ''.join('(' if SUCCINCT.bits[i >> 3] >> (i & 7) & 1 else ')'
+                                                 for i in range(2 * len(SUCCINCT) + 2)))
+    print("preorder: ", list(SUCCINCT.nodes()))
@@ -0,0 +1,76 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: TopK.py
+@time: 2020/4/28
+@desc: Bounded collector of the k best scored documents, shared by the query engines
+"""
+from typing import List, Tuple, Any
+import heapq
+
+
+class TopK(object):
+    """
+    Keep the k items of highest score among the offered ones.
+    A min-heap of size k holds them, its root is the item to be evicted next:
+    offering an item costs O(log k) and the score to beat is read in O(1).
+    Ties are stable: among equal scores the item offered first ranks higher and is kept.
+    """
+    __slots__ = ('k', 'floor', '_heap', '_count')
+
+    def __init__(self, k: int, floor: float = float('-inf')):
+        """
+        :param k: maximum number of items kept
+        :param floor: threshold given while less than k items are kept
+        """
+        self.k = k
+        self.floor = floor
+        self._heap = []  # (score, -arrival, item), the root has the lowest score and arrived last among equals
+        self._count = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def is_full(self) -> bool:
+        return len(self._heap) >= self.k
+
+    @property
+    def threshold(self) -> float:
+        """
+        Score an item must exceed to enter the top k
+        :return: lowest kept score once k items are kept, floor before
+        """
+        if self._heap and len(self._heap) >= self.k:
+            return self._heap[0][0]
+        return self.floor
+
+    def push(self, item: Any, score: float) -> bool:
+        """
+        Offer an item
+        :param item:
+        :param score:
+        :return: True if the item enters the top k
+        """
+        self._count += 1
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, (score, -self._count, item))
+            return True
+        if self._heap and score > self._heap[0][0]:
+            heapq.heapreplace(self._heap, (score, -self._count, item))
+            return True
+        return False
+
+    def results(self) -> List[Tuple[Any, float]]:
+        """
+        :return: (item, score) in descending order of score, ties in order of arrival
+        """
+        return [(item, score) for score, _, item in sorted(self._heap, reverse=True)]
+
+
+if __name__ == '__main__':
+    top = TopK(3)
+    for doc, score in [(1, 0.5), (2, 0.9), (3, 0.5), (4, 0.1), (5, 0.7), (6, 0.5)]:
+        top.push(doc, score)
+        print('offered (%d, %.1f), threshold = %.1f' % (doc, score, top.threshold))
+    print(top.results())
@@ -6,14 +6,19 @@
 @time: 2020/3/19
 @desc:
 """
-from typing import Tuple, List, Iterator, Generator
+from typing import Tuple, List, Iterator, Generator, Iterable
+from array import array
 import pickle
 
+NIL = -1  # missing child of an ArrayTreap node
+
 
 class GNode(object):
     """
     General tree node. The number of children is uncertain.
     """
+    __slots__ = ('key', '_children', 'parent')
+
     def __init__(self, key):
         self.key = key
         self._children = []
@@ -86,6 +91,8 @@ class TNode(GNode):
     Treap node which has at most two children, named left and right
     and a value of priority
     """
+    __slots__ = ('id', 'priority', 'left', 'right')
+
     def __init__(self, pair: Tuple[int, int]):
         super().__init__(pair)
         self.id = pair[0]  # (id, tf)
@@ -161,6 +168,37 @@ class Treap(object):
         self.root = None
         self.height = 0
 
+    @classmethod
+    def from_sorted(cls, pairs: Iterable[Tuple[int, int]]):
+        """
+        Build a treap in O(n) from pairs in ascending order of id, as the postings of a PostingList.
+        The treap is the Cartesian tree of the pairs: the right spine of the tree built so far is kept in a stack,
+        a new node pops the nodes of lower priority, which become its left subtree, and ends the spine.
+        Nodes of equal priority keep the smaller id above, as insert does.
+        The height of a subtree is known once its root leaves the spine.
+        :param pairs: (id, priority) in ascending order of id
+        :return:
+        """
+        treap = cls()
+        spine = []  # (node, height of its left subtree) from the root down the right spine
+        for pair in pairs:
+            node = TNode(pair)
+            last, height = None, 0  # highest node popped and height of its subtree
+            while spine and spine[-1][0].priority < node.priority:
+                last, left_height = spine.pop()
+                height = 1 + max(left_height, height)
+            node.left = last
+            if spine:
+                spine[-1][0].right = node
+            spine.append((node, height))
+        treap.root = spine[0][0] if spine else None
+        height = 0
+        while spine:
+            _, left_height = spine.pop()
+            height = 1 + max(left_height, height)
+        treap.height = height
+        return treap
+
     def insert(self, init_value: Tuple[int, int]):
         """
         Insert a new node into treap by split method
@@ -178,47 +216,80 @@ class Treap(object):
 
     def split(self, joint: TNode, key: int) -> Tuple[TNode, TNode]:
         """
-        Split tree into left sub tree and right sub tree
+        Split tree into left sub tree and right sub tree, walking down from joint:
+        a node of id larger than key goes to the right tree and the walk continues on its left,
+        any other node goes to the left tree and the walk continues on its right
         :param joint:
         :param key:
         :return:
         """
-        if joint is None:
-            return None, None
-        if joint.id > key:
-            left, joint.left = self.split(joint.left, key)
-            return left, joint
-        else:
-            joint.right, right = self.split(joint.right, key)
-            return joint, right
+        left = right = None
+        left_tail = right_tail = None  # last node of each tree, whose right / left child comes next
+        while joint is not None:
+            if joint.id > key:
+                if right_tail is None:
+                    right = joint
+                else:
+                    right_tail.left = joint
+                right_tail, joint = joint, joint.left
+            else:
+                if left_tail is None:
+                    left = joint
+                else:
+                    left_tail.right = joint
+                left_tail, joint = joint, joint.right
+        if left_tail is not None:
+            left_tail.right = None
+        if right_tail is not None:
+            right_tail.left = None
+        return left, right
 
     def merge(self, left: TNode, right: TNode) -> TNode:
         """
-        Merge two sub trees into one
+        Merge two sub trees into one, walking down the right spine of left and the left spine of right:
+        the node of higher priority is taken, on the left one for equal priorities
         :param left:
         :param right:
         :return:
         """
-        if left is None:
-            return right
-        elif right is None:
-            return left
-        elif left.priority >= right.priority:
-            left.right = self.merge(left.right, right)
-            return left
+        root = parent = None
+        parent_to_right = True
+        while left is not None and right is not None:
+            if left.priority >= right.priority:
+                node, left, to_right = left, left.right, True
+            else:
+                node, right, to_right = right, right.left, False
+            if parent is None:
+                root = node
+            elif parent_to_right:
+                parent.right = node
+            else:
+                parent.left = node
+            parent, parent_to_right = node, to_right
+        rest = left if left is not None else right
+        if parent is None:
+            return rest
+        if parent_to_right:
+            parent.right = rest
         else:
-            right.left = self.merge(left, right.left)
-            return right
+            parent.left = rest
+        return root
 
     def get_height(self, node: TNode) -> int:
         """
-        get height of the tree
+        get height of the tree, by a depth-first walk
         :param node:
         :return:
         """
-        if node is None:
-            return 0
-        return max(1, self.get_height(node.left) + 1, self.get_height(node.right) + 1)
+        height = 0
+        pending = [(node, 1)] if node is not None else []
+        while pending:
+            node, depth = pending.pop()
+            height = max(height, depth)
+            for child in (node.left, node.right):
+                if child is not None:
+                    pending.append((child, depth + 1))
+        return height
 
     def search_min_id(self) -> int:
         """
@@ -231,6 +302,188 @@ class Treap(object):
         return node.id
 
 
+class ArrayTreap(object):
+    """
+    Treap kept as parallel arrays indexed by node: id, priority, left and right child (NIL if none).
+    A node is an integer, no object is created for it. Nodes are numbered in order of insertion,
+    in ascending order of id when the treap is bulk loaded.
+    split, merge and get_height walk the tree iteratively like those of Treap.
+    """
+    def __init__(self):
+        self.ids = array('I')
+        self.priorities = array('I')
+        self.lefts = array('i')
+        self.rights = array('i')
+        self.root = NIL
+        self.height = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _new_node(self, pair: Tuple[int, int]) -> int:
+        self.ids.append(pair[0])
+        self.priorities.append(pair[1])
+        self.lefts.append(NIL)
+        self.rights.append(NIL)
+        return len(self.ids) - 1
+
+    @classmethod
+    def from_sorted(cls, pairs: Iterable[Tuple[int, int]]):
+        """
+        Build a treap in O(n) from pairs in ascending order of id, see Treap.from_sorted
+        :param pairs: (id, priority) in ascending order of id
+        :return:
+        """
+        treap = cls()
+        lefts, rights, priorities = treap.lefts, treap.rights, treap.priorities
+        spine, heights = [], []  # right spine of the tree built so far, height of the left subtree of each
+        for pair in pairs:
+            node = treap._new_node(pair)
+            last, height = NIL, 0
+            while spine and priorities[spine[-1]] < pair[1]:
+                last = spine.pop()
+                height = 1 + max(heights.pop(), height)
+            lefts[node] = last
+            if spine:
+                rights[spine[-1]] = node
+            spine.append(node)
+            heights.append(height)
+        treap.root = spine[0] if spine else NIL
+        height = 0
+        while heights:
+            height = 1 + max(heights.pop(), height)
+        treap.height = height
+        return treap
+
+    def insert(self, init_value: Tuple[int, int]):
+        """
+        Insert a new node into treap by split method
+        :param init_value:
+        :return:
+        """
+        new_node = self._new_node(init_value)
+        if self.root == NIL:
+            self.root = new_node
+        else:
+            lefts, rights = self.split(self.root, init_value[0] - 1)
+            self.root = self.merge(self.merge(lefts, new_node), rights)
+        self.height = self.get_height(self.root)
+
+    def split(self, joint: int, key: int) -> Tuple[int, int]:
+        """
+        Split tree into left sub tree and right sub tree, see Treap.split
+        :param joint:
+        :param key:
+        :return:
+        """
+        ids, lefts, rights = self.ids, self.lefts, self.rights
+        left = right = left_tail = right_tail = NIL
+        while joint != NIL:
+            if ids[joint] > key:
+                if right_tail == NIL:
+                    right = joint
+                else:
+                    lefts[right_tail] = joint
+                right_tail, joint = joint, lefts[joint]
+            else:
+                if left_tail == NIL:
+                    left = joint
+                else:
+                    rights[left_tail] = joint
+                left_tail, joint = joint, rights[joint]
+        if left_tail != NIL:
+            rights[left_tail] = NIL
+        if right_tail != NIL:
+            lefts[right_tail] = NIL
+        return left, right
+
+    def merge(self, left: int, right: int) -> int:
+        """
+        Merge two sub trees into one, see Treap.merge
+        :param left:
+        :param right:
+        :return:
+        """
+        priorities, lefts, rights = self.priorities, self.lefts, self.rights
+        root = parent = NIL
+        parent_to_right = True
+        while left != NIL and right != NIL:
+            if priorities[left] >= priorities[right]:
+                node, left, to_right = left, rights[left], True
+            else:
+                node, right, to_right = right, lefts[right], False
+            if parent == NIL:
+                root = node
+            elif parent_to_right:
+                rights[parent] = node
+            else:
+                lefts[parent] = node
+            parent, parent_to_right = node, to_right
+        rest = left if left != NIL else right
+        if parent == NIL:
+            return rest
+        if parent_to_right:
+            rights[parent] = rest
+        else:
+            lefts[parent] = rest
+        return root
+
+    def get_height(self, node: int) -> int:
+        """
+        get height of the tree, by a depth-first walk
+        :param node:
+        :return:
+        """
+        height = 0
+        pending = [(node, 1)] if node != NIL else []
+        while pending:
+            node, depth = pending.pop()
+            height = max(height, depth)
+            for child in (self.lefts[node], self.rights[node]):
+                if child != NIL:
+                    pending.append((child, depth + 1))
+        return height
+
+    def search_min_id(self) -> int:
+        """
+        Get the minimal id in the tree
+        :return:
+        """
+        node = self.root
+        while self.lefts[node] != NIL:
+            node = self.lefts[node]
+        return self.ids[node]
+
+    def compress(self) -> Tuple[List[str], List[int], List[int]]:
+        """
+        Compress treap into a normal tree as Gtree.compress_treap does, without recursion:
+        the general tree is written as balanced parentheses under a fake root,
+        a node opening, then its left subtree, closing, then its right subtree as next siblings
+        :return: parentheses, '1' for an opening one and '0' for a closing one,
+                 nodes in preorder, parent of each node in the treap (NIL for the root)
+        """
+        parentheses, nodes, parents = ['1'], [], []
+        pending = [(self.root, NIL)] if self.root != NIL else []  # (node, parent), NIL node for a closing one
+        while pending:
+            node, parent = pending.pop()
+            if node == NIL:
+                parentheses.append('0')
+                continue
+            parentheses.append('1')
+            nodes.append(node)
+            parents.append(parent)
+            if self.rights[node] != NIL:
+                pending.append((self.rights[node], node))
+            pending.append((NIL, NIL))
+            if self.lefts[node] != NIL:
+                pending.append((self.lefts[node], node))
+        parentheses.append('0')
+        return parentheses, nodes, parents
+
+    def nbytes(self) -> int:
+        return sum(column.itemsize * len(column) for column in (self.ids, self.priorities, self.lefts, self.rights))
+
+
 class Gtree:
     def __init__(self, root: GNode = None):
         self.root = root
@@ -251,20 +504,22 @@ class Gtree:
         Compress treap into a normal tree
         The left child of a treap node is its first child in the general tree.
         The right child of a treap node is its next sibling in the general tree.
+        The treap is walked depth first, a left subtree before the right one, so that children come in order.
         :param tnode: Current treap node
         :param gnode: The general node corresponding to the current treap node
         :return:
         """
-        if tnode.left is None and tnode.right is None:
-            return
-        if tnode.left is not None:
-            left_child = GNode((tnode.id - tnode.left.id, tnode.priority - tnode.left.priority))
-            gnode.children = left_child
-            self.compress_treap(tnode.left, left_child)
-        if tnode.right is not None:
-            right_sibling = GNode((tnode.right.id - tnode.id, tnode.priority - tnode.right.priority))
-            gnode.parent.children = right_sibling
-            self.compress_treap(tnode.right, right_sibling)
+        pending = [(tnode, gnode, None)]  # (treap node, its general node, general node it is appended to)
+        while pending:
+            tnode, gnode, parent = pending.pop()
+            if parent is not None:
+                parent.children = gnode
+            if tnode.right is not None:
+                right_sibling = GNode((tnode.right.id - tnode.id, tnode.priority - tnode.right.priority))
+                pending.append((tnode.right, right_sibling, gnode.parent))
+            if tnode.left is not None:
+                left_child = GNode((tnode.id - tnode.left.id, tnode.priority - tnode.left.priority))
+                pending.append((tnode.left, left_child, gnode))
 
 
 if __name__ == "__main__":
@@ -285,6 +540,9 @@ if __name__ == "__main__":
     print("treap height = ", TREAP.height)
     TREAP.root.display()
     print("min id = ", TREAP.search_min_id())
+    BULK = Treap.from_sorted(sorted(fake_posting_lists[('reverse', 0)]))
+    print("bulk loaded treap height = ", BULK.height)
+    BULK.root.display()
     with open('saved_treap', 'wb') as st:
         pickle.dump(TREAP, st)
     GENERAL_TREE = Gtree()
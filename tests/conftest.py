@@ -0,0 +1,28 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: conftest.py
+@time: 2020/5/7
+@desc: Indexes shared by the tests of the ranked retrieval strategies.
+"""
+import os
+import pytest
+from Project.InvertedIndex import InvertedIndex, save_binary_index, open_inverted_index
+from tests.helpers import random_corpus
+
+
+@pytest.fixture(scope='module')
+def index():
+    doc_id, bag = random_corpus(1500)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype='freq')
+    return ii
+
+
+@pytest.fixture(scope='module')
+def mapped(index, tmp_path_factory):
+    path = save_binary_index(index, os.path.join(str(tmp_path_factory.mktemp('binary')), 'binary.ii'))[0]
+    mapped = open_inverted_index(path)
+    yield mapped
+    mapped.close()
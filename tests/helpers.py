@@ -0,0 +1,61 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: helpers.py
+@time: 2020/5/7
+@desc: Random corpora and reference computations shared by the tests.
+"""
+import random
+from collections import Counter
+from math import isclose
+from typing import Dict, List, Tuple
+from Restitution_of_article.TopK import TopK
+
+VOCABULARY = ['term%d' % i for i in range(300)]
+ZIPF = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+
+
+def random_corpus(doc_num: int, seed: int = 3, first: int = 0) -> Tuple[Dict, Dict]:
+    """
+    Documents of Zipf-distributed terms
+    :param doc_num:
+    :param seed:
+    :param first: id of the first document
+    :return: doc_id: mapping from document id to document url name, bag: tokens of each document
+    """
+    rnd = random.Random(seed)
+    doc_id = {doc: 'doc%d' % doc for doc in range(first, first + doc_num)}
+    bag = {doc: rnd.choices(VOCABULARY, ZIPF, k=rnd.randint(5, 80)) for doc in doc_id}
+    return doc_id, bag
+
+
+def random_queries(query_num: int = 60, seed: int = 5) -> List[Counter]:
+    """
+    :return: query vectors of 1 to 6 terms, with a term absent from every index
+    """
+    rnd = random.Random(seed)
+    return [Counter(rnd.choices(VOCABULARY, ZIPF, k=rnd.randint(1, 6))) + Counter(['absent'])
+            for _ in range(query_num)]
+
+
+def top_k(scores: Dict[int, float], k: int) -> List[Tuple[int, float]]:
+    """
+    k best scores, ties by ascending document id
+    """
+    top = TopK(k)
+    for doc in sorted(scores):
+        top.push(doc, scores[doc])
+    return top.results()
+
+
+def same_top_k(results: list, reference: list, abs_tol: float = 1e-12) -> bool:
+    """
+    Same scores within rounding errors, and the same documents apart from ties with the k-th score
+    """
+    if len(results) != len(reference) or \
+            not all(isclose(score, other, abs_tol=abs_tol) for (_, score), (_, other) in zip(results, reference)):
+        return False
+    last = reference[-1][1] if reference else None
+    return {doc for doc, score in results if not isclose(score, last, abs_tol=abs_tol)} == \
+        {doc for doc, score in reference if not isclose(score, last, abs_tol=abs_tol)}
@@ -0,0 +1,74 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: test_binary_index.py
+@time: 2020/5/7
+@desc: Memory-mapped binary indexes checked against the same index saved in the pickled format.
+"""
+import os
+import pytest
+from Project.InvertedIndex import InvertedIndex, MappedInvertedIndex, save_inverted_index, save_binary_index, \
+    open_inverted_index, load_mapped_index, is_index_file, INDEX_EXT, LEXICON_EXT, POSTINGS_EXT
+from Project.QueryCache import QueryCache
+from tests.helpers import random_corpus
+from tests.test_indexing import index_postings
+
+
+@pytest.mark.parametrize('codec', ['raw', 'vbyte', 'pfor'])
+@pytest.mark.parametrize('itype', ['doc', 'freq', 'pos'])
+def test_binary_index_matches_pickle(codec, itype, tmp_path):
+    doc_id, bag = random_corpus(200)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype=itype)
+    pickled_path = os.path.join(str(tmp_path), 'pickled.ii')
+    save_inverted_index(ii, pickled_path, codec=codec)
+    pickled = open_inverted_index(pickled_path)
+    lex_path, post_path = save_binary_index(ii, os.path.join(str(tmp_path), 'binary.ii'), codec=codec)
+    assert lex_path.endswith(LEXICON_EXT) and post_path.endswith(POSTINGS_EXT)
+    mapped = open_inverted_index(lex_path)
+    assert isinstance(mapped, MappedInvertedIndex)
+    assert (mapped.iitype, mapped.D, mapped.doc_id) == (pickled.iitype, pickled.D, pickled.doc_id)
+    assert sorted(mapped.keys()) == sorted(pickled.keys()) and len(mapped) == len(pickled)
+    assert index_postings(mapped) == index_postings(pickled)
+    assert 'absent' not in mapped and mapped.get('absent') is None
+    assert all(mapped.get_doc_url(doc) == pickled.get_doc_url(doc) for doc in doc_id)
+    if itype != 'doc':
+        assert list(mapped.get_norms()) == list(pickled.get_norms())
+        for term in pickled.keys():
+            assert mapped.idf(term) == pickled.idf(term)
+            assert mapped.get_block_max(term) == pickled.get_block_max(term)
+            assert [list(tier.postings()) for tier in mapped.get_champions(term)] == \
+                [list(tier.postings()) for tier in pickled.get_champions(term)]
+    assert index_postings(load_mapped_index(mapped)) == index_postings(pickled)
+    mapped.close()
+
+
+def test_terms_are_decoded_lazily(tmp_path):
+    doc_id, bag = random_corpus(200)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype='freq')
+    mapped = open_inverted_index(save_binary_index(ii, os.path.join(str(tmp_path), 'lazy.ii'))[0])
+    cache = QueryCache()
+    mapped.attach_cache(cache, 'lazy')
+    assert mapped.df('term3') == ii['term3'].df
+    assert mapped.idf('term3') == ii.idf('term3')
+    assert mapped.get_block_max('term3') == ii.get_block_max('term3')
+    assert {key[1:] for key in cache.entries} == {('term3', mapped.version, 'idf'),
+                                                  ('term3', mapped.version, 'block_max')}
+    mapped.close()
+
+
+def test_corrupted_file_is_rejected(tmp_path):
+    path = os.path.join(str(tmp_path), 'bad' + LEXICON_EXT)
+    with open(path, 'wb') as f:
+        f.write(b'\0' * 64)
+    with open(os.path.join(str(tmp_path), 'bad' + POSTINGS_EXT), 'wb') as f:
+        f.write(b'\0' * 64)
+    with pytest.raises(ValueError):
+        MappedInvertedIndex(path)
+
+
+def test_index_files_of_a_folder():
+    files = ['a' + INDEX_EXT, 'b' + LEXICON_EXT, 'b' + POSTINGS_EXT, 'notes.txt', '.DS_Store', 'c.ii.tmp']
+    assert [file for file in files if is_index_file(file)] == ['a' + INDEX_EXT, 'b' + LEXICON_EXT]
@@ -0,0 +1,42 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: test_boolean_merge.py
+@time: 2020/5/7
+@desc: Boolean operators on sorted arrays of document ids checked against Python sets.
+"""
+import random
+from array import array
+import pytest
+from Project.BooleanMerge import gallop, intersect, union, difference, merge_intersect, skip_intersect, \
+    gallop_intersect, merge_union, gallop_union, merge_difference, gallop_difference
+
+OPERANDS = [(universe, size1, size2) for universe in (50, 5000, 300000)
+            for size1, size2 in ((0, 10), (10, 10), (3, 2000), (2000, 1500), (20000, 40))]
+
+
+def random_docs(rnd: random.Random, universe: int, size: int) -> array:
+    return array('I', sorted(rnd.sample(range(universe), min(size, universe))))
+
+
+def test_gallop():
+    docs = array('I', [2, 4, 4, 9, 30])
+    assert [gallop(docs, doc) for doc in (0, 2, 3, 4, 9, 10, 31)] == [0, 0, 1, 1, 3, 4, 5]
+    assert gallop(docs, 4, 2) == 2
+
+
+@pytest.mark.parametrize('universe, size1, size2', OPERANDS)
+def test_sorted_array_operators(universe, size1, size2):
+    rnd = random.Random(universe + size1 + size2)
+    docs1, docs2 = random_docs(rnd, universe, size1), random_docs(rnd, universe, size2)
+    for operands in ((docs1, docs2), (docs2, docs1)):
+        expected = sorted(set(operands[0]) & set(operands[1]))
+        for function in (intersect, merge_intersect, skip_intersect, gallop_intersect):
+            assert list(function(*operands)) == expected, function.__name__
+        expected = sorted(set(operands[0]) | set(operands[1]))
+        for function in (union, merge_union, gallop_union):
+            assert list(function(*operands)) == expected, function.__name__
+        expected = sorted(set(operands[0]) - set(operands[1]))
+        for function in (difference, merge_difference, gallop_difference):
+            assert list(function(*operands)) == expected, function.__name__
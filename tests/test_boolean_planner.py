@@ -0,0 +1,58 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: test_boolean_planner.py
+@time: 2020/5/7
+@desc: Plans of random boolean queries checked against Python sets.
+"""
+import random
+from array import array
+import pytest
+from Project.BooleanPlanner import compile_plan, evaluate
+from Project.InvertedIndex import InvertedIndex
+
+
+@pytest.fixture(scope='module')
+def boolean_index():
+    rnd = random.Random(7)
+    doc_id = {doc: 'doc%d' % doc for doc in range(300)}
+    bag = {doc: [term for term in 'abcdef' if rnd.random() < 0.1 + 0.15 * 'abcdef'.index(term)]
+           for doc in doc_id}
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype='doc')
+    return ii, {term: {doc for doc, terms in bag.items() if term in terms} for term in 'abcdef'}
+
+
+def random_query(rnd: random.Random, depth: int = 0):
+    """
+    :return: postfix tokens and the matching documents as a function of the sets of the terms
+    """
+    if depth > 2 or rnd.random() < 0.3:
+        term = rnd.choice('abcdef')
+        return [term], lambda sets: sets[term]
+    if rnd.random() < 0.2:
+        tokens, docs = random_query(rnd, depth + 1)
+        return tokens + ['not'], lambda sets: sets['*'] - docs(sets)
+    tokens1, docs1 = random_query(rnd, depth + 1)
+    tokens2, docs2 = random_query(rnd, depth + 1)
+    if rnd.random() < 0.5:
+        return tokens1 + tokens2 + ['and'], lambda sets: docs1(sets) & docs2(sets)
+    return tokens1 + tokens2 + ['or'], lambda sets: docs1(sets) | docs2(sets)
+
+
+def test_plans_match_set_operations(boolean_index):
+    ii, sets = boolean_index
+    universe = array('I', sorted(ii.doc_id))
+    sets = dict(sets, **{'*': set(universe)})
+    rnd = random.Random(11)
+    for _ in range(300):
+        postfix, docs = random_query(rnd)
+        plan = compile_plan(postfix, ii, universe)
+        assert list(evaluate(plan)) == sorted(docs(sets)), postfix
+        assert list(compile_plan(postfix, ii, universe).docs()) == sorted(docs(sets)), postfix
+
+
+def test_malformed_plan_is_empty(boolean_index):
+    ii, _ = boolean_index
+    assert list(evaluate(compile_plan(['a', 'and'], ii, array('I', sorted(ii.doc_id))))) == []
@@ -0,0 +1,64 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: test_codecs.py
+@time: 2020/5/7
+@desc: Round trips of the posting codecs, on integers and on the columns of posting lists.
+"""
+import os
+import random
+from array import array
+import pytest
+from Project.Codecs import CODECS, VByteCodec, get_codec
+from Project.InvertedIndex import InvertedIndex, PostingList, save_inverted_index, load_inverted_index
+from tests.helpers import random_corpus
+from tests.test_indexing import index_postings
+
+EDGES = [0, 1, 127, 128, 16383, 16384, 2 ** 31, 2 ** 32 - 1]
+
+
+def random_values(rnd: random.Random, size: int) -> list:
+    """
+    Small gaps with rare large ones, as in posting lists
+    """
+    return [rnd.choice(EDGES) if rnd.random() < 0.05 else rnd.randint(0, 300) for _ in range(size)]
+
+
+@pytest.mark.parametrize('name', sorted(CODECS))
+def test_round_trip(name):
+    codec = get_codec(name)
+    rnd = random.Random(name)
+    for size in (0, 1, 2, 127, 128, 129, 1000):
+        values = random_values(rnd, size)
+        assert list(codec.decode(codec.encode(values))) == values
+    assert list(codec.decode(codec.encode(EDGES))) == EDGES
+    assert list(codec.decode(codec.encode([2 ** 32 - 1] * 300))) == [2 ** 32 - 1] * 300
+
+
+def test_vbyte_layout():
+    codec = VByteCodec()
+    assert codec.encode([300]) == bytes([0b10101100, 0b00000010])
+    data = codec.encode([5, 300, 7, 9])
+    values, offset = VByteCodec.decode_from(data, 1, 2)
+    assert list(values) == [300, 7] and offset == 4
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        get_codec('zip')
+
+
+@pytest.mark.parametrize('name', sorted(CODECS))
+@pytest.mark.parametrize('itype', ['doc', 'freq', 'pos'])
+def test_posting_lists_round_trip(name, itype, tmp_path):
+    doc_id, bag = random_corpus(200)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype=itype)
+    codec = get_codec(name)
+    for term, posting_list in ii.items():
+        decoded = PostingList.decode(posting_list.df, posting_list.encode(codec), codec)
+        assert list(decoded.postings()) == list(posting_list.postings()), term
+    path = os.path.join(str(tmp_path), name + '.ii')
+    save_inverted_index(ii, path, codec=name)
+    assert index_postings(load_inverted_index(path)) == index_postings(ii)
@@ -0,0 +1,55 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: test_dynamic_pruning.py
+@time: 2020/5/7
+@desc: WAND, Block-Max WAND and MaxScore checked against the exhaustive scoring of VectorialModule,
+       in memory and on a memory-mapped index.
+"""
+from collections import Counter
+from math import log10
+import pytest
+from Project.InvertedIndex import InvertedIndex
+from Project.QueryModule import VectorialModule
+from Project.DynamicPruning import wand, maxscore
+from tests.helpers import random_queries, same_top_k, top_k
+
+
+def exhaustive_top_k(ii: InvertedIndex, vector_q: Counter, k: int) -> list:
+    module = VectorialModule(' '.join(vector_q.elements()))
+    return module.get_descending_scores(module.get_scores(ii), k)
+
+
+@pytest.mark.parametrize('k', [1, 10, 100])
+def test_wand_top_k(index, mapped, k):
+    for vector_q in random_queries():
+        reference = exhaustive_top_k(index, vector_q, k)
+        for ii in (index, mapped):
+            assert same_top_k(wand(ii, vector_q, k, block_max=False)[0], reference)
+            assert same_top_k(wand(ii, vector_q, k)[0], reference)
+
+
+def test_pruning_skips_postings(index):
+    vector_q = Counter(['term0', 'term1', 'term250'])
+    stats = wand(index, vector_q, 10)[1]
+    assert stats.skipped > 0 and stats.scored + stats.skipped <= stats.total
+
+
+@pytest.mark.parametrize('k', [1, 10, 100])
+def test_maxscore_top_k(index, mapped, k):
+    for vector_q in random_queries():
+        reference = exhaustive_top_k(index, vector_q, k)
+        for ii in (index, mapped):
+            assert same_top_k(maxscore(ii, vector_q, k)[0], reference)
+
+
+def test_maxscore_sum_of_idf_tf(index):
+    for vector_q in random_queries():
+        scores = Counter()
+        for term, tf_q in vector_q.items():
+            if term in index.keys():
+                posting = index[term]
+                for doc, tf in zip(posting.docs, posting.tfs):
+                    scores[doc] += tf_q * log10(index.D / posting.df) * tf
+        assert same_top_k(maxscore(index, vector_q, 10, normalized=False)[0], top_k(scores, 10))
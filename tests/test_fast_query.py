@@ -0,0 +1,60 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: test_fast_query.py
+@time: 2020/5/7
+@desc: FastQuery on object, array and succinct treaps, checked against the sum of idf * tf computed
+       document by document.
+"""
+import random
+from array import array
+from math import isclose, log10
+import pytest
+from Restitution_of_article.Treap import Treap, ArrayTreap
+from Restitution_of_article.SuccinctTreap import SuccinctTreap, encode_treap
+from Restitution_of_article.FastQuery import intersection, union, array_intersection, array_union
+from tests.test_treap import random_postings
+
+
+def fast_query_treaps(kind: str, postings: dict) -> dict:
+    """
+    :param kind: object/array/succinct
+    :param postings: key: term, value: postings of random_postings
+    :return: key: term, value: (df, treap)
+    """
+    if kind == 'object':
+        return {term: (len(p), Treap.from_sorted(p.items())) for term, p in postings.items()}
+    if kind == 'array':
+        return {term: (len(p), ArrayTreap.from_sorted(p.items())) for term, p in postings.items()}
+    return {term: (len(p), SuccinctTreap(encode_treap(array('I', p), array('I', p.values()))))
+            for term, p in postings.items()}
+
+
+def same_scores(results: list, reference: dict, k: int) -> bool:
+    """
+    Results hold the k best scores of the reference, each with its document score
+    """
+    best = sorted(reference.values(), reverse=True)[:k]
+    return len(results) == len(best) and all(isclose(score, other, abs_tol=1e-9)
+                                             for (_, score), other in zip(results, best)) \
+        and all(isclose(reference[doc], score, abs_tol=1e-9) for doc, score in results)
+
+
+@pytest.mark.parametrize('kind', ['object', 'array', 'succinct'])
+def test_fast_query_scores_are_sums_of_idf_tf(kind):
+    functions = {'array': (array_intersection, array_union)}.get(kind, (intersection, union))
+    rnd = random.Random(kind)
+    for _ in range(300):
+        D = rnd.choice([30, 300, 3000])
+        postings = {'t%d' % i: random_postings(rnd, D) for i in range(rnd.randint(1, 8))}
+        terms = list(postings) + [rnd.choice(list(postings))]  # a repeated term counts once
+        k = rnd.choice([1, 5, D + 1])
+        scores = dict()
+        for term, p in postings.items():
+            for doc, tf in p.items():
+                scores[doc] = scores.get(doc, 0.0) + log10(D / len(p)) * tf
+        common = set.intersection(*(set(p) for p in postings.values()))
+        treaps = fast_query_treaps(kind, postings)
+        assert same_scores(list(functions[0](terms, treaps, k, D)), {doc: scores[doc] for doc in common}, k)
+        assert same_scores(list(functions[1](terms, treaps, k, D)), scores, k)
@@ -0,0 +1,43 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: test_impact_ordered.py
+@time: 2020/5/7
+@desc: Score-at-a-time evaluation of impact-ordered segments checked against the exhaustive sum of the
+       quantized impacts, in memory and on a memory-mapped index.
+"""
+from collections import Counter
+from math import isclose, sqrt
+import pytest
+from Project.InvertedIndex import save_binary_index, open_inverted_index
+from Project.ImpactOrdered import ImpactIndex, score_at_a_time
+from Project.QueryCache import QueryCache
+from tests.helpers import random_queries, same_top_k, top_k
+
+
+@pytest.mark.parametrize('k', [1, 10, 50])
+def test_score_at_a_time_early_stop_is_exact(index, mapped, k):
+    for ii in (index, mapped):
+        impact_index = ImpactIndex(ii)
+        assert impact_index.max_impact == index.get_max_impact()
+        for vector_q in random_queries():
+            weights = {term: tf_q * ii.idf(term) for term, tf_q in vector_q.items() if term in ii.keys()}
+            norm_q = sqrt(sum(weight * weight for weight in weights.values()))
+            scores = Counter()
+            for term, weight in weights.items():
+                for level, docs in impact_index.segments(term):
+                    for doc in docs:
+                        scores[doc] += weight / norm_q * impact_index.impact(level)
+            results, stats = score_at_a_time(impact_index, vector_q, k)
+            assert same_top_k(results, top_k(scores, k))
+            assert all(isclose(score, scores[doc], abs_tol=1e-12) for doc, score in results)
+
+
+def test_mapped_impact_index_is_lazy(index, tmp_path):
+    mapped = open_inverted_index(save_binary_index(index, str(tmp_path / 'lazy.ii'))[0])
+    cache = QueryCache()
+    mapped.attach_cache(cache, 'lazy')
+    assert ImpactIndex(mapped).max_impact == index.get_max_impact()
+    assert len(cache) == 0 and cache.misses == 0
+    mapped.close()
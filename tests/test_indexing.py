@@ -0,0 +1,53 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: test_indexing.py
+@time: 2020/5/7
+@desc: Inverted indexes built in one pass over the bag, checked against the former scan of every term
+       of every document.
+"""
+import pytest
+from Project.InvertedIndex import InvertedIndex
+from tests.helpers import random_corpus
+
+
+def scanned_postings(bag: dict, itype: str, stop_words: set = frozenset()) -> dict:
+    """
+    Postings of the former indexation: positions enumerate the tokens of the document left after stop words
+    :return: key: term, value: sorted postings as given by PostingList.postings, positions decoded
+    """
+    postings = dict()
+    for doc, terms in bag.items():
+        terms = [term for term in terms if term not in stop_words]
+        for term in set(terms):
+            if itype == 'doc':
+                posting = doc
+            elif itype == 'freq':
+                posting = (doc, terms.count(term))
+            else:
+                posting = (doc, terms.count(term), [i for i, t in enumerate(terms) if t == term])
+            postings.setdefault(term, []).append(posting)
+    return {term: sorted(term_postings) for term, term_postings in postings.items()}
+
+
+def index_postings(ii: InvertedIndex) -> dict:
+    return {term: [(posting[0], posting[1], posting[2].decode()) if ii.iitype == 'pos' else posting
+                   for posting in posting_list.postings()]
+            for term, posting_list in ii.items()}
+
+
+@pytest.mark.parametrize('itype', ['doc', 'freq', 'pos'])
+@pytest.mark.parametrize('stop_words', [frozenset(), frozenset({'term0', 'term1', 'term7'})])
+def test_single_pass_matches_term_scan(itype, stop_words):
+    doc_id, bag = random_corpus(300)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype=itype, stop_words=set(stop_words))
+    assert ii.iitype == itype and ii.D == len(doc_id)
+    assert index_postings(ii) == scanned_postings(bag, itype, stop_words)
+    assert all(posting_list.df == len(posting_list) for posting_list in ii.values())
+
+
+def test_unknown_index_type():
+    with pytest.raises(ValueError):
+        InvertedIndex().get_inverted_index({1: 'a'}, {1: ['x']}, itype='bits')
@@ -0,0 +1,77 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: test_merged_index.py
+@time: 2020/5/7
+@desc: Indexes of sub-collections merged into a global document id space, checked against the index of the
+       whole collection and against the index of every sub-collection.
+"""
+from math import isclose
+import pytest
+from Project.InvertedIndex import InvertedIndex, merge_inverted_indexes
+from Project.QueryModule import VectorialModule
+from tests.helpers import random_corpus, random_queries
+from tests.test_indexing import index_postings
+
+SHARDS = [('cs276/0', 150, 3), ('cs276/1', 120, 4), ('cs276/2', 90, 5)]
+
+
+def shard_indexes(itype: str) -> list:
+    """
+    :return: (name, document ids starting at 1, bag, inverted index) of each sub-collection
+    """
+    shards = []
+    for name, doc_num, seed in SHARDS:
+        doc_id, bag = random_corpus(doc_num, seed=seed, first=1)
+        ii = InvertedIndex()
+        ii.get_inverted_index(doc_id, bag, itype=itype)
+        shards.append((name, doc_id, bag, ii))
+    return shards
+
+
+@pytest.mark.parametrize('itype', ['doc', 'freq', 'pos'])
+def test_merged_index_matches_whole_collection(itype):
+    shards = shard_indexes(itype)
+    merged = merge_inverted_indexes((name, ii) for name, _, _, ii in shards)
+    whole_doc_id, whole_bag, offset = dict(), dict(), 0
+    for name, doc_id, bag, _ in shards:
+        assert merged.shard_ranges[name] == (offset + 1, offset + len(doc_id))
+        whole_doc_id.update((doc + offset, url) for doc, url in doc_id.items())
+        whole_bag.update((doc + offset, terms) for doc, terms in bag.items())
+        offset += len(doc_id)
+    whole = InvertedIndex()
+    whole.get_inverted_index(whole_doc_id, whole_bag, itype=itype)
+    assert merged.iitype == itype and merged.D == whole.D == offset
+    assert merged.doc_id == whole_doc_id
+    assert index_postings(merged) == index_postings(whole)
+    assert all(merged[term].df == whole[term].df for term in whole.keys())
+    if itype != 'doc':
+        assert all(isclose(merged.idf(term), whole.idf(term)) for term in whole.keys())
+        assert all(isclose(a, b) for a, b in zip(merged.get_norms(), whole.get_norms()))
+        for query in random_queries(20):
+            module = VectorialModule(' '.join(query.elements()))
+            merged_scores, whole_scores = module.get_scores(merged), module.get_scores(whole)
+            assert merged_scores.keys() == whole_scores.keys()
+            assert all(isclose(merged_scores[doc], whole_scores[doc]) for doc in whole_scores)
+
+
+def test_merged_postings_are_shifted_shard_postings():
+    shards = shard_indexes('pos')
+    merged = merge_inverted_indexes((name, ii) for name, _, _, ii in shards)
+    merged_postings = index_postings(merged)
+    for name, _, _, ii in shards:
+        first, last = merged.shard_ranges[name]
+        for term, postings in index_postings(ii).items():
+            shard_part = [(doc - first + 1, tf, positions) for doc, tf, positions in merged_postings[term]
+                          if first <= doc <= last]
+            assert shard_part == postings
+
+
+def test_indexes_of_different_types_are_not_merged():
+    shards = shard_indexes('freq')
+    doc_id, bag = random_corpus(10, first=1)
+    other = InvertedIndex()
+    other.get_inverted_index(doc_id, bag, itype='doc')
+    with pytest.raises(ValueError):
+        merge_inverted_indexes([(shards[0][0], shards[0][3]), ('other', other)])
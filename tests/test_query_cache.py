@@ -0,0 +1,115 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: test_query_cache.py
+@time: 2020/5/7
+@desc: Greedy-Dual-Size-Frequency eviction of the query cache, on a clock of known build costs,
+       and the values of the indexes kept in it.
+"""
+import os
+import pytest
+import Project.QueryCache as query_cache
+from Project.InvertedIndex import InvertedIndex, save_binary_index, open_inverted_index
+from Project.QueryCache import QueryCache
+from tests.helpers import random_corpus
+
+
+class Clock(object):
+    """
+    perf_counter of the cache, advanced by the builds only
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def build(self, value: str, cost: float):
+        def build():
+            self.now += cost
+            return value
+        return build
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(query_cache, 'perf_counter', clock)
+    return clock
+
+
+def test_eviction_order(clock):
+    cache = QueryCache(budget=100)
+    cache.get('a', clock.build('a' * 40, 1), len)  # priority 1 / 40
+    cache.get('b', clock.build('b' * 40, 4), len)  # priority 4 / 40
+    assert cache.get('a', clock.build('', 0), len) == 'a' * 40  # used twice: priority 2 / 40
+    cache.get('c', clock.build('c' * 40, 2), len)  # a is evicted, the clock takes its priority 2 / 40
+    assert 'a' not in cache and cache.clock == pytest.approx(2 / 40)
+    cache.get('d', clock.build('d' * 20, 1), len)  # fits, priority 2 / 40 + 1 / 20 = 4 / 40
+    cache.get('e', clock.build('e' * 30, 1), len)  # b, c and d have priority 4 / 40: b, the oldest, is evicted
+    assert sorted(cache.entries) == ['c', 'd', 'e']
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 5, 2)
+    assert cache.nbytes == 90
+
+
+def test_frequent_values_stay(clock):
+    cache = QueryCache(budget=100)
+    cache.get('frequent', clock.build('f' * 50, 1), len)
+    for key in 'abcdefgh':
+        cache.get('frequent', clock.build('', 0), len)
+        cache.get(key, clock.build(key * 50, 1), len)
+    assert 'frequent' in cache and cache.hits == 8 and cache.evictions == 7
+
+
+def test_byte_bound(clock):
+    cache = QueryCache(budget=100)
+    for i in range(50):
+        cache.get(i, clock.build('x' * (i % 7 * 10 + 5), 1), len)
+        assert cache.nbytes == sum(entry[1] for entry in cache.entries.values()) <= cache.budget
+    assert cache.get('large', clock.build('x' * 101, 1), len) == 'x' * 101
+    assert 'large' not in cache and cache.nbytes <= cache.budget
+    cache.discard(49)
+    assert 49 not in cache and cache.nbytes == sum(entry[1] for entry in cache.entries.values())
+
+
+def test_hits_and_misses(clock):
+    cache = QueryCache(budget=1000)
+    for key in ['a', 'b', 'a', 'c', 'a', 'b']:
+        cache.get(key, clock.build(key * 10, 1), len)
+    assert (cache.hits, cache.misses, cache.evictions) == (3, 3, 0)
+    assert cache.hit_rate == 0.5 and len(cache) == 3
+
+
+def test_values_of_a_mapped_index(tmp_path):
+    doc_id, bag = random_corpus(300)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype='freq')
+    path = save_binary_index(ii, os.path.join(str(tmp_path), 'cached.ii'), treaps=True)[0]
+    cache = QueryCache()
+    for _ in range(2):  # the treaps released by close are not served again
+        mapped = open_inverted_index(path)
+        mapped.attach_cache(cache, 'cached')
+        treap = mapped.get_treap('term3')
+        assert mapped.get_treap('term3') is treap
+        assert list(treap.nodes()) == list(ii.get_treap('term3').nodes())
+        assert mapped.get_champions('term3') is mapped.get_champions('term3')
+        assert mapped.get_block_max('term3') is mapped.get_block_max('term3')
+        assert mapped.idf('term3') == ii.idf('term3')
+        assert {key[3] for key in cache.entries} == {'succinct', 'champions', 'block_max', 'idf'}
+        mapped.close()
+        assert all(key[3] != 'succinct' for key in cache.entries)
+
+
+def test_treaps_of_an_index_in_memory():
+    doc_id, bag = random_corpus(300)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype='freq')
+    cache = QueryCache()
+    ii.attach_cache(cache, 'memory')
+    built = ii.get_treap('term3')
+    assert ii.get_treap('term3') is built
+    ii.compute_treaps()
+    saved = ii.get_treap('term3')
+    assert ii.get_treap('term3') is saved and list(saved.nodes()) == list(built.nodes())
+    assert (cache.hits, cache.misses) == (2, 2)
@@ -0,0 +1,36 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: test_roaring_bitmap.py
+@time: 2020/5/7
+@desc: Operators of the compressed bitmaps checked against Python sets, on every kind of container.
+"""
+import random
+from array import array
+import pytest
+from Project.RoaringBitmap import RoaringBitmap
+from tests.test_boolean_merge import OPERANDS, random_docs
+
+
+@pytest.mark.parametrize('universe, size1, size2', OPERANDS)
+def test_roaring_bitmap_operators(universe, size1, size2):
+    rnd = random.Random(universe * size1 + size2)
+    docs1, docs2 = random_docs(rnd, universe, size1), random_docs(rnd, universe, size2)
+    bitmap1, bitmap2 = RoaringBitmap.from_docs(docs1), RoaringBitmap.from_docs(docs2)
+    assert list(bitmap1) == list(docs1) and len(bitmap1) == len(docs1)
+    assert list((bitmap1 & bitmap2).to_array()) == sorted(set(docs1) & set(docs2))
+    assert list((bitmap1 | bitmap2).to_array()) == sorted(set(docs1) | set(docs2))
+    assert list((bitmap1 - bitmap2).to_array()) == sorted(set(docs1) - set(docs2))
+    assert all(doc in bitmap1 for doc in docs1[:100])
+    assert not any(doc in bitmap1 for doc in set(docs2[:100]) - set(docs1))
+
+
+def test_roaring_bitmap_containers():
+    runs = RoaringBitmap.from_docs(array('I', range(1, 200001)))
+    evens = RoaringBitmap.from_docs(array('I', range(2, 200001, 2)))
+    few = RoaringBitmap.from_docs(array('I', [3, 4, 70000, 150001]))
+    assert list(evens & few) == [4, 70000]
+    assert list(few - evens) == [3, 150001]
+    assert list(evens.complement(runs)) == list(range(1, 200001, 2))
+    assert runs.nbytes() < evens.nbytes()
@@ -0,0 +1,33 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: test_spimi.py
+@time: 2020/5/7
+@desc: Block-based indexation spilled in several runs, checked against the indexation of the whole bag.
+"""
+import os
+from math import isclose
+import pytest
+from Project.InvertedIndex import InvertedIndex, SpimiIndexer
+from tests.helpers import random_corpus
+from tests.test_indexing import index_postings
+
+
+@pytest.mark.parametrize('itype', ['doc', 'freq', 'pos'])
+@pytest.mark.parametrize('stop_words', [frozenset(), frozenset({'term0', 'term1', 'term7'})])
+def test_spimi_matches_bag_indexation(itype, stop_words, tmp_path):
+    doc_id, bag = random_corpus(300, first=1)
+    indexer = SpimiIndexer(itype=itype, memory_budget=20000, tmp_dir=str(tmp_path))
+    for doc in sorted(bag):
+        indexer.add_document(doc, bag[doc])
+    assert len(indexer.runs) > 3
+    spimi = indexer.merge(doc_id, set(stop_words))
+    assert os.listdir(str(tmp_path)) == []
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype=itype, stop_words=set(stop_words))
+    assert (spimi.iitype, spimi.D, spimi.doc_id) == (ii.iitype, ii.D, ii.doc_id)
+    assert index_postings(spimi) == index_postings(ii)
+    if itype != 'doc':
+        assert len(spimi.get_norms()) == len(ii.get_norms())
+        assert all(isclose(a, b) for a, b in zip(spimi.get_norms(), ii.get_norms()))  # terms summed in another order
@@ -0,0 +1,61 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: test_succinct_treap.py
+@time: 2020/5/7
+@desc: Treaps encoded as balanced parentheses checked against the bulk-loaded treaps,
+       and the treaps saved with an index only on demand.
+"""
+import os
+import random
+from array import array
+import pytest
+from Project.InvertedIndex import InvertedIndex, save_inverted_index, save_binary_index, open_inverted_index
+from Restitution_of_article.SuccinctTreap import SuccinctTreap, encode_treap
+from Restitution_of_article.Treap import Treap
+from tests.helpers import random_corpus
+from tests.test_treap import random_postings
+
+
+def preorder(treap: Treap):
+    pending = [treap.root] if treap.root is not None else []
+    while pending:
+        node = pending.pop()
+        yield node.id, node.priority
+        pending.extend(child for child in (node.right, node.left) if child is not None)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_succinct_treap_of_a_posting_list(seed):
+    rnd = random.Random(seed)
+    postings = sorted(random_postings(rnd, rnd.choice([10, 1000, 20000])).items())
+    succinct = SuccinctTreap(encode_treap(array('I', [doc for doc, _ in postings]),
+                                          array('I', [tf for _, tf in postings])))
+    assert len(succinct) == len(postings)
+    assert list(succinct.nodes()) == list(preorder(Treap.from_sorted(postings)))
+    assert succinct.search_min_id() == postings[0][0]
+
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_treaps_are_saved_on_demand(binary, tmp_path):
+    doc_id, bag = random_corpus(300)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype='freq')
+    assert ii.treaps is None and ii.block_maxes is None and ii.champions is None
+    expected = {term: list(preorder(Treap.from_sorted(posting.postings()))) for term, posting in ii.items()}
+    for treaps in (False, True):
+        path = os.path.join(str(tmp_path), 'treaps.ii' if treaps else 'postings.ii')
+        if binary:
+            path = save_binary_index(ii, path, treaps=treaps)[0]
+        else:
+            save_inverted_index(ii, path, treaps=treaps)
+        saved = open_inverted_index(path)
+        stored = saved._treap_offset if binary else saved.treaps
+        assert (stored is not None) == treaps
+        assert {term: list(saved.get_treap(term).nodes()) for term in saved.keys()} == expected
+        with pytest.raises(KeyError):
+            saved.get_treap('absent')
+        if binary:
+            saved.close()
+    assert ii.treaps is not None
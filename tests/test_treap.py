@@ -0,0 +1,95 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: test_treap.py
+@time: 2020/5/7
+@desc: Treaps bulk loaded from doc-sorted postings as objects and as arrays, checked for the order of the ids
+       and of the priorities.
+"""
+import random
+import pytest
+from Restitution_of_article.Treap import Treap, ArrayTreap, NIL
+
+
+def random_postings(rnd: random.Random, D: int) -> dict:
+    """
+    :return: key: document id in [1, D], value: tf
+    """
+    docs = rnd.sample(range(1, D + 1), rnd.randint(1, max(1, D // rnd.choice([1, 2, 3, 30]))))
+    return {doc: rnd.choice([1, 2, 3, 5, 20]) for doc in sorted(docs)}
+
+
+def check_nodes(treap: Treap) -> int:
+    """
+    Check ids are in binary search tree order and priorities are not above those of the parents
+    :return: height of the treap
+    """
+    height = 0
+    pending = [(treap.root, -1, 2 ** 32, 1)] if treap.root is not None else []
+    while pending:
+        node, low, high, depth = pending.pop()
+        assert low < node.id < high
+        height = max(height, depth)
+        for child, child_low, child_high in ((node.left, low, node.id), (node.right, node.id, high)):
+            if child is not None:
+                assert child.priority <= node.priority
+                pending.append((child, child_low, child_high, depth + 1))
+    return height
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_treap_of_a_posting_list(seed):
+    rnd = random.Random(seed)
+    postings = sorted(random_postings(rnd, rnd.choice([10, 1000, 20000])).items())
+    treap = Treap.from_sorted(postings)
+    assert treap.height == check_nodes(treap)
+    assert treap.search_min_id() == postings[0][0]
+    assert treap.root.priority == max(tf for _, tf in postings)
+
+
+def test_insert_after_bulk_load():
+    treap = Treap.from_sorted([(2, 3), (5, 1), (9, 4)])
+    treap.insert((7, 8))
+    assert treap.root.id == 7 and treap.height == check_nodes(treap)
+
+
+def check_arrays(treap: ArrayTreap) -> int:
+    """
+    check_nodes on the columns of an array treap
+    :return: height of the treap
+    """
+    height = 0
+    pending = [(treap.root, -1, 2 ** 32, 1)] if treap.root != NIL else []
+    while pending:
+        node, low, high, depth = pending.pop()
+        assert low < treap.ids[node] < high
+        height = max(height, depth)
+        for child, child_low, child_high in ((treap.lefts[node], low, treap.ids[node]),
+                                             (treap.rights[node], treap.ids[node], high)):
+            if child != NIL:
+                assert treap.priorities[child] <= treap.priorities[node]
+                pending.append((child, child_low, child_high, depth + 1))
+    return height
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_array_treap_of_a_posting_list(seed):
+    rnd = random.Random(seed)
+    postings = sorted(random_postings(rnd, rnd.choice([10, 1000, 20000])).items())
+    array_treap = ArrayTreap.from_sorted(postings)
+    assert len(array_treap) == len(postings)
+    assert array_treap.height == check_arrays(array_treap)
+    assert array_treap.search_min_id() == postings[0][0]
+    treap = Treap.from_sorted(postings)
+    assert treap.height == array_treap.height and treap.root.id == array_treap.ids[array_treap.root]
+
+
+def test_chain_deeper_than_the_recursion_limit():
+    postings = [(doc, 1) for doc in range(1, 5002)]
+    treap = ArrayTreap.from_sorted(postings)
+    assert treap.height == 5001 and treap.get_height(treap.root) == 5001
+    treap.insert((6000, 1))
+    assert len(treap) == 5002 and check_arrays(treap) == treap.height
+    chain = Treap.from_sorted(postings)
+    assert chain.get_height(chain.root) == 5001
@@ -0,0 +1,86 @@
+# encoding: utf-8
+"""
+@author: Jiahao LU
+@contact: lujiahao8146@gmail.com
+@file: test_vectorial.py
+@time: 2020/5/7
+@desc: Vectorial scores from the idf and norms stored in the index, checked against the cosine of tf-idf vectors
+       computed from the documents, and the approximate scoring of champion lists.
+"""
+from collections import Counter
+from math import isclose, log10, sqrt
+import pytest
+from Project.InvertedIndex import InvertedIndex
+from Project.QueryModule import VectorialModule
+from tests.helpers import random_corpus, random_queries
+
+
+def brute_force_cosines(bag: dict, query: Counter) -> dict:
+    """
+    Cosine between the tf-idf vectors of the query and of every document sharing a term with it
+    :return: key: document id, value: cosine similarity
+    """
+    counts = {doc: Counter(terms) for doc, terms in bag.items()}
+    df = Counter(term for tfs in counts.values() for term in tfs)
+    idf = {term: log10(len(bag) / n) for term, n in df.items()}
+    query_vector = {term: tf * idf[term] for term, tf in query.items() if term in idf}
+    norm_q = sqrt(sum(w * w for w in query_vector.values()))
+    scores = dict()
+    for doc, tfs in counts.items():
+        if not any(term in tfs for term in query_vector):
+            continue
+        doc_vector = {term: tf * idf[term] for term, tf in tfs.items()}
+        norm = norm_q * sqrt(sum(w * w for w in doc_vector.values()))
+        dot = sum(w * doc_vector.get(term, 0.0) for term, w in query_vector.items())
+        scores[doc] = dot / norm if norm else 0.0
+    return scores
+
+
+@pytest.mark.parametrize('itype', ['freq', 'pos'])
+def test_scores_match_brute_force_cosine(itype):
+    doc_id, bag = random_corpus(400)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype=itype)
+    for query in random_queries(40):
+        scores = VectorialModule(' '.join(query.elements())).get_scores(ii)
+        reference = brute_force_cosines(bag, query)
+        assert scores.keys() == reference.keys()
+        assert all(isclose(scores[doc], reference[doc], abs_tol=1e-12) for doc in reference)
+
+
+def test_doc_index_is_rejected():
+    doc_id, bag = random_corpus(20)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype='doc')
+    with pytest.raises(ValueError):
+        VectorialModule('term0').get_scores(ii)
+
+
+def test_champion_tiers_scored_incrementally(index):
+    module = VectorialModule('term0 term3 term40 term41', approximate=True)
+    results = list(module.get_result(index, 5))
+    assert len(results) == 5 and not module.fallback
+    scores = module.get_scores(index, 1)
+    assert len(scores) >= 5
+    assert results == [index.get_doc_url(doc) for doc, _ in module.get_descending_scores(scores, 5)]
+
+
+def test_champion_lists_fall_back_to_nbest_answers(index):
+    module = VectorialModule('term0 term3 term40 term41', approximate=True)
+    nbest = index.D
+    results = list(module.get_result(index, nbest))
+    assert module.fallback
+    exact = VectorialModule('term0 term3 term40 term41')
+    assert results == list(exact.get_result(index, nbest))
+    assert len(results) == len(exact.get_scores(index)) > sum(len(tier) for term in ('term0', 'term3')
+                                                                for tier in index.get_champions(term))
+
+
+def test_complete_champion_lists_are_exact():
+    doc_id, bag = random_corpus(300)
+    ii = InvertedIndex()
+    ii.get_inverted_index(doc_id, bag, itype='freq')
+    module = VectorialModule('term3 term40', approximate=True)
+    results = list(module.get_result(ii, ii.D))
+    assert not module.fallback
+    assert results == list(VectorialModule('term3 term40').get_result(ii, ii.D))